@@ -0,0 +1,208 @@
+"""
+ASGI config for app project.
+
+It exposes the ASGI callable as a module-level variable named
+``application``, run it with an ASGI server, e.g.
+``uvicorn app.asgi:application``.
+
+Django 2.1 views are synchronous, so the server's event loop takes care
+of the connections, request bodies and streamed responses, and the views
+run in threads. Safe requests get a pool of their own, sized by
+ASGI_THREADS['READ'], so reads keep flowing while slow writes such as
+logins fill the ASGI_THREADS['WRITE'] pool.
+
+Request bodies are spooled to a temporary file past
+FILE_UPLOAD_MAX_MEMORY_SIZE, as django does with uploads. Response chunks
+are queued to the loop, which writes them to the client, so a thread only
+waits on a slow client once MAX_PENDING_CHUNKS are queued.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# response messages a thread may queue before it waits for the client
+MAX_PENDING_CHUNKS = 8
+
+
+def build_environ(scope, body):
+    """ return the WSGI environ of an ASGI http scope, reading the request
+    body from the file body """
+    # WSGI strings are bytes decoded as latin-1
+    path = scope['path'].encode('utf-8').decode('latin-1')
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': path,
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            # repeated headers are joined, as WSGI servers do
+            value = f'{environ[name]},{value}'
+        environ[name] = value
+    return environ
+
+
+class ThreadedWSGIApplication:
+    """ ASGI application running a WSGI application in thread pools """
+
+    def __init__(self, wsgi_application, read_threads, write_threads):
+        self.wsgi_application = wsgi_application
+        self.read_executor = ThreadPoolExecutor(
+            read_threads, thread_name_prefix='asgi-read',
+        )
+        self.write_executor = ThreadPoolExecutor(
+            write_threads, thread_name_prefix='asgi-write',
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'unsupported scope type {scope["type"]}')
+
+        body = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        )
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+
+            executor = self.read_executor \
+                if scope['method'] in SAFE_METHODS else self.write_executor
+            loop = asyncio.get_event_loop()
+            queue = asyncio.Queue()
+            credits = threading.BoundedSemaphore(MAX_PENDING_CHUNKS)
+            worker = loop.run_in_executor(
+                executor, self.run, loop, queue, credits,
+                build_environ(scope, body),
+            )
+            await self.send_queued(queue, credits, send)
+            await worker
+        finally:
+            body.close()
+
+    async def send_queued(self, queue, credits, send):
+        """ send the messages queued by run() until it is done """
+        error = None
+        while True:
+            message = await queue.get()
+            if message is None:
+                break
+            # once the client is gone the thread is still let finish
+            if error is None:
+                try:
+                    await send(message)
+                except Exception as exc:
+                    error = exc
+            credits.release()
+        if error is not None:
+            raise error
+
+    def run(self, loop, queue, credits, environ):
+        """ run the WSGI application, queueing its response to the loop """
+        def send_message(message):
+            credits.acquire()
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [{
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [
+                    (name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers
+                ],
+            }]
+
+        try:
+            result = self.wsgi_application(environ, start_response)
+            try:
+                for chunk in result:
+                    if started:
+                        send_message(started.pop())
+                    if chunk:
+                        send_message({'type': 'http.response.body',
+                                      'body': chunk, 'more_body': True})
+                if started:
+                    send_message(started.pop())
+                send_message({'type': 'http.response.body', 'body': b''})
+            finally:
+                # closing the response hands the database connection back
+                close = getattr(result, 'close', None)
+                if close is not None:
+                    close()
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_event_loop().run_in_executor(
+                    None, self.close,
+                )
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self):
+        """ finish the running requests and let go of what they held, so
+        recycled workers leave no connections or processes behind """
+        from core import hashers
+        from core.pool import close_pools
+
+        self.read_executor.shutdown()
+        self.write_executor.shutdown()
+        close_pools()
+        hashers.shutdown()
+
+
+def get_asgi_application():
+    wsgi_application = get_wsgi_application()
+    threads = getattr(settings, 'ASGI_THREADS', {})
+    return ThreadedWSGIApplication(
+        wsgi_application,
+        read_threads=threads.get('READ', 8),
+        write_threads=threads.get('WRITE', 2),
+    )
+
+
+application = get_asgi_application()
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'core',
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # answers /healthz and /readyz without the middleware below (core.health)
+    'core.health.HealthCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,20 +77,130 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'app.wsgi.application'
 
+# Threads app.asgi runs the views in, safe requests (GET, HEAD, OPTIONS)
+# have READ of their own so they aren't held up behind slow writes. Keep
+# them together under DB_POOL_MAX_SIZE or requests queue for connections.
+ASGI_THREADS = {
+    'READ': int(os.environ.get('ASGI_READ_THREADS', 8)),
+    'WRITE': int(os.environ.get('ASGI_WRITE_THREADS', 2)),
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
+# core.backends.postgresql borrows connections from a pool every process
+# keeps (core.pool), requests hand them back when they end. Set
+# DB_POOL_MAX_SIZE to 0 to open a connection per request instead, or raise
+# DB_CONN_MAX_AGE to keep one per thread between requests. Connecting to
+# an unreachable server fails after DB_CONNECT_TIMEOUT seconds. Every
+# DB_POOL_STATS_INTERVAL seconds a busy pool logs its wait times.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+        },
+        'POOL': {
+            'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'MAX_LIFETIME': int(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'CHECK_INTERVAL': 30,
+            'STATS_INTERVAL': int(
+                os.environ.get('DB_POOL_STATS_INTERVAL', 60)
+            ),
+        },
     }
 }
 
+# Caches. With MEMCACHED_LOCATION, one or more comma separated host:port,
+# the default cache is memcached, shared by every process of the server,
+# and the token, login throttle and response caches below all use it.
+# Without it each process keeps a local memory cache of its own.
+MEMCACHED_LOCATION = [
+    location.strip()
+    for location in os.environ.get('MEMCACHED_LOCATION', '').split(',')
+    if location.strip()
+]
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': MEMCACHED_LOCATION,
+            'KEY_PREFIX': 'app',
+        },
+    }
+    SHARED_CACHE_ALIAS = 'default'
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+    SHARED_CACHE_ALIAS = None
+# worker processes of the server, set by gunicorn.conf.py
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Read replicas of the default database, DB_REPLICA_HOSTS is a comma
+# separated list of their hosts. The recipe, tag, ingredient and user views
+# read from a random one unless the user wrote in the last
+# READ_YOUR_WRITES seconds (core.replicas). Writes are remembered in the
+# CACHE_ALIAS cache, which has to be shared when running several processes.
+DB_REPLICA_HOSTS = [
+    host.strip()
+    for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',')
+    if host.strip()
+]
+for number, host in enumerate(DB_REPLICA_HOSTS, 1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+DATABASE_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    'READ_YOUR_WRITES': int(os.environ.get('DB_READ_YOUR_WRITES', 5)),
+    'CACHE_ALIAS': 'default',
+}
+
+
+# Password hashers, the first hashes new passwords and the others check
+# older ones, which are stored again with the first on the next login.
+# PASSWORD_HASHER picks the first: argon2 (needs argon2-cffi), scrypt or
+# pbkdf2.
+_PREFERRED_HASHERS = {
+    'argon2': 'core.hashers.Argon2PasswordHasher',
+    'scrypt': 'core.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+_PREFERRED_HASHER = _PREFERRED_HASHERS[
+    os.environ.get('PASSWORD_HASHER', 'argon2')
+]
+PASSWORD_HASHERS = [
+    _PREFERRED_HASHER,
+    *(hasher for hasher in _PREFERRED_HASHERS.values()
+      if hasher != _PREFERRED_HASHER),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# Passwords are hashed in a pool of WORKERS processes (core.hashers), 0
+# hashes them on the request thread. Logins waiting behind more than
+# MAX_PENDING others, or for longer than TIMEOUT seconds, get a 503.
+PASSWORD_HASHING = {
+    'WORKERS': int(os.environ.get('PASSWORD_HASHING_WORKERS',
+                                  os.cpu_count() or 1)),
+    'MAX_PENDING': 32,
+    'TIMEOUT': 10,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -133,4 +246,99 @@ MEDIA_URL = '/media/'
 MEDIA_ROUTE = '/vol/web/media'
 STATIC_ROUTE = '/vol/web/static'
 
+# resized copies of uploaded recipe images, name -> (max width, max height)
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (150, 150),
+    'medium': (600, 600),
+}
+# size of the thread pool writing the variants after an upload, set
+# RECIPE_IMAGE_ASYNC to False to write them during the request instead
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_ASYNC = True
+
 AUTH_USER_MODEL = 'core.User'
+
+# NUM_PROXIES is how many trusted proxies in front of the app append the
+# client address to X-Forwarded-For. Throttles key on the address the last
+# of them saw, with 0 on the address of the connection, so clients can't
+# pick their own bucket by sending the header themselves.
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS':
+        'recipe.pagination.RecipeCursorPagination',
+    'PAGE_SIZE': 100,
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+# Serve list and detail reads from .values() rows (recipe.readers) rather
+# than through the DRF serializers, the output is the same
+RECIPE_API_FAST_READS = True
+
+# Cache of token -> user lookups used by CachedTokenAuthentication.
+# Without CACHE_ALIAS each process keeps its own LRU of MAX_SIZE entries,
+# and changes made through another process are only seen after TIMEOUT
+# seconds. Set CACHE_ALIAS to one of CACHES to share it between processes.
+TOKEN_AUTH_CACHE = {
+    'TIMEOUT': 60,
+    'MAX_SIZE': 10000,
+    'CACHE_ALIAS': os.environ.get('TOKEN_AUTH_CACHE_ALIAS',
+                                  SHARED_CACHE_ALIAS),
+}
+
+# Token bucket throttle of logins, RATE is (logins, seconds) for a client
+# address and for an email, refilled evenly over the seconds. Emails with no
+# account are rejected without a lookup for UNKNOWN_EMAIL_TIMEOUT seconds.
+# Both are kept per process, up to MAX_SIZE entries, unless CACHE_ALIAS
+# names one of CACHES to share them.
+LOGIN_THROTTLE = {
+    'IP_RATE': (20, 60),
+    'EMAIL_RATE': (5, 60),
+    'UNKNOWN_EMAIL_TIMEOUT': 30,
+    'MAX_SIZE': 100000,
+    'CACHE_ALIAS': os.environ.get('LOGIN_THROTTLE_CACHE_ALIAS',
+                                  SHARED_CACHE_ALIAS),
+}
+
+# Cache of the recipe, tag and ingredient read responses. ALIAS picks one
+# of CACHES. Responses are invalidated by a per user version bumped on every
+# change, TIMEOUT only bounds memory. A version bumped in a local memory
+# cache is only seen by its own process, so without a shared cache the
+# response cache is off when the server runs more than one process.
+RECIPE_API_CACHE = {
+    'ALIAS': os.environ.get('RECIPE_API_CACHE_ALIAS', 'default'),
+    'TIMEOUT': 300,
+    'ENABLED': SHARED_CACHE_ALIAS is not None or WEB_CONCURRENCY <= 1,
+}
+
+# Full-text search ranks at most MAX_CANDIDATES matches, the newest among
+# the RECENT_WINDOW newest recipes. Words too rare to fill a tenth of
+# MAX_CANDIDATES there are looked up in every recipe.
+RECIPE_SEARCH = {
+    'MAX_CANDIDATES': 500,
+    'RECENT_WINDOW': 20000,
+}
+
+# Typeahead of tag and ingredient names. Fuzzy matches need the pg_trgm
+# extension, prefix and fuzzy lookups each give up after TIMEOUT_MS. Every
+# process caches up to CACHE_SIZE recent answers.
+RECIPE_TYPEAHEAD = {
+    'MAX_RESULTS': 20,
+    'TIMEOUT_MS': 50,
+    'CACHE_SIZE': 10000,
+    'CACHE_TIMEOUT': 60,
+}
+
+# The pool stats and the failed readiness checks go to stderr, next to
+# the server's own logs
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': os.environ.get('CORE_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
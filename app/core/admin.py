@@ -1,3 +1,4 @@
+from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext as _
@@ -32,9 +33,30 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class CanonicalNameForm(forms.ModelForm):
+    """ edits the name of a tag or ingredient, which isn't a column """
+    name = forms.CharField(max_length=255)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is not None:
+            self.initial.setdefault('name', self.instance.name)
+
+    def save(self, commit=True):
+        self.instance.name = self.cleaned_data['name']
+        return super().save(commit)
+
+
+class CanonicalNameAdmin(admin.ModelAdmin):
+    form = CanonicalNameForm
+    fields = ('user', 'name')
+    list_display = ['name', 'user']
+
+
 # If we use the default admin class, we dont have to pass the second parameter
 # Here we modified the default adin class
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
+admin.site.register(models.Tag, CanonicalNameAdmin)
+admin.site.register(models.Ingredient, CanonicalNameAdmin)
 admin.site.register(models.Recipe)
+admin.site.register(models.Name)
@@ -0,0 +1,82 @@
+"""
+PostgreSQL backend borrowing its connections from core.pool.
+
+Pool settings go in the POOL entry of the database settings, with the
+keys and defaults of core.pool.POOL_DEFAULTS.
+"""
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+
+from core.pool import ConnectionPool, POOL_DEFAULTS, PoolTimeout, get_pool
+from core.backends.postgresql.creation import DatabaseCreation
+
+Database = base.Database
+
+
+def _is_usable(connection):
+    try:
+        connection.cursor().execute('SELECT 1')
+    except Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def pool_settings(self):
+        """ return the pool settings of the database, None without one """
+        # connections made for test database setup are short lived
+        if self.alias == NO_DB_ALIAS:
+            return None
+        settings = {**POOL_DEFAULTS, **self.settings_dict.get('POOL', {})}
+        return settings if settings['MAX_SIZE'] > 0 else None
+
+    def get_pool(self, conn_params):
+        """ return the pool of the process for the connection params """
+        settings = self.pool_settings()
+        if settings is None:
+            return None
+        # the test runner swaps the database name, that's another pool
+        key = (self.alias, tuple(sorted(
+            (name, str(value)) for name, value in conn_params.items()
+        )))
+        return get_pool(key, lambda: ConnectionPool(
+            lambda: Database.connect(**conn_params),
+            _is_usable,
+            min_size=settings['MIN_SIZE'],
+            max_size=settings['MAX_SIZE'],
+            max_lifetime=settings['MAX_LIFETIME'],
+            timeout=settings['TIMEOUT'],
+            check_interval=settings['CHECK_INTERVAL'],
+            stats_interval=settings['STATS_INTERVAL'],
+            name=self.alias,
+        ))
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            connection = pool.acquire()
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e)) from e
+        self._pool = pool
+
+        # as the parent does, the connection may come with another level
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        pool = getattr(self, '_pool', None)
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.release(self.connection)
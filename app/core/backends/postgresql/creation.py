@@ -0,0 +1,11 @@
+from django.db.backends.postgresql import creation
+
+from core.pool import close_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # pooled connections to the test database would block dropping it
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,235 @@
+"""
+Password hashing off the request threads.
+
+make_password and check_password work as the django.contrib.auth ones,
+but the hashing itself runs in a pool of PASSWORD_HASHING['WORKERS']
+processes. A login or signup then holds its thread only while it waits,
+and no more hashes run at once than there are workers, however many
+threads the server runs. Once MAX_PENDING more hashes are queued, new
+ones wait for a place and then get a 503, at most TIMEOUT seconds from
+the call whether the time went to queueing or hashing.
+
+The hasher of a password is picked in the calling process, so settings
+changed at runtime apply, the workers only get its dotted path.
+"""
+import base64
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.hashers import BasePasswordHasher, \
+    UNUSABLE_PASSWORD_PREFIX, UNUSABLE_PASSWORD_SUFFIX_LENGTH, \
+    get_hasher, identify_hasher, is_password_usable, mask_hash
+from django.utils.crypto import constant_time_compare, get_random_string
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_noop as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class ScryptPasswordHasher(BasePasswordHasher):
+    """ memory hard hasher on hashlib.scrypt, needs no extra library """
+    algorithm = 'scrypt'
+    # 16 MiB of memory per hash, the work_factor is scrypt's N
+    work_factor = 2 ** 14
+    block_size = 8
+    parallelism = 1
+    maxmem = 64 * 1024 * 1024
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        assert password is not None
+        assert salt and '$' not in salt
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        digest = hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+            maxmem=self.maxmem, dklen=64,
+        )
+        digest = base64.b64encode(digest).decode('ascii').strip()
+        return f'{self.algorithm}${n}${salt}${r}${p}${digest}'
+
+    def decode(self, encoded):
+        algorithm, n, salt, r, p, digest = encoded.split('$', 5)
+        assert algorithm == self.algorithm
+        return {
+            'n': int(n), 'r': int(r), 'p': int(p),
+            'salt': salt, 'hash': digest,
+        }
+
+    def verify(self, password, encoded):
+        params = self.decode(encoded)
+        encoded_2 = self.encode(
+            password, params['salt'], params['n'], params['r'], params['p'],
+        )
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        params = self.decode(encoded)
+        return {
+            _('algorithm'): self.algorithm,
+            _('work factor'): params['n'],
+            _('block size'): params['r'],
+            _('parallelism'): params['p'],
+            _('salt'): mask_hash(params['salt']),
+            _('hash'): mask_hash(params['hash']),
+        }
+
+    def must_update(self, encoded):
+        params = self.decode(encoded)
+        return (params['n'], params['r'], params['p']) != (
+            self.work_factor, self.block_size, self.parallelism,
+        )
+
+    def harden_runtime(self, password, encoded):
+        # the work factor is fixed per hash, there's no cheap way to pad
+        pass
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """ django's argon2 hasher with 19 MiB of memory per hash rather than
+    512 KiB, hashes made with less are stored again on login """
+    memory_cost = 19 * 1024
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins at once, try again shortly.'
+    default_code = 'hashing_busy'
+
+
+def hashing_settings():
+    options = getattr(settings, 'PASSWORD_HASHING', {})
+    return {
+        'WORKERS': options.get('WORKERS', os.cpu_count() or 1),
+        'MAX_PENDING': options.get('MAX_PENDING', 32),
+        'TIMEOUT': options.get('TIMEOUT', 10),
+    }
+
+
+# (pid, workers, executor, slots) of the pool of the process, if any
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """ return the executor and its slots, None when hashing in-thread """
+    global _pool
+    options = hashing_settings()
+    if options['WORKERS'] <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool[:2] != (os.getpid(), options['WORKERS']):
+            if _pool is not None and _pool[0] == os.getpid():
+                _pool[2].shutdown(wait=False)
+            # forking a threaded server could copy held locks, the fork
+            # server starts the workers from a clean single thread instead
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['core.hashers'])
+            _pool = (
+                os.getpid(),
+                options['WORKERS'],
+                ProcessPoolExecutor(options['WORKERS'], mp_context=context),
+                threading.BoundedSemaphore(
+                    options['WORKERS'] + options['MAX_PENDING'],
+                ),
+            )
+        return _pool[2:]
+
+
+def shutdown():
+    """ stop the hashing processes of this process, if it started any """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool[0] == os.getpid():
+            _pool[2].shutdown()
+        _pool = None
+
+
+def run(func, *args):
+    """ return func(*args) computed by a hashing process """
+    pool = _get_pool()
+    if pool is None:
+        return func(*args)
+    executor, slots = pool
+    timeout = hashing_settings()['TIMEOUT']
+    # waiting for a slot and for the hash share the one timeout
+    deadline = time.monotonic() + timeout
+    if not slots.acquire(timeout=timeout):
+        raise HashingBusy()
+    try:
+        future = executor.submit(func, *args)
+    except BrokenProcessPool:
+        slots.release()
+        shutdown()
+        return func(*args)
+    except BaseException:
+        slots.release()
+        raise
+    # the slot is held as long as the hash is queued or running, not just
+    # as long as someone waits for it
+    future.add_done_callback(lambda future: slots.release())
+    try:
+        return future.result(max(0, deadline - time.monotonic()))
+    except TimeoutError:
+        # drop the hash if no process took it yet, nobody wants it anymore
+        future.cancel()
+        raise HashingBusy()
+    except BrokenProcessPool:
+        # a worker died, e.g. killed for memory, start afresh next time
+        shutdown()
+        return func(*args)
+
+
+def _hasher_path(hasher):
+    return f'{type(hasher).__module__}.{type(hasher).__qualname__}'
+
+
+def _encode(hasher_path, password, salt):
+    return import_string(hasher_path)().encode(password, salt)
+
+
+def _verify(hasher_path, password, encoded):
+    return import_string(hasher_path)().verify(password, encoded)
+
+
+def _harden_runtime(hasher_path, password, encoded):
+    import_string(hasher_path)().harden_runtime(password, encoded)
+
+
+def make_password(password):
+    """ hash a password with the preferred hasher, off the thread """
+    if password is None:
+        return UNUSABLE_PASSWORD_PREFIX + \
+            get_random_string(UNUSABLE_PASSWORD_SUFFIX_LENGTH)
+    hasher = get_hasher()
+    return run(_encode, _hasher_path(hasher), password, hasher.salt())
+
+
+def check_password(password, encoded, setter=None):
+    """ return whether a password matches its hash, calling setter to
+    hash it again when it isn't stored the preferred way """
+    if password is None or not is_password_usable(encoded):
+        return False
+    preferred = get_hasher()
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+
+    hasher_changed = hasher.algorithm != preferred.algorithm
+    must_update = hasher_changed or preferred.must_update(encoded)
+    is_correct = run(_verify, _hasher_path(hasher), password, encoded)
+    # as django does, close the timing gap to the preferred work factor
+    if not is_correct and not hasher_changed and must_update:
+        run(_harden_runtime, _hasher_path(hasher), password, encoded)
+
+    if setter and is_correct and must_update:
+        setter(password)
+    return is_correct
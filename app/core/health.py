@@ -0,0 +1,85 @@
+"""
+Health endpoints for orchestrators and load balancers.
+
+/healthz answers 200 as long as the process serves requests at all, and
+/readyz only once every configured database runs a query and every cache
+gives back what was just put in it, 503 otherwise. Both are answered by
+HealthCheckMiddleware ahead of the rest of MIDDLEWARE, so probes need no
+credentials, session or allowed Host header, and touch nothing but what
+they check.
+"""
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PATH = '/healthz'
+READY_PATH = '/readyz'
+
+
+def check_database(alias):
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except Exception:
+        # don't hand a broken connection to the next request of the thread
+        connection.close()
+        raise
+
+
+def check_cache(alias):
+    cache = caches[alias]
+    key = f'readyz:{uuid.uuid4().hex}'
+    cache.set(key, True, 10)
+    try:
+        # some backends swallow errors, a miss tells they failed
+        if not cache.get(key):
+            raise RuntimeError('value not stored')
+    finally:
+        cache.delete(key)
+
+
+def readiness():
+    """ return the result of every check, by name, and whether all passed """
+    checks = [(f'database:{alias}', check_database, alias)
+              for alias in settings.DATABASES]
+    checks += [(f'cache:{alias}', check_cache, alias)
+               for alias in settings.CACHES]
+    results, ready = {}, True
+    for name, check, alias in checks:
+        try:
+            check(alias)
+            results[name] = 'ok'
+        except Exception:
+            # the details stay in the logs, the endpoints are public
+            logger.exception('readiness check %s failed', name)
+            results[name] = 'unavailable'
+            ready = False
+    return results, ready
+
+
+class HealthCheckMiddleware:
+    """ answer the health endpoints before any other middleware runs """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        path = request.path_info.rstrip('/')
+        if path == HEALTH_PATH:
+            return JsonResponse({'status': 'ok'})
+        if path == READY_PATH:
+            results, ready = readiness()
+            return JsonResponse(
+                {'status': 'ok' if ready else 'unavailable',
+                 'checks': results},
+                status=200 if ready else 503,
+            )
+        return self.get_response(request)
@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from core.models import Tag, Ingredient, Name, normalize_name
+
+BATCH_SIZE = 5000
+
+
+def has_legacy_names(cursor, table):
+    """ return whether the table still has the name column of before the
+    canonical names """
+    cursor.execute(
+        'SELECT 1 FROM information_schema.columns '
+        "WHERE table_name = %s AND column_name = 'legacy_name'",
+        [table],
+    )
+    return cursor.fetchone() is not None
+
+
+def move_legacy_names(table, batch_size=BATCH_SIZE, using='default',
+                      progress=None):
+    """ move the legacy names of a table to canonical names and display
+    overrides, one batch per transaction so locks are short and progress
+    survives failures """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if not has_legacy_names(cursor, table):
+            return 0
+    last_id, total = 0, 0
+    while True:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, legacy_name FROM {table} '
+                'WHERE legacy_name IS NOT NULL AND id > %s '
+                'ORDER BY id LIMIT %s',
+                [last_id, batch_size],
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return total
+            names = Name.objects.db_manager(using).intern(
+                name for _, name in rows
+            )
+            values = []
+            for pk, name in rows:
+                canonical_id, display = names[normalize_name(name)]
+                # most users spell a name the way it was first spelled
+                values += [pk, canonical_id, None if name == display else name]
+            cursor.execute(
+                f'UPDATE {table} SET canonical_id = v.canonical_id, '
+                'display_name = v.display_name, legacy_name = NULL '
+                f'FROM (VALUES {", ".join(["(%s, %s, %s)"] * len(rows))}) '
+                f'AS v (id, canonical_id, display_name) '
+                f'WHERE {table}.id = v.id',
+                values,
+            )
+        last_id = rows[-1][0]
+        total += len(rows)
+        if progress is not None:
+            progress(total)
+
+
+class Command(BaseCommand):
+    """ django command to move the names of existing tags and ingredients
+    to their canonical names """
+    help = ('Move the names of tags and ingredients to canonical names in '
+            'batches, ahead of the migration dropping the old column')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        for model in (Tag, Ingredient):
+            total = move_legacy_names(
+                model._meta.db_table,
+                options['batch_size'],
+                progress=lambda total: self.stdout.write(
+                    f'{model.__name__}: {total} rows'
+                ),
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'{model.__name__}: {total} rows backfilled'
+            ))
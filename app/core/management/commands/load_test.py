@@ -0,0 +1,106 @@
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(timings, fraction):
+    """ return the value below which fraction of the sorted timings are """
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+class Command(BaseCommand):
+    """ django command to load a running server with concurrent reads """
+    help = 'Send concurrent GET requests to a running server and report ' \
+           'throughput and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', nargs='+',
+                            help='urls to request, taken in turn')
+        parser.add_argument('--token', help='token to authenticate with')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='requests to send in total')
+
+    def get(self, connection, path, headers):
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response
+
+    def handle(self, *args, **options):
+        urls = [urlsplit(url) for url in options['url']]
+        if len({(url.scheme, url.netloc) for url in urls}) != 1:
+            raise CommandError('all urls must be on the same server')
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+
+        timings, errors, reconnects = [], [], []
+        remaining = iter(range(options['requests']))
+        lock = threading.Lock()
+
+        def client():
+            # one keep-alive connection per client, as browsers hold them
+            connection_class = http.client.HTTPSConnection \
+                if urls[0].scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(urls[0].netloc, timeout=30)
+            while True:
+                with lock:
+                    i = next(remaining, None)
+                if i is None:
+                    break
+                url = urls[i % len(urls)]
+                path = url.path + (f'?{url.query}' if url.query else '')
+                started = time.perf_counter()
+                try:
+                    try:
+                        response = self.get(connection, path, headers)
+                    except (http.client.RemoteDisconnected,
+                            ConnectionResetError, BrokenPipeError):
+                        # servers close idle keep-alive connections, e.g.
+                        # when recycling workers, clients then send again
+                        connection.close()
+                        reconnects.append(1)
+                        response = self.get(connection, path, headers)
+                except (OSError, http.client.HTTPException) as error:
+                    connection.close()
+                    with lock:
+                        errors.append(type(error).__name__)
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if response.status >= 400:
+                        errors.append(str(response.status))
+                    else:
+                        timings.append(elapsed)
+            connection.close()
+
+        threads = [threading.Thread(target=client)
+                   for _ in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if not timings:
+            raise CommandError(f'every request failed: {errors[:5]}')
+        timings.sort()
+        self.stdout.write(
+            f'{len(timings)} ok, {len(errors)} failed in {elapsed:.2f}s, '
+            f'{len(timings) / elapsed:.1f} requests/s'
+        )
+        self.stdout.write('latency ms: ' + ', '.join(
+            f'p{int(p * 100)} {percentile(timings, p) * 1000:.1f}'
+            for p in (0.5, 0.9, 0.99)
+        ) + f', max {timings[-1] * 1000:.1f}')
+        if reconnects:
+            self.stdout.write(f'{len(reconnects)} requests sent again on a '
+                              f'new connection')
+        if errors:
+            counts = {error: errors.count(error) for error in set(errors)}
+            self.stdout.write(self.style.WARNING(f'errors: {counts}'))
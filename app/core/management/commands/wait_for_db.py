@@ -1,24 +1,52 @@
+import random
 import time
 
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 # Django management commands are included in the docs (folder)
 
 
 class Command(BaseCommand):
     """ django command to pause execution until database is available """
 
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='seconds to give up after')
+        parser.add_argument('--max-delay', type=float, default=5,
+                            help='longest pause between attempts')
+
+    def probe(self, alias):
+        """ open a connection and run a query on it """
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+
     def handle(self, *args, **options):
         self.stdout.write('Waiting for database...')
-        db_conn = None
-        while not db_conn:
+        deadline = time.monotonic() + options['timeout']
+        attempt = 0
+        while True:
             try:
-                db_conn = connections['default']
-            except OperationalError:
-                 self.stdout.write('Database unavailable, waiting one second')
-                 time.sleep(1)
+                self.probe(options['database'])
+                break
+            except OperationalError as error:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'Database unavailable after {attempt + 1} '
+                        f'attempts: {error}'.strip()
+                    )
+                # doubling pauses, half of them random, so containers
+                # started together don't all retry at the same moments
+                delay = min(options['max_delay'], 0.1 * 2 ** attempt)
+                delay = min(remaining, random.uniform(delay / 2, delay))
+                self.stdout.write(
+                    f'Database unavailable, waiting {delay:.2f} seconds'
+                )
+                time.sleep(delay)
+                attempt += 1
 
         self.stdout.write(self.style.SUCCESS('DATABASE available!'))
         # the style is for showing string as green meaning to be successful.
-        
@@ -0,0 +1,43 @@
+# Generated by Django 2.1.15 on 2026-10-18 18:38
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# the vectors of existing recipes, recipe.search maintains them afterwards
+BACKFILL_SEARCH_VECTORS = """
+UPDATE core_recipe recipe SET search_vector =
+    setweight(to_tsvector('english', recipe.title), 'A')
+    || setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(tag.name, ' ')
+        FROM core_tag tag
+        JOIN core_recipe_tags link ON link.tag_id = tag.id
+        WHERE link.recipe_id = recipe.id
+    ), '')), 'B')
+    || setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM core_ingredient ingredient
+        JOIN core_recipe_ingredients link ON link.ingredient_id = ingredient.id
+        WHERE link.recipe_id = recipe.id
+    ), '')), 'C')
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_modified_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_recipe_search__c01407_gin'),
+        ),
+        migrations.RunSQL(BACKFILL_SEARCH_VECTORS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 2.1.15 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+def backfill_sql(table, through, column):
+    """ return the SQL counting the recipes of existing rows """
+    return f"""
+        UPDATE {table} SET recipe_count = counts.recipe_count,
+                           last_used = counts.last_used
+        FROM (
+            SELECT link.{column} AS id, count(*) AS recipe_count,
+                   max(recipe.modified) AS last_used
+            FROM {through} link
+            JOIN core_recipe recipe ON recipe.id = link.recipe_id
+            GROUP BY link.{column}
+        ) counts
+        WHERE {table}.id = counts.id
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_canonical_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='last_used',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='last_used',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'recipe_count'], name='core_ingred_user_id_de1121_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'recipe_count'], name='core_tag_user_id_699afc_idx'),
+        ),
+        migrations.RunSQL(
+            backfill_sql('core_tag', 'core_recipe_tags', 'tag_id'),
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            backfill_sql('core_ingredient', 'core_recipe_ingredients',
+                         'ingredient_id'),
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations
+
+TABLES = ('core_tag', 'core_ingredient')
+
+
+def _available(cursor, extension):
+    cursor.execute(
+        'SELECT 1 FROM pg_available_extensions WHERE name = %s', [extension]
+    )
+    return cursor.fetchone() is not None
+
+
+def scope_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        if not (_available(cursor, 'pg_trgm')
+                and _available(cursor, 'btree_gin')):
+            # the name only index of 0010, if any, stays
+            return
+        # btree_gin lets the user id be a key of the trigram index, so a
+        # lookup only collects the matches of the user asking
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+        for table in TABLES:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_user_name_trgm '
+                f'ON {table} USING gin (user_id, name gin_trgm_ops)'
+            )
+            cursor.execute(f'DROP INDEX IF EXISTS {table}_name_trgm')
+
+
+def unscope_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        if not _available(cursor, 'pg_trgm'):
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in TABLES:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_name_trgm '
+                f'ON {table} USING gin (name gin_trgm_ops)'
+            )
+            cursor.execute(f'DROP INDEX IF EXISTS {table}_user_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_recipe_range_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(scope_trigram_indexes, unscope_trigram_indexes),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.1.15 on 2026-10-18 20:28
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_user_scoped_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='ingredient',
+            name='modified',
+        ),
+        migrations.RemoveField(
+            model_name='tag',
+            name='modified',
+        ),
+    ]
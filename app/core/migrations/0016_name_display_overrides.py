@@ -0,0 +1,64 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Keeps the per-user names as legacy_name until 0017 moves them to the
+    canonical names. On large tables run the backfill_canonical_names
+    command between the two, `migrate core 0016` first, so the move
+    happens in short batches while the app is up
+    """
+
+    dependencies = [
+        ('core', '0015_drop_attr_modified'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='core_ingred_user_id_b96ee8_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='tag',
+            name='core_tag_user_id_74e398_idx',
+        ),
+        migrations.AddField(
+            model_name='name',
+            name='display',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(
+            'UPDATE core_name SET display = name', migrations.RunSQL.noop,
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='display_name',
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='display_name',
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.RenameField(
+            model_name='ingredient',
+            old_name='name',
+            new_name='legacy_name',
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='legacy_name',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.RenameField(
+            model_name='tag',
+            old_name='name',
+            new_name='legacy_name',
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='legacy_name',
+            field=models.CharField(max_length=255, null=True),
+        ),
+    ]
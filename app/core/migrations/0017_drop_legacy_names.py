@@ -0,0 +1,84 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+from core.management.commands.backfill_canonical_names import \
+    move_legacy_names
+
+TABLES = ('core_tag', 'core_ingredient')
+
+
+def move_names(apps, schema_editor):
+    # whatever backfill_canonical_names hasn't moved yet
+    for table in TABLES:
+        move_legacy_names(table, using=schema_editor.connection.alias)
+
+
+def restore_names(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(
+                f'UPDATE {table} SET legacy_name = '
+                f'coalesce({table}.display_name, core_name.display) '
+                f'FROM core_name WHERE core_name.id = {table}.canonical_id'
+            )
+
+
+def create_trigram_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if cursor.fetchone() is None:
+            # the typeahead only matches name prefixes without pg_trgm
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        # the trigram indexes of the dropped columns go with them
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS core_name_name_trgm '
+            'ON core_name USING gin (name gin_trgm_ops)'
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP INDEX IF EXISTS core_name_name_trgm')
+
+
+class Migration(migrations.Migration):
+    # the names are moved in batches of their own transactions
+    atomic = False
+
+    dependencies = [
+        ('core', '0016_name_display_overrides'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_names, restore_names),
+        migrations.RemoveField(
+            model_name='ingredient',
+            name='legacy_name',
+        ),
+        migrations.RemoveField(
+            model_name='tag',
+            name='legacy_name',
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='canonical',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='ingredients', to='core.Name'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='canonical',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='tags', to='core.Name'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'canonical'], name='core_ingred_user_id_38b4ec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'canonical'], name='core_tag_user_id_c27f93_idx'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
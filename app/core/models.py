@@ -1,11 +1,19 @@
 import uuid
 import os
-from django.db import models
+import unicodedata
+from django.db import connections, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.query import ModelIterable
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 """ extended line with backslash """
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from django.conf import settings  # recommanded way to retrieve django settings
 
+from core import hashers
+
 def recipe_image_file_path(instance, filename):
     """ generate file path for new recipe image """
     ext = filename.split('.')[-1]
@@ -49,26 +57,248 @@ class User(AbstractBaseUser, PermissionsMixin):
     objects = UserManager()  # remember to include () at the end
     USERNAME_FIELD = 'email'  # set this as a string
 
+    # passwords are hashed by the processes of core.hashers
+    def set_password(self, raw_password):
+        self.password = hashers.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """ return whether the password is right, storing it again with
+        the preferred hasher when it was hashed another way """
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # the password is the same, password_changed() needn't run
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return hashers.check_password(raw_password, self.password, setter)
+
+
+def normalize_name(name):
+    """ return the case folded form of a name that equal names share """
+    name = unicodedata.normalize('NFKC', name).casefold()
+    # casefold can make a name longer than the column
+    return ' '.join(name.split())[:255]
+
+
+class NameManager(models.Manager):
+
+    def intern(self, names):
+        """ return (id, display spelling) of the canonical names of names by
+        normalized name, creating the missing ones in the same query """
+        # a new canonical name is displayed the way it was first spelled
+        spellings = {}
+        for name in names:
+            spellings.setdefault(normalize_name(name), name)
+        if not spellings:
+            return {}
+        table = self.model._meta.db_table
+        # rows inserted by the statement are not visible to its own
+        # SELECT, so the new and existing ids never overlap
+        sql = f"""
+            WITH input AS (
+                SELECT * FROM unnest(%s::varchar[], %s::varchar[])
+                AS input (name, display)
+            ),
+            inserted AS (
+                INSERT INTO {table} (name, display)
+                SELECT name, display FROM input
+                ON CONFLICT (name) DO NOTHING
+                RETURNING id, name, display
+            )
+            SELECT id, name, display FROM inserted
+            UNION ALL
+            SELECT {table}.id, {table}.name, {table}.display FROM {table}
+            JOIN input ON input.name = {table}.name
+        """
+        names = {}
+        normalized = sorted(spellings)
+        for _ in range(2):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(sql, [
+                    normalized, [spellings[name] for name in normalized],
+                ])
+                names.update(
+                    (name, (pk, display))
+                    for pk, name, display in cursor.fetchall()
+                )
+            # names inserted by a concurrent transaction are only
+            # visible once it commits, try those again
+            normalized = [name for name in normalized if name not in names]
+            if not normalized:
+                break
+        return names
+
+
+class Name(models.Model):
+    """ canonical tag or ingredient name shared by all users """
+    # the normalized name, which equal names of all users share
+    name = models.CharField(max_length=255, unique=True)
+    # the spelling the name was first created with
+    display = models.CharField(max_length=255)
+
+    objects = NameManager()
+
+    def __str__(self):
+        return self.display
+
+
+class NamedIterable(ModelIterable):
+    """ yields tags or ingredients remembering the name they were loaded
+    with, so saving them only interns a changed name """
+
+    def __iter__(self):
+        for obj in super().__iter__():
+            # set by the name annotation of CanonicalNameManager
+            obj._saved_name = obj.__dict__.get('_name')
+            yield obj
+
+
+class CanonicalNameQuerySet(models.QuerySet):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._iterable_class = NamedIterable
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """ set the canonical names save() would, then insert the objects """
+        objs = list(objs)
+        unnamed = [obj for obj in objs if obj.canonical_id is None]
+        if unnamed:
+            self.model.set_canonical_names(unnamed)
+        return super().bulk_create(objs, *args, **kwargs)
+
 
-class Tag(models.Model):
+class CanonicalNameManager(models.Manager.from_queryset(
+        CanonicalNameQuerySet)):
+
+    def get_queryset(self):
+        """ annotate the name the user spelled, so it can be filtered,
+        ordered by and read with values() like a column """
+        # a subquery rather than a join, so updates and deletes of the
+        # queryset stay single table statements
+        display = Name.objects.filter(id=OuterRef('canonical_id')) \
+            .values('display')
+        return super().get_queryset().annotate(name=Coalesce(
+            'display_name', Subquery(display, output_field=models.CharField()),
+        ))
+
+
+class CanonicalNameMixin:
+    """
+    Tags and ingredients store their name as a canonical name, with the
+    user's spelling kept in display_name when it differs from the one of
+    the canonical name
+    """
+
+    @property
+    def name(self):
+        if '_name' not in self.__dict__:
+            self._name = self._stored_name()
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        self._name = value
+
+    def _stored_name(self):
+        """ return the name as saved, None for an object without one """
+        if self.display_name is not None:
+            return self.display_name
+        return self.canonical.display if self.canonical_id else None
+
+    @classmethod
+    def set_canonical_names(cls, objs):
+        """ point many objects to their canonical names with one query """
+        names = Name.objects.intern(obj.name for obj in objs)
+        for obj in objs:
+            normalized = normalize_name(obj.name)
+            pk, display = names[normalized]
+            obj.canonical = Name(id=pk, name=normalized, display=display)
+            obj.display_name = None if obj.name == display else obj.name
+
+    def save(self, *args, **kwargs):
+        name = self.__dict__.get('_name')
+        if name is not None:
+            saved = self.__dict__['_saved_name'] \
+                if '_saved_name' in self.__dict__ else self._stored_name()
+            # saves that don't rename, e.g. counter updates, skip the upsert
+            if self.canonical_id is None or name != saved:
+                self.set_canonical_names([self])
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {
+                *update_fields, 'canonical', 'display_name',
+            } - {'name'}
+        super().save(*args, **kwargs)
+        self._saved_name = name
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        # read the name again from the reloaded columns
+        self.__dict__.pop('_name', None)
+        self.__dict__.pop('_saved_name', None)
+
+
+class Tag(CanonicalNameMixin, models.Model):
     """ Tag to be used for a recipe """
-    name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    canonical = models.ForeignKey(
+        Name,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='tags',
+    )
+    # the user's spelling, only stored when it isn't canonical.display
+    display_name = models.CharField(max_length=255, null=True,
+                                    editable=False)
+    # kept up to date by recipe.counters as recipes link and unlink it
+    recipe_count = models.IntegerField(default=0)
+    last_used = models.DateTimeField(null=True)
+
+    objects = CanonicalNameManager()
+
+    class Meta:
+        indexes = [
+            # find the user's object of a canonical name
+            models.Index(fields=['user', 'canonical']),
+            models.Index(fields=['user', 'recipe_count']),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(CanonicalNameMixin, models.Model):
     """ ingredient to be used in a recipe """
-    name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    canonical = models.ForeignKey(
+        Name,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='ingredients',
+    )
+    # the user's spelling, only stored when it isn't canonical.display
+    display_name = models.CharField(max_length=255, null=True,
+                                    editable=False)
+    # kept up to date by recipe.counters as recipes link and unlink it
+    recipe_count = models.IntegerField(default=0)
+    last_used = models.DateTimeField(null=True)
+
+    objects = CanonicalNameManager()
+
+    class Meta:
+        indexes = [
+            # find the user's object of a canonical name
+            models.Index(fields=['user', 'canonical']),
+            models.Index(fields=['user', 'recipe_count']),
+        ]
 
     def __str__(self):
         return self.name
@@ -90,6 +320,20 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     # read the docs of ManyToManyField
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # resized copies of the image are written in the background
+    image_variants_ready = models.BooleanField(default=False)
+    modified = models.DateTimeField(auto_now=True)
+    # title, tag and ingredient names, maintained by recipe.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # serve the per-user orderings and ranges of the api
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'price']),
+            models.Index(fields=['user', 'time_minutes']),
+            GinIndex(fields=['search_vector']),
+        ]
 
     def __str__(self):
         return self.title
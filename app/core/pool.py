@@ -0,0 +1,295 @@
+"""
+In-process pool of database connections.
+
+Every process keeps one pool per database, shared by all of its threads.
+Django hands connections back to the pool where it would close them, so
+with CONN_MAX_AGE = 0 a request borrows a connection for its duration
+instead of opening a new one. The pool is configured by the POOL entry of
+a database in settings.DATABASES, see core.backends.postgresql.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+POOL_DEFAULTS = {
+    # connections opened on first use and kept open while idle
+    'MIN_SIZE': 0,
+    # connections open at once, 0 disables the pool
+    'MAX_SIZE': 10,
+    # seconds a connection is reused before it is replaced
+    'MAX_LIFETIME': 1800,
+    # seconds to wait for a free connection before giving up
+    'TIMEOUT': 10,
+    # seconds a connection may sit idle before it is checked on checkout
+    'CHECK_INTERVAL': 30,
+    # seconds between the stats a busy pool logs, 0 never logs them
+    'STATS_INTERVAL': 60,
+}
+# upper bounds in milliseconds of the wait time histogram buckets
+WAIT_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolTimeout(Exception):
+    """ raised when no connection frees up within the pool timeout """
+
+
+class ConnectionPool:
+    """ thread safe pool of DB-API connections made by connect() """
+
+    def __init__(self, connect, is_usable, min_size=0, max_size=10,
+                 max_lifetime=1800, timeout=10, check_interval=30,
+                 stats_interval=0, name='pool'):
+        self.connect = connect
+        self.is_usable = is_usable
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.stats_interval = stats_interval
+        self.name = name
+        self.closed = False
+        self._cond = threading.Condition()
+        # (connection, opened at, released at), the last released on top
+        self._idle = deque()
+        # id(connection) -> opened at
+        self._in_use = {}
+        # connections being opened count towards the size too
+        self._opening = 0
+        self._filled = False
+        self._counters = dict.fromkeys((
+            'acquired', 'waited', 'timeouts', 'opened', 'closed',
+            'failed_checks',
+        ), 0)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        self._stats_logged = time.monotonic()
+
+    @property
+    def size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def acquire(self):
+        """ return a connection, waiting up to timeout for a free one """
+        start = time.monotonic()
+        if not self._filled:
+            self._fill()
+        while True:
+            # the slot taken counts towards the size until it is settled
+            connection, opened, released = self._take(start + self.timeout)
+            if connection is None:
+                connection, opened = self._open(), time.monotonic()
+                break
+            if self._healthy(connection, opened, released):
+                break
+            self._close(connection)
+            self._free_slot()
+
+        with self._cond:
+            self._opening -= 1
+            self._in_use[id(connection)] = opened
+            now = time.monotonic()
+            self._record_wait(now - start)
+            log_stats = self.stats_interval and \
+                now - self._stats_logged >= self.stats_interval
+            if log_stats:
+                self._stats_logged = now
+        if log_stats:
+            # the pools are per process, so are the lines, pid included
+            logger.info('pool stats of %s in %s: %s',
+                        self.name, os.getpid(), self.stats())
+        return connection
+
+    def release(self, connection):
+        """ take back a connection, closing it if it can't be reused """
+        with self._cond:
+            opened = self._in_use.pop(id(connection), None)
+        if opened is None:
+            # not from this pool, e.g. opened before a fork
+            self._close(connection)
+            return
+        if (self.closed or connection.closed
+                or time.monotonic() - opened > self.max_lifetime
+                or not self._reset(connection)):
+            self._discard(connection)
+            return
+        with self._cond:
+            self._idle.append((connection, opened, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        """ close the idle connections, and the others once released """
+        with self._cond:
+            self.closed = True
+            idle, self._idle = self._idle, deque()
+            self._cond.notify_all()
+        for connection, opened, released in idle:
+            self._close(connection)
+
+    def stats(self):
+        """ return the pool counters and wait times in milliseconds """
+        with self._cond:
+            acquired = self._counters['acquired']
+            return {
+                **self._counters,
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'max_size': self.max_size,
+                'wait_total_ms': self._wait_total * 1000,
+                'wait_avg_ms':
+                    self._wait_total * 1000 / acquired if acquired else 0,
+                'wait_max_ms': self._wait_max * 1000,
+                'wait_buckets_ms': dict(zip(
+                    [*WAIT_BUCKETS, 'inf'], self._wait_buckets,
+                )),
+            }
+
+    def _fill(self):
+        """ open the first min_size connections """
+        with self._cond:
+            if self._filled:
+                return
+            self._filled = True
+            missing = self.min_size - self.size
+            self._opening += missing
+        for _ in range(missing):
+            try:
+                connection = self.connect()
+            except Exception:
+                with self._cond:
+                    self._opening -= 1
+                logger.exception('could not open a pooled connection')
+                continue
+            with self._cond:
+                self._opening -= 1
+                self._counters['opened'] += 1
+                now = time.monotonic()
+                self._idle.append((connection, now, now))
+                self._cond.notify()
+
+    def _take(self, deadline):
+        """ take a slot and return the idle connection in it, if any,
+        waiting until the deadline for a slot to free up """
+        with self._cond:
+            while True:
+                if self.closed:
+                    raise PoolTimeout('the connection pool is closed')
+                if self._idle:
+                    self._opening += 1
+                    return self._idle.pop()
+                if self.size < self.max_size:
+                    self._opening += 1
+                    return None, None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    logger.warning(
+                        'no pooled connection freed up in %ss, %s in use',
+                        self.timeout, len(self._in_use),
+                    )
+                    raise PoolTimeout(
+                        f'no connection available within {self.timeout}s'
+                    )
+                self._cond.wait(remaining)
+
+    def _open(self):
+        try:
+            connection = self.connect()
+        except Exception:
+            self._free_slot()
+            raise
+        with self._cond:
+            self._counters['opened'] += 1
+        return connection
+
+    def _free_slot(self):
+        with self._cond:
+            self._opening -= 1
+            self._cond.notify()
+
+    def _healthy(self, connection, opened, released):
+        """ return whether an idle connection can be handed out """
+        now = time.monotonic()
+        if connection.closed or now - opened > self.max_lifetime:
+            return False
+        if now - released > self.check_interval \
+                and not self.is_usable(connection):
+            with self._cond:
+                self._counters['failed_checks'] += 1
+            return False
+        return True
+
+    def _reset(self, connection):
+        """ end any transaction left open, return whether that worked """
+        try:
+            connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, connection):
+        """ close a connection taken out of the pool """
+        self._close(connection)
+        with self._cond:
+            self._in_use.pop(id(connection), None)
+            self._cond.notify()
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._counters['closed'] += 1
+
+    def _record_wait(self, waited):
+        self._counters['acquired'] += 1
+        if waited > 0.001:
+            self._counters['waited'] += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        self._wait_buckets[bisect.bisect_left(WAIT_BUCKETS, waited * 1000)] \
+            += 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pid = os.getpid()
+# connections inherited over a fork belong to the parent, closing them in
+# the child would end the parent's sessions, so they're only kept around
+_inherited = []
+
+
+def get_pool(key, factory):
+    """ return the pool stored under key, made by factory() if missing """
+    global _pid
+    with _pools_lock:
+        if os.getpid() != _pid:
+            # a forked worker starts with pools of its own
+            _pid = os.getpid()
+            for pool in _pools.values():
+                _inherited.extend(item[0] for item in pool._idle)
+            _pools.clear()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = factory()
+        return pool
+
+
+def close_pools():
+    """ close the connections of every pool of the process """
+    with _pools_lock:
+        pools = list(_pools.items())
+        _pools.clear()
+    for (alias, params), pool in pools:
+        # what the process saw of the pool, e.g. as a worker recycles
+        logger.info('closing pool of %s in %s: %s',
+                    alias, os.getpid(), pool.stats())
+        pool.close()
@@ -0,0 +1,110 @@
+"""
+Read replica routing.
+
+Views using ReplicaReadsMixin send the queries of their safe requests to
+one of the replicas in settings.DATABASE_REPLICAS, through ReplicaRouter.
+A user who wrote through one of them reads from the primary for the next
+READ_YOUR_WRITES seconds, which should exceed the replication lag, so they
+never see their data older than they left it. The last writes are kept in
+a cache, share it between processes when running more than one.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+
+WRITE_KEY = 'replicas:write:{}'
+
+# the database the reads of the running request go to, None for default
+_read_database = ContextVar('read_database', default=None)
+
+
+def replica_settings():
+    options = getattr(settings, 'DATABASE_REPLICAS', {})
+    return {
+        'ALIASES': options.get('ALIASES', []),
+        'READ_YOUR_WRITES': options.get('READ_YOUR_WRITES', 5),
+        'CACHE_ALIAS': options.get('CACHE_ALIAS', 'default'),
+    }
+
+
+def _writes_cache():
+    return caches[replica_settings()['CACHE_ALIAS']]
+
+
+def mark_write(user_id):
+    """ pin the reads of a user to the primary for a while """
+    _writes_cache().set(
+        WRITE_KEY.format(user_id), True,
+        replica_settings()['READ_YOUR_WRITES'],
+    )
+
+
+def wrote_recently(user_id):
+    return _writes_cache().get(WRITE_KEY.format(user_id), False)
+
+
+def choose_read_database(user):
+    """ return the replica a user's reads may go to, None for primary """
+    aliases = replica_settings()['ALIASES']
+    if not aliases or (user.is_authenticated and wrote_recently(user.id)):
+        return None
+    return random.choice(aliases)
+
+
+def set_read_database(alias):
+    """ send the reads of the current thread or task to alias, returns
+    the token reset_read_database takes to undo it """
+    return _read_database.set(alias)
+
+
+def reset_read_database(token):
+    _read_database.reset(token)
+
+
+class ReplicaRouter:
+    """ routes reads to the database set for the running request """
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in replica_settings()['ALIASES']:
+            return False
+        return None
+
+
+class ReplicaReadsMixin:
+    """
+    View mixin reading from a replica on safe requests, and marking the
+    user as having written on the others
+    """
+    # the replica the request reads from, None for the primary
+    read_database = None
+    _read_token = None
+
+    def initial(self, request, *args, **kwargs):
+        # authentication itself reads from the primary
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            self.read_database = choose_read_database(request.user)
+            if self.read_database is not None:
+                self._read_token = set_read_database(self.read_database)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._read_token is not None:
+            reset_read_database(self._read_token)
+            self._read_token = None
+        elif request.method not in SAFE_METHODS \
+                and request.user.is_authenticated:
+            mark_write(request.user.id)
+        return super().finalize_response(request, response, *args, **kwargs)
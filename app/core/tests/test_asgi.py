@@ -0,0 +1,213 @@
+import asyncio
+import json
+import threading
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from app.asgi import MAX_PENDING_CHUNKS, ThreadedWSGIApplication, \
+    application
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def echo(environ, start_response):
+    """ WSGI application answering with what it was asked and where """
+    body = environ['wsgi.input'].read()
+    start_response('201 Created', [('Content-Type', 'application/json'),
+                                   ('X-Thread', threading.current_thread()
+                                    .name)])
+    yield json.dumps({
+        'method': environ['REQUEST_METHOD'],
+        'path': environ['PATH_INFO'],
+        'query': environ['QUERY_STRING'],
+        'accept': environ.get('HTTP_ACCEPT'),
+        'content_type': environ.get('CONTENT_TYPE'),
+        'body': body.decode(),
+    }).encode()
+    yield b''
+    yield b'\n'
+
+
+def call(app, method='GET', path='/', query=b'', headers=(), body=b'',
+         client=None):
+    """ return the status, headers and body app sends for a request,
+    awaiting client(), if any, before each message is taken """
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'query_string': query,
+        'root_path': '',
+        'headers': list(headers),
+        'client': ('10.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    # the body arrives in two messages, as servers may split it
+    messages = [
+        {'type': 'http.request', 'body': body[:1], 'more_body': True},
+        {'type': 'http.request', 'body': body[1:], 'more_body': False},
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        if client is not None:
+            await client()
+        sent.append(message)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(app(scope, receive, send))
+    finally:
+        loop.close()
+
+    start = sent.pop(0)
+    assert start['type'] == 'http.response.start'
+    assert not sent[-1].get('more_body')
+    return start['status'], dict(start['headers']), \
+        b''.join(message['body'] for message in sent)
+
+
+class ThreadedWSGIApplicationTests(SimpleTestCase):
+
+    def setUp(self):
+        self.app = ThreadedWSGIApplication(echo, read_threads=2,
+                                           write_threads=1)
+
+    def tearDown(self):
+        self.app.read_executor.shutdown()
+        self.app.write_executor.shutdown()
+
+    def adapt(self, wsgi_application):
+        """ return the ASGI application of another WSGI application """
+        app = ThreadedWSGIApplication(wsgi_application, 1, 1)
+        self.addCleanup(app.write_executor.shutdown)
+        self.addCleanup(app.read_executor.shutdown)
+        return app
+
+    def test_request_translated(self):
+        """ test the request reaches the WSGI application whole """
+        status, headers, body = call(
+            self.app, 'POST', '/api/café/', b'q=1',
+            headers=[(b'content-type', b'application/json'),
+                     (b'accept', b'text/html'), (b'accept', b'*/*')],
+            body=b'{"a": 1}',
+        )
+
+        self.assertEqual(status, 201)
+        self.assertEqual(headers[b'content-type'], b'application/json')
+        self.assertEqual(json.loads(body.decode()), {
+            'method': 'POST',
+            'path': '/api/cafÃ©/',
+            'query': 'q=1',
+            'accept': 'text/html,*/*',
+            'content_type': 'application/json',
+            'body': '{"a": 1}',
+        })
+
+    def test_reads_and_writes_apart(self):
+        """ test safe requests run in the read pool, others in the write
+        pool """
+        _, read, _ = call(self.app, 'GET')
+        _, write, _ = call(self.app, 'DELETE')
+
+        self.assertTrue(read[b'x-thread'].startswith(b'asgi-read'))
+        self.assertTrue(write[b'x-thread'].startswith(b'asgi-write'))
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=4)
+    def test_large_body_spooled(self):
+        """ test bodies past the upload memory size are read from disk """
+        spooled = []
+
+        def app(environ, start_response):
+            stream = environ['wsgi.input']
+            spooled.append(stream._rolled)
+            start_response('200 OK', [])
+            return [stream.read()]
+
+        _, _, body = call(self.adapt(app), 'POST',
+                          body=b'x' * 100)
+
+        self.assertEqual(spooled, [True])
+        self.assertEqual(body, b'x' * 100)
+
+    def test_response_queued(self):
+        """ test the thread queues chunks without waiting for the client,
+        up to MAX_PENDING_CHUNKS """
+        produced, taken = [], []
+
+        def app(environ, start_response):
+            start_response('200 OK', [])
+            for i in range(50):
+                produced.append(i)
+                yield b'x'
+
+        async def client():
+            # a slow client lets the thread run ahead, but not far
+            await asyncio.sleep(0.001)
+            taken.append(len(produced) - len(taken))
+
+        _, _, body = call(self.adapt(app), client=client)
+
+        self.assertEqual(body, b'x' * 50)
+        self.assertGreater(max(taken), 1)
+        self.assertLessEqual(max(taken), MAX_PENDING_CHUNKS + 1)
+
+    def test_client_gone(self):
+        """ test the response is still closed when the client goes away """
+        closed = []
+
+        def app(environ, start_response):
+            start_response('200 OK', [])
+            try:
+                for _ in range(50):
+                    yield b'x'
+            finally:
+                closed.append(True)
+
+        async def client():
+            raise OSError('connection reset')
+
+        with self.assertRaises(OSError):
+            call(self.adapt(app), client=client)
+        self.assertEqual(closed, [True])
+
+    @patch('core.hashers.shutdown')
+    @patch('core.pool.close_pools')
+    def test_lifespan(self, close_pools, shutdown):
+        """ test the thread pools, database connections and hashing
+        processes are let go of on shutdown """
+        messages = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(self.app({'type': 'lifespan'}, receive, send))
+        loop.close()
+
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
+        with self.assertRaises(RuntimeError):
+            self.app.read_executor.submit(print)
+        close_pools.assert_called_once_with()
+        shutdown.assert_called_once_with()
+
+    def test_django_application(self):
+        """ test the project application answers through the adapter """
+        status, headers, body = call(application, 'GET', RECIPES_URL)
+
+        self.assertEqual(status, 401)
+        self.assertIn('credentials', json.loads(body.decode())['detail'])
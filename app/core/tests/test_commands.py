@@ -1,23 +1,95 @@
+from io import StringIO
 from unittest.mock import patch
 
-from django.core.management import call_command
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
 from django.db.utils import OperationalError
 from django.test import TestCase
 
+from core.models import Tag, Ingredient, Name
+
+
+PROBE = 'core.management.commands.wait_for_db.Command.probe'
+
 
 class CommandTests(TestCase):
 
     def test_wait_for_db_ready(self):
         """ tests waiting for db when db is availabe"""
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 1)  # please read the mock docs
+        with patch(PROBE) as probe:
+            call_command('wait_for_db', stdout=StringIO())
+            self.assertEqual(probe.call_count, 1)
+
+    def test_wait_for_db_queries(self):
+        """ tests the database is really connected to and queried """
+        out = StringIO()
+        call_command('wait_for_db', stdout=out)
+        self.assertIn('DATABASE available!', out.getvalue())
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
-        """ tests waiting for db """
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError]*5 + [True]
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+        """ tests waiting for db with growing, jittered pauses """
+        with patch(PROBE) as probe:
+            probe.side_effect = [OperationalError]*8 + [None]
+            call_command('wait_for_db', max_delay=5, stdout=StringIO())
+            self.assertEqual(probe.call_count, 9)
+
+        delays = [call[0][0] for call in ts.call_args_list]
+        self.assertEqual(len(delays), 8)
+        for attempt, delay in enumerate(delays):
+            bound = min(5, 0.1 * 2 ** attempt)
+            self.assertTrue(bound / 2 <= delay <= bound)
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_timeout(self, ts):
+        """ tests giving up on the db after the timeout """
+        with patch(PROBE) as probe:
+            probe.side_effect = OperationalError('connection refused')
+            with self.assertRaisesMessage(CommandError, 'connection refused'):
+                call_command('wait_for_db', timeout=0, stdout=StringIO())
+            self.assertEqual(probe.call_count, 1)
+
+    def test_backfill_canonical_names(self):
+        """ tests moving the names of before the canonical names in batches,
+        and the migration moving whatever is left """
+        legacy = [('core', '0016_name_display_overrides')]
+        executor = MigrationExecutor(connection)
+        latest = executor.loader.graph.leaf_nodes()
+        executor.migrate(legacy)
+        apps = executor.loader.project_state(legacy).apps
+        user = apps.get_model('core', 'User').objects.create(
+            email='test@eniac.com',
+        )
+        OldTag = apps.get_model('core', 'Tag')
+        OldIngredient = apps.get_model('core', 'Ingredient')
+        OldTag.objects.bulk_create(
+            OldTag(user=user, legacy_name=name)
+            for name in ['Vegan', 'VEGAN', 'Keto']
+        )
+        OldIngredient.objects.create(user=user, legacy_name='vegan')
+
+        call_command('backfill_canonical_names', batch_size=2,
+                     stdout=StringIO())
+        # written after the backfill, before the migration
+        OldTag.objects.create(user=user, legacy_name='Paleo')
+        with connection.cursor() as cursor:
+            # the migration alters tables with rows inserted above
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        MigrationExecutor(connection).migrate(latest)
+
+        self.assertEqual(
+            list(Tag.objects.order_by('id').values_list('name', flat=True)),
+            ['Vegan', 'VEGAN', 'Keto', 'Paleo'],
+        )
+        self.assertEqual(
+            list(Tag.objects.exclude(display_name=None).values_list(
+                'display_name', flat=True,
+            )),
+            ['VEGAN'],
+        )
+        self.assertEqual(Ingredient.objects.get().name, 'vegan')
+        vegan = Name.objects.get(name='vegan')
+        self.assertEqual(vegan.display, 'Vegan')
+        self.assertEqual(vegan.tags.count(), 2)
+        self.assertEqual(vegan.ingredients.count(), 1)
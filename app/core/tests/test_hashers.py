@@ -0,0 +1,165 @@
+import threading
+import time
+from concurrent.futures import Future
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password as django_make_password
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import hashers
+
+TOKEN_URL = reverse('user:token')
+CREATE_USER_URL = reverse('user:create')
+
+SCRYPT = 'core.hashers.ScryptPasswordHasher'
+PBKDF2 = 'django.contrib.auth.hashers.PBKDF2PasswordHasher'
+
+
+class ScryptPasswordHasherTests(TestCase):
+
+    def test_encode_and_verify(self):
+        """ test scrypt hashes verify the right password only """
+        hasher = hashers.ScryptPasswordHasher()
+        encoded = hasher.encode('secret', 'seasalt')
+
+        self.assertTrue(encoded.startswith('scrypt$16384$seasalt$8$1$'))
+        self.assertTrue(hasher.verify('secret', encoded))
+        self.assertFalse(hasher.verify('Secret', encoded))
+        self.assertFalse(hasher.must_update(encoded))
+        self.assertEqual(hasher.safe_summary(encoded)['work factor'], 16384)
+
+    def test_must_update_weaker_hashes(self):
+        """ test hashes with other parameters are stored again """
+        hasher = hashers.ScryptPasswordHasher()
+        encoded = hasher.encode('secret', 'seasalt', n=2 ** 10)
+
+        self.assertTrue(hasher.verify('secret', encoded))
+        self.assertTrue(hasher.must_update(encoded))
+
+
+@override_settings(PASSWORD_HASHERS=[SCRYPT, PBKDF2])
+class HashingPoolTests(TestCase):
+
+    def tearDown(self):
+        hashers.shutdown()
+
+    def test_hash_in_processes(self):
+        """ test passwords hashed by the worker processes check out """
+        with self.settings(PASSWORD_HASHING={'WORKERS': 1}):
+            encoded = hashers.make_password('secret')
+
+            self.assertTrue(encoded.startswith('scrypt$'))
+            self.assertTrue(hashers.check_password('secret', encoded))
+            self.assertFalse(hashers.check_password('wrong', encoded))
+            self.assertIsNotNone(hashers._pool)
+
+    def test_hash_in_thread(self):
+        """ test no processes are started without workers """
+        with self.settings(PASSWORD_HASHING={'WORKERS': 0}):
+            encoded = hashers.make_password('secret')
+
+            self.assertTrue(hashers.check_password('secret', encoded))
+            self.assertIsNone(hashers._pool)
+
+    def test_busy(self):
+        """ test hashes over the limit are turned away with a 503 """
+        get_user_model().objects.create_user('test@eniac.com', 'testpass')
+        busy = {'WORKERS': 1, 'MAX_PENDING': 0, 'TIMEOUT': 0.01}
+        with self.settings(PASSWORD_HASHING=busy):
+            executor, slots = hashers._get_pool()
+            slots.acquire()
+            try:
+                with self.assertRaises(hashers.HashingBusy):
+                    hashers.make_password('secret')
+                res = APIClient().post(TOKEN_URL, {
+                    'email': 'test@eniac.com',
+                    'password': 'testpass',
+                })
+            finally:
+                slots.release()
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_rehash_on_login(self):
+        """ test logging in stores a password again with the first hasher """
+        user = get_user_model().objects.create_user('test@eniac.com')
+        user.password = django_make_password(
+            'testpass', hasher='pbkdf2_sha256',
+        )
+        user.save()
+
+        res = APIClient().post(TOKEN_URL, {
+            'email': 'test@eniac.com',
+            'password': 'testpass',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$'))
+        self.assertTrue(user.check_password('testpass'))
+
+    def test_signup_hashed(self):
+        """ test signing up hashes with the first hasher """
+        res = APIClient().post(CREATE_USER_URL, {
+            'email': 'test@eniac.com',
+            'password': 'testpass',
+            'name': 'Test',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        user = get_user_model().objects.get(email='test@eniac.com')
+        self.assertTrue(user.password.startswith('scrypt$'))
+
+    def test_timeout_cancels_queued_hash(self):
+        """ test a hash still queued at the timeout is dropped """
+        future = Future()
+        slots = threading.BoundedSemaphore(1)
+        executor = MagicMock(**{'submit.return_value': future})
+        busy = {'WORKERS': 1, 'MAX_PENDING': 0, 'TIMEOUT': 0.01}
+        with self.settings(PASSWORD_HASHING=busy), \
+                patch('core.hashers._get_pool',
+                      return_value=(executor, slots)):
+            with self.assertRaises(hashers.HashingBusy):
+                hashers.make_password('secret')
+
+        self.assertTrue(future.cancelled())
+        self.assertTrue(slots.acquire(blocking=False))
+
+    def test_running_hash_keeps_slot(self):
+        """ test a hash running past the timeout holds its slot until done """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        slots = threading.BoundedSemaphore(1)
+        executor = MagicMock(**{'submit.return_value': future})
+        busy = {'WORKERS': 1, 'MAX_PENDING': 0, 'TIMEOUT': 0.01}
+        with self.settings(PASSWORD_HASHING=busy), \
+                patch('core.hashers._get_pool',
+                      return_value=(executor, slots)):
+            with self.assertRaises(hashers.HashingBusy):
+                hashers.make_password('secret')
+
+            self.assertFalse(slots.acquire(blocking=False))
+            future.set_result('hash')
+            self.assertTrue(slots.acquire(blocking=False))
+
+    def test_one_timeout_for_slot_and_hash(self):
+        """ test the time spent waiting for a slot counts to the timeout """
+        slots = threading.BoundedSemaphore(1)
+        executor = MagicMock(**{'submit.return_value': Future()})
+        busy = {'WORKERS': 1, 'MAX_PENDING': 0, 'TIMEOUT': 0.5}
+        slots.acquire()
+        threading.Timer(0.4, slots.release).start()
+        start = time.monotonic()
+        with self.settings(PASSWORD_HASHING=busy), \
+                patch('core.hashers._get_pool',
+                      return_value=(executor, slots)):
+            with self.assertRaises(hashers.HashingBusy):
+                hashers.make_password('secret')
+
+        # the slot wait and the hash wait each took the whole 0.5s before
+        self.assertLess(time.monotonic() - start, 0.75)
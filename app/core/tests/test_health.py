@@ -0,0 +1,57 @@
+from unittest.mock import patch
+
+from django.db.utils import OperationalError
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+
+
+@override_settings(ALLOWED_HOSTS=['api.eniac.com'])
+class HealthEndpointTests(TestCase):
+    """ Test the health endpoints """
+
+    def test_healthz(self):
+        """ test the liveness endpoint answers without touching anything """
+        with self.assertNumQueries(0):
+            res = self.client.get('/healthz', HTTP_HOST='10.0.0.7')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {'status': 'ok'})
+        self.assertNotIn('sessionid', res.cookies)
+
+    def test_readyz(self):
+        """ test the readiness endpoint checks the database and cache """
+        with self.assertNumQueries(1):
+            res = self.client.get('/readyz/', HTTP_HOST='10.0.0.7')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {
+            'status': 'ok',
+            'checks': {'database:default': 'ok', 'cache:default': 'ok'},
+        })
+
+    def test_readyz_database_down(self):
+        """ test the readiness endpoint fails without the database """
+        with patch('core.health.check_database',
+                   side_effect=OperationalError('could not connect')), \
+                self.assertLogs('core.health', 'ERROR'):
+            res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res.json()['checks'], {
+            'database:default': 'unavailable',
+            'cache:default': 'ok',
+        })
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }})
+    def test_readyz_cache_not_storing(self):
+        """ test the readiness endpoint fails when the cache stores nothing """
+        with self.assertLogs('core.health', 'ERROR'):
+            res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res.json()['checks']['cache:default'], 'unavailable')
@@ -1,4 +1,6 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from unittest.mock import patch
 from core import models
@@ -89,3 +91,89 @@ class ModelTests(TestCase):
 
         exp_path = f'uploads/recipe/{uuid}.jpg'
         self.assertEqual(file_path, exp_path)
+
+    def test_equal_names_share_canonical_name(self):
+        """ test tags of different users with equal names are interned """
+        tag1 = models.Tag.objects.create(user=sample_user(), name='Salt ')
+        tag2 = models.Tag.objects.create(
+            user=sample_user('other@eniac.com'),
+            name='SALT',
+        )
+        ingredient = models.Ingredient.objects.create(
+            user=tag1.user,
+            name='salt',
+        )
+
+        self.assertEqual(tag1.canonical_id, tag2.canonical_id)
+        self.assertEqual(ingredient.canonical_id, tag1.canonical_id)
+        self.assertEqual(tag1.canonical.name, 'salt')
+        self.assertEqual(models.Name.objects.count(), 1)
+
+    def test_rename_changes_canonical_name(self):
+        """ test renaming an ingredient points it to the new name """
+        ingredient = models.Ingredient.objects.create(
+            user=sample_user(),
+            name='Cucumber',
+        )
+        ingredient.name = 'Straße'
+        ingredient.save()
+
+        self.assertEqual(ingredient.canonical.name, 'strasse')
+
+    def test_save_without_rename_skips_interning(self):
+        """ test saving a tag under the same name doesn't touch names """
+        tag = models.Tag.objects.create(user=sample_user(), name='Salt')
+        tag = models.Tag.objects.get(id=tag.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            tag.save()
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'INSERT INTO core_name' in query['sql']])
+        tag.name = 'Pepper'
+        tag.save(update_fields=['name'])
+
+        tag.refresh_from_db()
+        self.assertEqual(tag.canonical.name, 'pepper')
+
+    def test_intern_names(self):
+        """ test interning many names creates each one once """
+        existing = models.Name.objects.create(name='salt', display='Salt')
+
+        names = models.Name.objects.intern(['SALT', 'Pepper', 'pepper '])
+
+        self.assertEqual(names, {
+            'salt': (existing.id, 'Salt'),
+            'pepper': (names['pepper'][0], 'Pepper'),
+        })
+        self.assertEqual(models.Name.objects.count(), 2)
+
+    def test_name_spelling_kept(self):
+        """ test a user's spelling is only stored when it isn't the one
+        of the canonical name """
+        tag1 = models.Tag.objects.create(user=sample_user(), name='Salt')
+        tag2 = models.Tag.objects.create(
+            user=sample_user('other@eniac.com'),
+            name='SALT',
+        )
+
+        self.assertIsNone(tag1.display_name)
+        self.assertEqual(tag2.display_name, 'SALT')
+        self.assertEqual(tag1.canonical.display, 'Salt')
+        self.assertEqual(
+            list(models.Tag.objects.order_by('id').values_list(
+                'name', flat=True,
+            )),
+            ['Salt', 'SALT'],
+        )
+        self.assertEqual(models.Tag.objects.get(name='SALT'), tag2)
+
+    def test_rename_after_refresh(self):
+        """ test a tag loaded without its name annotation is renamed """
+        tag = models.Tag.objects.create(user=sample_user(), name='Salt')
+        tag = models.Tag._base_manager.get(id=tag.id)
+        tag.name = 'Sea salt'
+        tag.save()
+        tag.refresh_from_db()
+
+        self.assertEqual(tag.name, 'Sea salt')
+        self.assertEqual(tag.canonical.name, 'sea salt')
@@ -0,0 +1,166 @@
+import threading
+import time
+from unittest.mock import patch
+
+from django.db import connections
+from django.test import TestCase
+
+from core.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """ stands in for a DB-API connection """
+
+    def __init__(self):
+        self.closed = False
+        self.usable = True
+        self.rollbacks = 0
+
+    def rollback(self):
+        if not self.usable:
+            raise RuntimeError('connection lost')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    return ConnectionPool(
+        FakeConnection, lambda connection: connection.usable, **kwargs
+    )
+
+
+class ConnectionPoolTests(TestCase):
+
+    def test_connections_reused(self):
+        """ test released connections are handed out again """
+        pool = make_pool(max_size=2)
+        first = pool.acquire()
+        pool.release(first)
+        second = pool.acquire()
+
+        self.assertIs(first, second)
+        self.assertEqual(first.rollbacks, 1)
+        stats = pool.stats()
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(stats['acquired'], 2)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_min_size_opened_up_front(self):
+        """ test the first acquire opens min_size connections """
+        pool = make_pool(min_size=3, max_size=5)
+        pool.acquire()
+
+        self.assertEqual(pool.stats()['opened'], 3)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+    def test_stats_logged(self):
+        """ test a pool logs its stats once every stats interval """
+        pool = make_pool(stats_interval=60, name='default')
+        with patch('core.pool.time.monotonic', return_value=1000.0):
+            pool._stats_logged = 0.0
+            with self.assertLogs('core.pool', 'INFO') as logs:
+                pool.acquire()
+                pool.acquire()
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('pool stats of default', logs.output[0])
+        self.assertIn("'acquired': 1", logs.output[0])
+
+    def test_max_size_times_out(self):
+        """ test acquiring from a full pool gives up after the timeout """
+        pool = make_pool(max_size=1, timeout=0.05)
+        pool.acquire()
+
+        with self.assertRaises(PoolTimeout), \
+                self.assertLogs('core.pool', 'WARNING'):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_wait_for_release(self):
+        """ test a waiting thread gets the released connection """
+        pool = make_pool(max_size=1, timeout=5)
+        held = pool.acquire()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+        waiter.start()
+        time.sleep(0.05)
+        pool.release(held)
+        waiter.join()
+
+        self.assertEqual(got, [held])
+        stats = pool.stats()
+        self.assertEqual(stats['waited'], 1)
+        self.assertGreaterEqual(stats['wait_max_ms'], 40)
+        self.assertEqual(sum(stats['wait_buckets_ms'].values()), 2)
+
+    def test_max_lifetime(self):
+        """ test connections are replaced once they are too old """
+        pool = make_pool(max_lifetime=60)
+        old = pool.acquire()
+        pool.release(old)
+
+        later = time.monotonic() + 61
+        with patch('core.pool.time.monotonic', return_value=later):
+            new = pool.acquire()
+
+        self.assertIsNot(old, new)
+        self.assertTrue(old.closed)
+
+    def test_health_check(self):
+        """ test idle connections failing the check are replaced """
+        pool = make_pool(check_interval=10)
+        broken = pool.acquire()
+        pool.release(broken)
+        broken.usable = False
+
+        later = time.monotonic() + 11
+        with patch('core.pool.time.monotonic', return_value=later):
+            new = pool.acquire()
+
+        self.assertIsNot(broken, new)
+        self.assertEqual(pool.stats()['failed_checks'], 1)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_broken_connection_not_reused(self):
+        """ test connections that can't be reset are closed """
+        pool = make_pool(max_size=1)
+        broken = pool.acquire()
+        broken.usable = False
+        pool.release(broken)
+
+        self.assertTrue(broken.closed)
+        self.assertIsNot(pool.acquire(), broken)
+
+    def test_close(self):
+        """ test closing the pool closes idle and released connections """
+        pool = make_pool()
+        idle, busy = pool.acquire(), pool.acquire()
+        pool.release(idle)
+        pool.close()
+        pool.release(busy)
+
+        self.assertTrue(idle.closed)
+        self.assertTrue(busy.closed)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+
+class PooledBackendTests(TestCase):
+
+    def test_connections_returned_to_pool(self):
+        """ test the backend reuses the connection it closed """
+        default = connections['default']
+        # another connection of the default database, as a thread gets
+        wrapper = type(default)(default.settings_dict, 'default')
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+        wrapper.ensure_connection()
+
+        try:
+            self.assertIs(wrapper.connection, raw)
+            self.assertIsNot(raw, default.connection)
+        finally:
+            wrapper.close()
@@ -0,0 +1,108 @@
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.replicas import reset_read_database, set_read_database
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+ME_URL = reverse('user:me')
+
+# the tests can only read from the test database, so it stands in for the
+# replica, reads that stay on the primary have no read_database
+REPLICAS = {'ALIASES': ['default'], 'READ_YOUR_WRITES': 5}
+
+
+def read_database(response):
+    """ return the database the view of a response read from """
+    return response.renderer_context['view'].read_database
+
+
+class ReplicaRouterTests(TestCase):
+
+    def test_reads_follow_read_database(self):
+        """ test reads go to the database set for the request """
+        self.assertEqual(Recipe.objects.all().db, 'default')
+
+        token = set_read_database('replica_1')
+        try:
+            self.assertEqual(Recipe.objects.all().db, 'replica_1')
+            self.assertEqual(router.db_for_write(Recipe), 'default')
+        finally:
+            reset_read_database(token)
+
+        self.assertEqual(Recipe.objects.all().db, 'default')
+
+    @override_settings(DATABASE_REPLICAS={'ALIASES': ['replica_1']})
+    def test_replicas_not_migrated(self):
+        """ test migrations only run on the primary """
+        self.assertFalse(router.allow_migrate('replica_1', 'core'))
+        self.assertTrue(router.allow_migrate('default', 'core'))
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS)
+class ReplicaReadsTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@eniac.com',
+            'testpass',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_reads_from_replica(self):
+        """ test safe requests read from a replica """
+        for url in (RECIPES_URL, TAGS_URL, ME_URL):
+            res = self.client.get(url)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(read_database(res), 'default')
+
+    @override_settings(DATABASE_REPLICAS={})
+    def test_reads_without_replicas(self):
+        """ test reads stay on the primary without replicas """
+        res = self.client.get(RECIPES_URL)
+
+        self.assertIsNone(read_database(res))
+
+    def test_read_your_writes(self):
+        """ test a user reads from the primary for a while after writing """
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+        self.assertIsNone(read_database(res))
+
+        self.assertIsNone(read_database(self.client.get(RECIPES_URL)))
+        self.assertIsNone(read_database(self.client.get(ME_URL)))
+
+        # other users still read from the replicas
+        other = get_user_model().objects.create_user(
+            'other@eniac.com',
+            'testpass',
+        )
+        self.client.force_authenticate(other)
+        self.assertEqual(read_database(self.client.get(RECIPES_URL)),
+                         'default')
+
+        # and so does the writer once the window has passed
+        self.client.force_authenticate(self.user)
+        later = time.time() + 6
+        with patch('django.core.cache.backends.locmem.time.time',
+                   return_value=later):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(read_database(res), 'default')
+
+    def test_profile_update_pins_to_primary(self):
+        """ test updating the user profile counts as a write """
+        self.client.patch(ME_URL, {'name': 'New name'})
+
+        self.assertIsNone(read_database(self.client.get(ME_URL)))
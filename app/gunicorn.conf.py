@@ -0,0 +1,40 @@
+"""
+Gunicorn settings of the production server, see start.sh.
+
+The master loads the project once (preload_app) and forks WEB_CONCURRENCY
+uvicorn workers serving app.asgi, each with the ASGI_THREADS threads and
+a database pool of its own. Workers are replaced after about
+GUNICORN_MAX_REQUESTS requests, spread by a random jitter so they don't
+all restart at once, and given GUNICORN_GRACEFUL_TIMEOUT seconds to
+finish what they are doing.
+
+kill -HUP the master to replace the workers gracefully. As the project is
+preloaded they run the code the master loaded, to deploy new code send
+USR2 to start a new master next to the old one, then QUIT the old one.
+"""
+import os
+
+# the views hold the GIL, a process per core serves them in parallel and
+# the extra one covers the time workers spend waiting or restarting
+workers = int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) + 1))
+worker_class = 'uvicorn.workers.UvicornWorker'
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER',
+                                         max_requests // 10))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+# the settings turn the per process response cache off for several workers
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+# every worker would otherwise start a hashing process per core, share
+# the cores between them (core.hashers), before the project is loaded
+os.environ.setdefault('PASSWORD_HASHING_WORKERS',
+                      str(max(1, (os.cpu_count() or 1) // workers)))
@@ -0,0 +1,273 @@
+"""
+Benchmarks for the recipe api, run with ``python manage.py benchmark``.
+
+Every suite seeds its own data for a throwaway user that the command
+deletes again once the suite has finished.
+"""
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Prefetch
+from django.test.utils import override_settings
+
+from core import hashers
+from core.models import Tag, Ingredient, Recipe
+from recipe import serializers
+from recipe.counters import reconcile_recipe_counts
+from recipe.filters import assigned_to_recipes, filter_recipes_by_related
+from recipe.readers import get_reader
+from recipe.search import search_recipes, update_search_vectors
+from user.serializers import AuthTokenSerializer
+
+SUITES = {}
+
+# words the seeded recipe titles are made of
+STYLES = ('spicy', 'smoky', 'creamy', 'crispy', 'roasted', 'grilled',
+          'braised', 'baked', 'steamed', 'fried', 'sweet', 'sour', 'tangy',
+          'garlic', 'lemon', 'ginger', 'honey', 'herbed', 'cheesy', 'vegan')
+DISHES = ('soup', 'stew', 'salad', 'curry', 'pasta', 'risotto', 'tacos',
+          'burger', 'pie', 'cake', 'bread', 'noodles', 'chili', 'omelette',
+          'pancakes', 'dumplings', 'casserole', 'skewers', 'wraps', 'bowl')
+
+
+def suite(name):
+    """ register a benchmark suite under the given name """
+    def register(func):
+        SUITES[name] = func
+        return func
+
+    return register
+
+
+def timed(func, repeat=5):
+    """ return the median wall time of calling func in milliseconds """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(timings)
+
+
+def create_bench_user():
+    """ create the user that owns the seeded data """
+    return get_user_model().objects.create_user(
+        f'bench-{time.time_ns()}@eniac.com',
+        'benchpass',
+    )
+
+
+def analyze(*models):
+    """ refresh planner statistics and the visibility map after seeding """
+    # without this the timings depend on when autovacuum gets to the tables
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f'VACUUM ANALYZE {model._meta.db_table}')
+
+
+def seed_recipes(user, count, tags=50, ingredients=200,
+                 tags_per_recipe=3, ingredients_per_recipe=5):
+    """ bulk create recipes with randomly assigned tags and ingredients """
+    rng = random.Random(count)
+    tag_ids = [t.id for t in Tag.objects.bulk_create(
+        Tag(user=user, name=f'tag {i}') for i in range(tags)
+    )]
+    ingredient_ids = [i.id for i in Ingredient.objects.bulk_create(
+        Ingredient(user=user, name=f'ingredient {i}')
+        for i in range(ingredients)
+    )]
+    recipes = Recipe.objects.bulk_create(
+        (Recipe(user=user,
+                title=f'{rng.choice(STYLES)} {rng.choice(DISHES)} {i}',
+                time_minutes=i % 120, price=i % 100)
+         for i in range(count)),
+        batch_size=5000,
+    )
+    Recipe.tags.through.objects.bulk_create(
+        (Recipe.tags.through(recipe_id=r.id, tag_id=tag_id)
+         for r in recipes
+         for tag_id in rng.sample(tag_ids, tags_per_recipe)),
+        batch_size=5000,
+    )
+    Recipe.ingredients.through.objects.bulk_create(
+        (Recipe.ingredients.through(recipe_id=r.id, ingredient_id=ing_id)
+         for r in recipes
+         for ing_id in rng.sample(ingredient_ids, ingredients_per_recipe)),
+        batch_size=5000,
+    )
+    analyze(Tag, Ingredient, Recipe, Recipe.tags.through,
+            Recipe.ingredients.through)
+
+    return tag_ids, ingredient_ids
+
+
+@suite('filters')
+def bench_filters(user, recipes):
+    """ tag/ingredient filters: chained joins against semi-joins """
+    tag_ids, ingredient_ids = seed_recipes(user, recipes)
+    tags, ingredients = tag_ids[:2], ingredient_ids[:2]
+    base = Recipe.objects.filter(user=user)
+
+    def joined(distinct=False):
+        def run():
+            queryset = base.filter(tags__id__in=tags).filter(
+                ingredients__id__in=ingredients,
+            )
+            if distinct:
+                queryset = queryset.distinct()
+            return list(queryset.values_list('id', flat=True))
+
+        return run
+
+    def semi_join(mode):
+        def run():
+            queryset = filter_recipes_by_related(base, 'tags', tags, mode)
+            queryset = filter_recipes_by_related(
+                queryset, 'ingredients', ingredients, mode,
+            )
+            return list(queryset.values_list('id', flat=True))
+
+        return run
+
+    for label, run in (('chained joins', joined()),
+                       ('chained joins + distinct', joined(distinct=True))):
+        yield label, timed(run), len(run())
+    for mode in ('any', 'all'):
+        run = semi_join(mode)
+        yield f'semi-join ({mode})', timed(run), len(run())
+
+
+@suite('assigned')
+def bench_assigned(user, recipes):
+    """ assigned_only tags: join + distinct against EXISTS and counters """
+    seed_recipes(user, recipes, tags=200)
+    reconcile_recipe_counts('tags', Tag.objects.filter(user=user))
+    # unused tags give the filter something to drop
+    Tag.objects.bulk_create(
+        Tag(user=user, name=f'unused {i}') for i in range(100)
+    )
+    base = Tag.objects.filter(user=user).order_by('-name')
+
+    def run(queryset):
+        return lambda: list(queryset.values_list('id', flat=True))
+
+    candidates = (
+        ('join + distinct', base.filter(recipe__isnull=False).distinct()),
+        ('exists', assigned_to_recipes(base, 'tags')),
+        ('stored counts', base.filter(recipe_count__gt=0)),
+    )
+    for label, queryset in candidates:
+        yield label, timed(run(queryset)), len(run(queryset)())
+
+
+@suite('serializers')
+def bench_serializers(user, recipes):
+    """ list serialization: DRF serializers against the values reader """
+    seed_recipes(user, recipes)
+    sizes = [size for size in (1000, 10000, 100000) if size <= recipes]
+    base = Recipe.objects.filter(user=user).order_by('-id')
+    prefetched = base.prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.order_by('id')),
+        Prefetch('ingredients', queryset=Ingredient.objects.order_by('id')),
+    )
+
+    for serializer_class in (serializers.RecipeSerializer,
+                             serializers.RecipeDetailSerializer):
+        reader = get_reader(serializer_class)
+        name = serializer_class.__name__
+        for size in sizes:
+            def drf():
+                return serializer_class(prefetched[:size], many=True).data
+
+            def fast():
+                return reader.render(reader.values(base[:size]))
+
+            yield f'{name} drf', timed(drf, repeat=3), size
+            yield f'{name} reader', timed(fast, repeat=3), size
+
+    tags = Tag.objects.filter(user=user)
+    reader = get_reader(serializers.TagSerializer)
+    yield 'TagSerializer drf', timed(
+        lambda: serializers.TagSerializer(tags, many=True).data
+    ), tags.count()
+    yield 'TagSerializer reader', timed(
+        lambda: reader.render(reader.values(tags))
+    ), tags.count()
+
+
+@suite('search')
+def bench_search(user, recipes):
+    """ ranked full-text search through the GIN index """
+    seed_recipes(user, recipes, tags=50, ingredients=200)
+    update_search_vectors(Recipe.objects.filter(user=user))
+    analyze(Recipe)
+    base = Recipe.objects.filter(user=user)
+
+    def first_page(text):
+        # the query the list endpoint makes for the first page
+        queryset = search_recipes(base, text).order_by('-rank', '-id')
+        return lambda: list(queryset.values_list('id', flat=True)[:100])
+
+    for label, text in (('single title', str(recipes // 2)),
+                        ('style + dish', 'smoky chili'),
+                        ('style', 'smoky'),
+                        ('dish', 'dumplings')):
+        yield label, timed(first_page(text)), \
+            search_recipes(base, text).count()
+
+
+@suite('login')
+def bench_login(user, recipes):
+    """
+    Token logins with each hasher, hashing in the request thread and in
+    the core.hashers processes. Single logins give the wall time of one,
+    threaded ones the wall time per login times the cores, that is the
+    inverse of the logins per second each core serves
+    """
+    cores = os.cpu_count() or 1
+    threads = cores * 4
+    logins = 40
+    credentials = {'email': user.email, 'password': 'benchpass'}
+
+    def login():
+        serializer = AuthTokenSerializer(data=credentials)
+        serializer.is_valid(raise_exception=True)
+
+    def threaded_login():
+        try:
+            login()
+        finally:
+            # the threads borrow connections from the pool
+            connection.close()
+
+    for name, path in (('pbkdf2', 'django.contrib.auth.hashers.'
+                                  'PBKDF2PasswordHasher'),
+                       ('scrypt', 'core.hashers.ScryptPasswordHasher'),
+                       ('argon2', 'core.hashers.Argon2PasswordHasher')):
+        with override_settings(PASSWORD_HASHERS=[path]):
+            # stored with the hasher, so logins don't rehash
+            user.set_password('benchpass')
+            user.save(update_fields=['password'])
+            for place, workers in (('thread', 0), ('processes', cores)):
+                options = {'WORKERS': workers, 'MAX_PENDING': threads}
+                with override_settings(PASSWORD_HASHING=options):
+                    # start the processes before timing
+                    hashers.make_password('warm up')
+                    yield f'{name} in {place}', timed(login, 10), 1
+
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(threads) as executor:
+                        for _ in range(logins):
+                            executor.submit(threaded_login)
+                    millis = (time.perf_counter() - start) * 1000
+                    yield f'{name} in {place} x{threads}/core', \
+                        millis * cores / logins, logins
+            hashers.shutdown()
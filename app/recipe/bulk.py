@@ -0,0 +1,224 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.db.models.functions import Cast
+from django.utils.translation import gettext as _
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from core.models import CanonicalNameMixin
+from recipe.cache import invalidate
+from recipe.counters import change_recipe_counts, link_deltas, linked_ids
+from recipe.filters import through_table
+from recipe.search import update_search_vectors_of
+
+# rows per UPDATE statement built by bulk_update
+UPDATE_BATCH_SIZE = 500
+
+
+def missing_ids(queryset, ids):
+    """ return the ids that are not in the queryset, using one IN query """
+    ids = set(ids)
+    found = set(queryset.filter(id__in=ids).values_list('id', flat=True))
+    return sorted(ids - found)
+
+
+def bulk_update(objs, fields):
+    """ save the given fields of many objects with one UPDATE per batch """
+    # Django 2.1 has no QuerySet.bulk_update, this builds the same
+    # CASE WHEN id = ... THEN ... statement it uses in later versions
+    if not objs:
+        return
+    model = type(objs[0])
+    # set auto_now fields the way save() does
+    auto_now = [field for field in model._meta.concrete_fields
+                if getattr(field, 'auto_now', False)]
+    for obj in objs:
+        for field in auto_now:
+            field.pre_save(obj, add=False)
+    fields = set(fields) | {field.name for field in auto_now}
+    if not fields:
+        return
+    for start in range(0, len(objs), UPDATE_BATCH_SIZE):
+        batch = objs[start:start + UPDATE_BATCH_SIZE]
+        updates = {}
+        for name in fields:
+            field = model._meta.get_field(name)
+            case = Case(
+                *[When(pk=obj.pk, then=Value(getattr(obj, field.attname),
+                                             output_field=field))
+                  for obj in batch],
+                output_field=field,
+            )
+            # postgres types the CASE from its parameters, which are text
+            updates[field.attname] = Cast(case, output_field=field)
+        model.objects.filter(pk__in=[obj.pk for obj in batch]).update(
+            **updates
+        )
+
+
+def replace_recipe_links(relation, links):
+    """ replace the related ids of many recipes with two queries """
+    # links maps recipe id -> related ids, recipes missing from it are kept
+    if not links:
+        return
+    through, column = through_table(relation)
+    removed = linked_ids(relation, links)
+    through.objects.filter(recipe_id__in=links).delete()
+    added = through.objects.bulk_create(
+        through(recipe_id=recipe_id, **{column: related_id})
+        for recipe_id, related_ids in links.items()
+        for related_id in set(related_ids)
+    )
+    # bulk queries send no m2m_changed signals to keep the counters
+    added = Counter(getattr(link, column) for link in added)
+    change_recipe_counts(
+        relation, link_deltas(removed, added), used=set(added),
+    )
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    List serializer that writes all items with bulk queries. Children
+    list the recipe M2M fields they accept as ids in Meta.bulk_relations
+    """
+
+    def _relations(self):
+        return getattr(self.child.Meta, 'bulk_relations', ())
+
+    def validate(self, attrs):
+        """ check all related ids belong to the user with one query each """
+        user = self.context['request'].user
+        model = self.child.Meta.model
+        for relation in self._relations():
+            related_model = model._meta.get_field(relation).related_model
+            ids = [pk for item in attrs for pk in item.get(relation, [])]
+            missing = missing_ids(related_model.objects.filter(user=user), ids)
+            if missing:
+                raise serializers.ValidationError({relation: [
+                    _('Invalid pk "%s" - object does not exist.') % pk
+                    for pk in missing
+                ]})
+
+        return attrs
+
+    def create(self, validated_data):
+        """ insert all rows, then all of their M2M links """
+        model = self.child.Meta.model
+        links = {relation: [] for relation in self._relations()}
+        objs = []
+        for item in validated_data:
+            for relation in links:
+                links[relation].append(item.pop(relation, []))
+            objs.append(model(**item))
+
+        # postgres returns the new ids, which the links below depend on
+        model.objects.bulk_create(objs)
+        for relation, related_ids in links.items():
+            replace_recipe_links(relation, {
+                obj.id: ids for obj, ids in zip(objs, related_ids)
+            })
+
+        return objs
+
+    def update(self, instances, validated_data):
+        """ update the matching instances by id """
+        by_id = {instance.id: instance for instance in instances}
+        links = {relation: {} for relation in self._relations()}
+        fields = set()
+        for item in validated_data:
+            instance = by_id[item.pop('id')]
+            for relation in links:
+                if relation in item:
+                    links[relation][instance.id] = item.pop(relation)
+            for name, value in item.items():
+                setattr(instance, name, value)
+            fields.update(item)
+
+        if 'name' in fields and isinstance(instances[0], CanonicalNameMixin):
+            type(instances[0]).set_canonical_names(instances)
+            # the name is saved as these columns
+            fields = fields - {'name'} | {'canonical', 'display_name'}
+        bulk_update(instances, fields)
+        for relation, relation_links in links.items():
+            replace_recipe_links(relation, relation_links)
+
+        return instances
+
+
+class BulkModelMixin:
+    """
+    Adds a bulk endpoint writing many objects of the user in a single
+    transaction: POST a list to create, PATCH a list of objects with ids
+    to update and DELETE a list of ids to delete
+    """
+    bulk_max_size = 1000
+
+    def _validate_bulk_payload(self, payload):
+        if not isinstance(payload, list) or not payload:
+            raise serializers.ValidationError(
+                _('Expected a non empty list of items.')
+            )
+        if len(payload) > self.bulk_max_size:
+            raise serializers.ValidationError(
+                _('At most %d items can be sent at once.') % self.bulk_max_size
+            )
+
+    def _bulk_written(self, objs):
+        """ do what the model signals do for objects written in bulk """
+        model = self.get_queryset().model
+        update_search_vectors_of(model, [obj.id for obj in objs])
+        invalidate(self.request.user.id)
+
+    def _bulk_response(self, objs, status_code):
+        """ serialize the written objects the way the list action does """
+        queryset = self.get_queryset().filter(id__in=[obj.id for obj in objs])
+        serializer = self.serializer_class(queryset, many=True)
+        return Response(serializer.data, status=status_code)
+
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False)
+    def bulk(self, request):
+        """ create, update or delete many objects at once """
+        payload = request.data
+        self._validate_bulk_payload(payload)
+
+        if request.method == 'DELETE':
+            ids = serializers.ListField(
+                child=serializers.IntegerField(),
+            ).run_validation(payload)
+            self.get_queryset().filter(id__in=ids).delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        with transaction.atomic():
+            if request.method == 'POST':
+                serializer = self.get_serializer(data=payload, many=True)
+                serializer.is_valid(raise_exception=True)
+                objs = serializer.save(user=request.user)
+                self._bulk_written(objs)
+                return self._bulk_response(objs, status.HTTP_201_CREATED)
+
+            ids = [item.get('id') for item in payload
+                   if isinstance(item, dict)]
+            if len(ids) != len(payload) or None in ids:
+                raise serializers.ValidationError(
+                    {'id': [_('Every item must have an id.')]}
+                )
+            ids = serializers.ListField(
+                child=serializers.IntegerField(),
+            ).run_validation(ids)
+            missing = missing_ids(self.get_queryset(), ids)
+            if missing:
+                raise serializers.ValidationError({'id': [
+                    _('Invalid pk "%s" - object does not exist.') % pk
+                    for pk in missing
+                ]})
+            instances = list(self.get_queryset().filter(id__in=ids))
+            serializer = self.get_serializer(
+                instances, data=payload, many=True, partial=True,
+            )
+            serializer.is_valid(raise_exception=True)
+            objs = serializer.save()
+            self._bulk_written(objs)
+            return self._bulk_response(objs, status.HTTP_200_OK)
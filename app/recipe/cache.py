@@ -0,0 +1,190 @@
+"""
+Per-user cache of the recipe api read responses.
+
+Every user has a change version kept in the cache. Cached responses are
+keyed on it, so bumping the version, which recipe.signals does whenever
+one of the user's recipes, tags or ingredients changes, invalidates all
+of that user's cached responses at once without having to find them.
+The version also gives the ETag of a response, so conditional reads are
+answered before anything is queried or rendered. Versions are the time of
+the change in nanoseconds, which gives the Last-Modified date too. Dates
+only have seconds, so it is left out until the version is a second old:
+a change in the same second as a response could not be told apart from
+it. When a request has both, If-None-Match decides.
+
+The versions have to be seen by every process of the server, with
+RECIPE_API_CACHE['ENABLED'] off reads are neither cached nor tagged.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+HITS_KEY = 'recipe-api:hits'
+MISSES_KEY = 'recipe-api:misses'
+
+
+def get_cache():
+    """ return the cache configured in settings.RECIPE_API_CACHE """
+    options = getattr(settings, 'RECIPE_API_CACHE', {})
+    return caches[options.get('ALIAS', 'default')]
+
+
+def enabled():
+    """ return whether read responses are cached """
+    return getattr(settings, 'RECIPE_API_CACHE', {}).get('ENABLED', True)
+
+
+def timeout():
+    """ return the lifetime of cached responses in seconds """
+    return getattr(settings, 'RECIPE_API_CACHE', {}).get('TIMEOUT', 300)
+
+
+def last_modified(version):
+    """ return the timestamp of a version in seconds, None while a change
+    in the same second could still follow """
+    if time.time_ns() - version < 10 ** 9:
+        return None
+    return version // 10 ** 9
+
+
+def _version_key(user_id):
+    return f'recipe-api:version:{user_id}'
+
+
+def get_version(user_id):
+    """ return the change version of the user's recipe data """
+    cache = get_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # unknown or evicted, any fresh value invalidates older responses
+        cache.add(_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def bump_version(user_id):
+    """ mark all cached responses of the user as stale """
+    get_cache().set(_version_key(user_id), time.time_ns(), None)
+
+
+def invalidate(user_id):
+    """ bump the user's version now and again once the change is committed """
+    bump_version(user_id)
+    # a read running before the commit may have cached the old rows under
+    # the new version
+    transaction.on_commit(lambda: bump_version(user_id))
+
+
+def _request_digest(request):
+    """ return a digest of everything a read response depends on """
+    params = sorted(
+        (name, value)
+        for name in request.query_params
+        for value in request.query_params.getlist(name)
+    )
+    # pagination links are absolute, so the host is part of the key
+    return hashlib.sha256(repr((
+        request.get_host(),
+        request.path,
+        request.accepted_media_type,
+        params,
+    )).encode()).hexdigest()
+
+
+def response_key(request, version):
+    """ return the cache key of a read request for the given version """
+    digest = _request_digest(request)
+    return f'recipe-api:response:{request.user.id}:{version}:{digest}'
+
+
+def response_etag(request, version):
+    """ return the ETag of a read request """
+    # the same request and version always get the same body, so the tag
+    # is strong without rendering it
+    return f'"{request.user.id}-{version}-{_request_digest(request)[:16]}"'
+
+
+def _count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # incr fails on missing keys, add does nothing on existing ones
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def stats():
+    """ return the hit and miss counters of the response cache """
+    counters = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    return {
+        'hits': counters.get(HITS_KEY, 0),
+        'misses': counters.get(MISSES_KEY, 0),
+    }
+
+
+def _set_validators(response, etag, modified):
+    response['ETag'] = etag
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified)
+    return response
+
+
+def cached_response(handler, request, *args, **kwargs):
+    """
+    Answer conditional reads with 304 from the user's version alone,
+    otherwise return the cached data or call the handler and cache it
+    """
+    if not enabled():
+        return handler(request, *args, **kwargs)
+    version = get_version(request.user.id)
+    etag = response_etag(request, version)
+    modified = last_modified(version)
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=modified,
+    )
+    if not_modified is not None:
+        return _set_validators(not_modified, etag, modified)
+
+    cache = get_cache()
+    key = response_key(request, version)
+    data = cache.get(key)
+    if data is not None:
+        _count(HITS_KEY)
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return _set_validators(response, etag, modified)
+
+    _count(MISSES_KEY)
+    response = handler(request, *args, **kwargs)
+    if response.status_code != 200:
+        return response
+    cache.set(key, response.data, timeout())
+    response['X-Cache'] = 'MISS'
+    return _set_validators(response, etag, modified)
+
+
+class CachedListMixin:
+    """
+    Caches list responses and tags them with an ETag until the user's
+    change version moves
+    """
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(super().list, request, *args, **kwargs)
+
+
+class CachedRetrieveMixin:
+    """
+    Caches retrieve responses and tags them with an ETag until the
+    user's change version moves
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(super().retrieve, request, *args, **kwargs)
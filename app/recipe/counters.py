@@ -0,0 +1,79 @@
+"""
+Denormalized recipe counters of tags and ingredients.
+
+Tag.recipe_count and Ingredient.recipe_count hold the number of recipes
+linking them and last_used the time they were last linked. Links change
+through the M2M managers, whose signals are handled in recipe.signals,
+through the bulk endpoints and when recipes are deleted. Each of them
+applies increments in the transaction of the change, so concurrent
+changes add up instead of overwriting each other.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, IntegerField, Max, OuterRef, \
+                             Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Recipe
+from recipe.filters import through_table
+
+
+def related_model(relation):
+    """ return the model of the tags or ingredients recipe relation """
+    return Recipe._meta.get_field(relation).related_model
+
+
+def linked_ids(relation, recipe_ids=None, related_ids=None):
+    """ return a Counter of the related ids of the links between the
+    given recipes and related ids, None standing for all of them """
+    through, column = through_table(relation)
+    links = through.objects.all()
+    if recipe_ids is not None:
+        links = links.filter(recipe_id__in=recipe_ids)
+    if related_ids is not None:
+        links = links.filter(**{f'{column}__in': related_ids})
+    return Counter(links.values_list(column, flat=True))
+
+
+def link_deltas(removed, added):
+    """ return {related id: delta} for Counters of removed and added ids """
+    return {pk: added[pk] - removed[pk] for pk in set(removed) | set(added)}
+
+
+def change_recipe_counts(relation, deltas, used=()):
+    """
+    Add the deltas of a {related id: delta} mapping to the recipe counts,
+    and set last_used of the used ids, in one UPDATE per distinct change
+    """
+    groups = defaultdict(list)
+    for pk in set(deltas) | set(used):
+        groups[(deltas.get(pk, 0), pk in used)].append(pk)
+    now = timezone.now()
+    for (delta, is_used), ids in groups.items():
+        updates = {}
+        if delta:
+            updates['recipe_count'] = F('recipe_count') + delta
+        if is_used:
+            updates['last_used'] = now
+        if updates:
+            related_model(relation).objects.filter(id__in=ids).update(
+                **updates
+            )
+
+
+def reconcile_recipe_counts(relation, ids):
+    """ recompute the counters of the given tags or ingredients """
+    through, column = through_table(relation)
+    links = through.objects.filter(**{column: OuterRef('pk')}) \
+        .order_by().values(column)
+    count = links.annotate(count=Count('*')).values('count')
+    last_used = links.annotate(last=Max('recipe__modified')).values('last')
+    # links carry no timestamp, the last change of a recipe using the
+    # row is the closest known time it was used
+    return related_model(relation).objects.filter(id__in=ids).update(
+        recipe_count=Coalesce(
+            Subquery(count, output_field=IntegerField()), 0,
+        ),
+        last_used=Coalesce(F('last_used'), Subquery(last_used)),
+    )
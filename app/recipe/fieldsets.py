@@ -0,0 +1,77 @@
+"""
+Sparse fieldsets and expansions of the recipe read endpoints.
+
+``?fields=id,title`` limits the serialized fields, and the columns the
+view loads, to the given ones. ``?expand=tags,ingredients`` nests the
+related objects in list responses instead of listing their ids.
+"""
+from django.utils.translation import gettext as _
+from rest_framework.exceptions import ValidationError
+
+_field_names = {}
+
+
+def field_names(serializer_class):
+    """ return the names of the fields of a serializer class """
+    names = _field_names.get(serializer_class)
+    if names is None:
+        names = _field_names[serializer_class] = tuple(
+            serializer_class().fields
+        )
+    return names
+
+
+def list_param(query_params, param, choices):
+    """ return the comma separated choices given in a query param, in the
+    order of the choices, or None if the param is missing """
+    value = query_params.get(param)
+    if value is None:
+        return None
+    names = {name.strip() for name in value.split(',')} - {''}
+    if not names or names - set(choices):
+        msg = _('Must be a comma separated list of: %s') % ', '.join(choices)
+        raise ValidationError({param: [msg]})
+
+    return tuple(name for name in choices if name in names)
+
+
+class SparseFieldsMixin:
+    """ serializer mixin dropping the fields missing from fields= """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsetMixin:
+    """
+    Viewset mixin reading ?fields= on reads and ?expand= on lists. The
+    serializer classes must accept the fields argument, and
+    get_serializer_class should return the expanded serializer from
+    get_expansions()
+    """
+    # relations ?expand= may nest
+    expandable = ()
+    sparse_actions = ('list', 'retrieve')
+
+    def get_serializer_fields(self):
+        """ return the field names asked for, None for all of them """
+        if self.action not in self.sparse_actions:
+            return None
+        return list_param(self.request.query_params, 'fields',
+                          field_names(self.get_serializer_class()))
+
+    def get_expansions(self):
+        """ return the relations to nest in list responses """
+        if self.action != 'list':
+            return ()
+        return list_param(self.request.query_params, 'expand',
+                          self.expandable) or ()
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_serializer_fields()
+        if fields is not None:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
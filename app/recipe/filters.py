@@ -0,0 +1,123 @@
+from django.db.models import Count, Exists, OuterRef
+from django.utils.translation import gettext as _
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from core.models import Recipe
+
+# any: the recipe has at least one of the ids, all: it has every one of them
+FILTER_MODES = ('any', 'all')
+# ?ordering= values of recipes, id breaks ties
+RECIPE_ORDERINGS = {
+    '-id': ('-id',),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'time_minutes': ('time_minutes', 'id'),
+    '-time_minutes': ('-time_minutes', '-id'),
+}
+# ?<param>= range filters of recipes, by the lookup they apply
+RECIPE_RANGES = {
+    'price_min': ('price__gte', serializers.DecimalField(
+        max_digits=None, decimal_places=None, min_value=0,
+    )),
+    'price_max': ('price__lte', serializers.DecimalField(
+        max_digits=None, decimal_places=None, min_value=0,
+    )),
+    'time_max': ('time_minutes__lte', serializers.IntegerField(min_value=0)),
+}
+# ?ordering= values of tags and ingredients, id breaks ties
+ATTR_ORDERINGS = {
+    '-name': ('-name', '-id'),
+    'name': ('name', 'id'),
+    '-recipe_count': ('-recipe_count', '-id'),
+    'recipe_count': ('recipe_count', 'id'),
+}
+
+
+def filter_mode(query_params, param):
+    """ return the match mode requested in the query params """
+    mode = query_params.get(param, 'any')
+    if mode not in FILTER_MODES:
+        msg = _('Must be one of: %s') % ', '.join(FILTER_MODES)
+        raise ValidationError({param: [msg]})
+
+    return mode
+
+
+def through_table(relation):
+    """ return the recipe M2M through model and its related id column """
+    field = Recipe._meta.get_field(relation)
+    return (
+        field.remote_field.through,
+        f'{field.m2m_reverse_field_name()}_id',
+    )
+
+
+def recipe_ids_related_to(relation, ids, mode='any'):
+    """ return a subquery of recipe ids linked to the given related ids """
+    # the through table already holds (recipe_id, <related>_id) pairs, so
+    # the recipes can be resolved there without joining the related table
+    through, column = through_table(relation)
+    links = through.objects.filter(**{
+        f'{column}__in': ids,
+    })
+    if mode == 'all':
+        links = links.values('recipe_id').annotate(
+            matched=Count(column, distinct=True),
+        ).filter(matched=len(set(ids)))
+
+    return links.values('recipe_id')
+
+
+def filter_recipes_by_related(queryset, relation, ids, mode='any'):
+    """ filter recipes to those linked to any or all of the related ids """
+    # an IN (subquery) is planned as a semi-join, so each recipe is
+    # returned once no matter how many of the ids it matches
+    return queryset.filter(id__in=recipe_ids_related_to(relation, ids, mode))
+
+
+def assigned_to_recipes(queryset, relation):
+    """ filter tags or ingredients to those used by at least one recipe """
+    # EXISTS stops at the first link found for each row, unlike a join
+    # which produces one row per recipe that then has to be made distinct
+    through, column = through_table(relation)
+    links = through.objects.filter(**{column: OuterRef('pk')})
+    return queryset.annotate(assigned=Exists(links)).filter(assigned=True)
+
+
+def filter_recipes_by_range(queryset, query_params):
+    """ apply the price and time range filters given in the query params """
+    filters = {}
+    for param, (lookup, field) in RECIPE_RANGES.items():
+        value = query_params.get(param)
+        if value is None or value == '':
+            continue
+        try:
+            filters[lookup] = field.run_validation(value)
+        except ValidationError as exc:
+            raise ValidationError({param: exc.detail})
+
+    return queryset.filter(**filters)
+
+
+def recipe_ordering(query_params, ranked=False):
+    """ return the recipe ordering requested with ?ordering= """
+    ordering = query_params.get('ordering')
+    if ordering is None:
+        # search results are best match first unless asked otherwise
+        return ('-rank', '-id') if ranked else ('-id',)
+    if ordering not in RECIPE_ORDERINGS:
+        msg = _('Must be one of: %s') % ', '.join(RECIPE_ORDERINGS)
+        raise ValidationError({'ordering': [msg]})
+
+    return RECIPE_ORDERINGS[ordering]
+
+
+def attr_ordering(query_params):
+    """ return the tag or ingredient ordering requested with ?ordering= """
+    ordering = query_params.get('ordering', '-name')
+    if ordering not in ATTR_ORDERINGS:
+        msg = _('Must be one of: %s') % ', '.join(ATTR_ORDERINGS)
+        raise ValidationError({'ordering': [msg]})
+
+    return ATTR_ORDERINGS[ordering]
@@ -0,0 +1,133 @@
+"""
+Background generation of resized variants of uploaded recipe images.
+
+The upload request only stores the original; the variants listed in
+settings.RECIPE_IMAGE_VARIANTS are written by a small thread pool once
+the upload is committed and recipe.image_variants_ready is then set.
+The variants of an image are removed once it is replaced or its recipe
+is deleted.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image
+
+from core.models import Recipe
+from recipe.cache import invalidate
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_sizes():
+    """ return the configured variant names and their bounding boxes """
+    return getattr(settings, 'RECIPE_IMAGE_VARIANTS', {
+        'thumbnail': (150, 150),
+        'medium': (600, 600),
+    })
+
+
+def variant_path(image_name, variant):
+    """ return the storage path of a variant of the given image """
+    root, ext = os.path.splitext(image_name)
+    return f'{root}_{variant}{ext}'
+
+
+def variant_urls(image_name, request=None):
+    """ return the urls of the variants of the image by variant name """
+    urls = {}
+    for variant in variant_sizes():
+        url = default_storage.url(variant_path(image_name, variant))
+        # build absolute urls the same way ImageField does
+        urls[variant] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+def get_executor():
+    """ return the process wide worker pool, creating it on first use """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RECIPE_IMAGE_WORKERS', 2),
+                thread_name_prefix='recipe-images',
+            )
+    return _executor
+
+
+def generate_variants(recipe_id, image_name):
+    """ write every variant of the image and mark the recipe as ready """
+    with default_storage.open(image_name) as original:
+        image = Image.open(original)
+        image_format = image.format
+        image.load()
+
+    for variant, size in variant_sizes().items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        if image_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+            resized = resized.convert('RGB')
+        buffer = io.BytesIO()
+        resized.save(buffer, format=image_format)
+
+        path = variant_path(image_name, variant)
+        # storages pick a new name for existing files, so replace them
+        default_storage.delete(path)
+        default_storage.save(path, ContentFile(buffer.getvalue()))
+
+    # a newer upload may have replaced the image while this one ran
+    recipes = Recipe.objects.filter(id=recipe_id, image=image_name)
+    user_id = recipes.values_list('user_id', flat=True).first()
+    if recipes.update(image_variants_ready=True, modified=timezone.now()):
+        # update() sends no signals, the cached responses lack the variants
+        invalidate(user_id)
+    else:
+        # nothing shows them, and discard_variants may have run already
+        delete_variants(image_name)
+
+
+def _run_job(recipe_id, image_name):
+    try:
+        generate_variants(recipe_id, image_name)
+    except Exception:
+        logger.exception('Could not resize image of recipe %s', recipe_id)
+    finally:
+        # worker threads hold their own connection, release it between jobs
+        close_old_connections()
+
+
+def schedule_variants(recipe):
+    """ generate the variants of the recipe image after the commit """
+    recipe_id, image_name = recipe.id, recipe.image.name
+    if not getattr(settings, 'RECIPE_IMAGE_ASYNC', True):
+        generate_variants(recipe_id, image_name)
+        return
+
+    transaction.on_commit(
+        lambda: get_executor().submit(_run_job, recipe_id, image_name)
+    )
+
+
+def delete_variants(image_name):
+    """ remove the stored variants of an image """
+    for variant in variant_sizes():
+        default_storage.delete(variant_path(image_name, variant))
+
+
+def discard_variants(image_name):
+    """ remove the variants of an image no longer used, after the commit """
+    if not getattr(settings, 'RECIPE_IMAGE_ASYNC', True):
+        delete_variants(image_name)
+        return
+
+    transaction.on_commit(lambda: delete_variants(image_name))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipe.cache import stats
+
+
+class Command(BaseCommand):
+    """ django command to print the recipe api response cache counters """
+
+    def handle(self, *args, **options):
+        counters = stats()
+        total = counters['hits'] + counters['misses']
+        ratio = counters['hits'] / total if total else 0
+        self.stdout.write(
+            f'hits: {counters["hits"]} misses: {counters["misses"]} '
+            f'hit ratio: {ratio:.1%}'
+        )
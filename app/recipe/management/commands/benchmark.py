@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.benchmarks import SUITES, create_bench_user
+
+
+class Command(BaseCommand):
+    """ django command to benchmark the recipe api against the database """
+    help = 'Seed throwaway data, time the given suites and delete it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help=', '.join(SUITES))
+        parser.add_argument('--recipes', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        names = options['suites'] or list(SUITES)
+        unknown = set(names) - set(SUITES)
+        if unknown:
+            raise CommandError(f'Unknown suites: {", ".join(sorted(unknown))}')
+
+        for name in names:
+            self.stdout.write(f'{name} ({options["recipes"]} recipes)')
+            user = create_bench_user()
+            try:
+                results = SUITES[name](user, options['recipes'])
+                for label, millis, rows in results:
+                    self.stdout.write(
+                        f'  {label:<30} {millis:>10.2f} ms {rows:>10} rows'
+                    )
+            finally:
+                # the seeded data is committed so the planner and the
+                # visibility map see it as they would in production
+                user.delete()
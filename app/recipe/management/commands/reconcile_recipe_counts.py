@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipe.counters import reconcile_recipe_counts, related_model
+
+
+class Command(BaseCommand):
+    """ django command to recompute the recipe counters of tags and
+    ingredients from their links """
+    help = 'Recompute recipe_count and missing last_used values in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for relation in ('tags', 'ingredients'):
+            model = related_model(relation)
+            ids = model.objects.order_by('id').values_list('id', flat=True)
+            last_id, total = 0, 0
+            while True:
+                batch = list(ids.filter(id__gt=last_id)[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1]
+                # one short transaction per batch keeps row locks brief
+                with transaction.atomic():
+                    total += reconcile_recipe_counts(relation, batch)
+            self.stdout.write(self.style.SUCCESS(
+                f'{model.__name__}: {total} rows reconciled'
+            ))
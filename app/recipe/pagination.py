@@ -0,0 +1,178 @@
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from urllib import parse
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+from rest_framework.utils.urls import replace_query_param
+
+from recipe.filters import attr_ordering, recipe_ordering
+
+Cursor = namedtuple('Cursor', ['reverse', 'position'])
+
+
+def after_position(ordering, position):
+    """ return the filter of the rows that come after position, the values
+    of a row for the ordering, in that ordering """
+    # (a, b) > (x, y) is a > x or (a = x and b > y), each field compared
+    # in its own direction
+    condition = Q()
+    equal = {}
+    for order, value in zip(ordering, position):
+        name = order.lstrip('-')
+        lookup = 'lt' if order.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    first = ordering[0].lstrip('-')
+    # the redundant bound on the first field keeps the scan on its index
+    bound = 'lte' if ordering[0].startswith('-') else 'gte'
+    return Q(**{f'{first}__{bound}': position[0]}) & condition
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination on the whole ordering. DRF's cursor keeps only the
+    first field and skips the rows sharing its value with an offset,
+    capped at offset_cutoff, so long runs of equal prices, counts or
+    ranks repeat pages forever. This cursor holds the values of every
+    field of the ordering, which ends with the unique id, and the next
+    page is what comes strictly after them.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = tuple(self.get_ordering(request, queryset, view))
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is not None:
+            self.cursor = self.cursor._replace(position=self.parse_position(
+                queryset, self.cursor.position,
+            ))
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        # previous pages are read backwards from their first row
+        ordering = _reverse_ordering(self.ordering) if reverse \
+            else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(
+                after_position(ordering, self.cursor.position),
+            )
+
+        # one more row tells whether another page follows
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        if self.page:
+            self.next_position = self._get_position_from_instance(
+                self.page[-1], self.ordering,
+            )
+            self.previous_position = self._get_position_from_instance(
+                self.page[0], self.ordering,
+            )
+        else:
+            # only a cursor past rows deleted since can land on no rows
+            self.has_next = self.has_previous = False
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(False, self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(True, self.previous_position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('utf-8')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = tokens['p']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        # a cursor of another ordering can't be continued
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(reverse, position)
+
+    def parse_position(self, queryset, position):
+        """ return the values of a cursor position as the types of the
+        fields, or annotations, of the ordering """
+        values = []
+        for order, value in zip(self.ordering, position):
+            name = order.lstrip('-')
+            annotation = queryset.query.annotations.get(name)
+            field = annotation.output_field if annotation is not None \
+                else queryset.model._meta.get_field(name)
+            try:
+                values.append(field.to_python(value))
+            except ValidationError:
+                # a tampered cursor, which would fail in the query
+                raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def encode_cursor(self, cursor):
+        tokens = {'p': cursor.position}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('utf-8')).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded,
+        )
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = []
+        for order in ordering:
+            name = order.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) \
+                else getattr(instance, name)
+            position.append(str(value))
+        return position
+
+
+class RecipeCursorPagination(KeysetCursorPagination):
+    """ keyset pagination for recipes, newest first """
+    # the cursor filters on id so every page is an index range scan on
+    # (user, id) instead of an OFFSET that grows with the page number
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        # ?ordering= may pick price or time, searches default to the rank
+        return recipe_ordering(
+            request.query_params,
+            ranked='rank' in queryset.query.annotations,
+        )
+
+
+class RecipeAttrCursorPagination(RecipeCursorPagination):
+    """ keyset pagination for tags and ingredients, ordered by name """
+    # id breaks ties between attributes sharing the same name
+    ordering = ('-name', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        # ?ordering= may pick the recipe count instead
+        return attr_ordering(request.query_params)
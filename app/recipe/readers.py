@@ -0,0 +1,201 @@
+"""
+Fast read path for the list and detail endpoints.
+
+A ValuesReader is built once per serializer class. It turns the
+serializer's fields into a flat list of per-column converters, then
+renders querysets from ``.values()`` rows and through-table rows, so no
+model instances or per-field serializer dispatch are involved. The
+output is the same as ``serializer_class(objs, many=True).data``.
+"""
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from recipe.filters import through_table
+from recipe.images import variant_urls
+
+# fields whose to_representation returns the database value unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField,
+    serializers.CharField,
+    serializers.BooleanField,
+)
+
+
+def scalar_converter(field):
+    """ return None if the field needs no conversion, else its converter """
+    if isinstance(field, PASSTHROUGH_FIELDS):
+        return None
+    return field.to_representation
+
+
+class ValuesReader:
+    """ renders the read-only output of a serializer from .values() rows """
+
+    def __init__(self, serializer_class, fields=None):
+        # imported here as the serializers module imports this one
+        from recipe.serializers import ImageVariantsField
+
+        serializer = serializer_class()
+        self.columns = []
+        # (name, kind, source, extra) in the serializer's field order
+        self.steps = []
+        for name, field in serializer.fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            if isinstance(field, serializers.ManyRelatedField):
+                self.steps.append((name, 'pks', field.source, None))
+            elif isinstance(field, serializers.ListSerializer):
+                nested = ValuesReader(type(field.child))
+                self.steps.append((name, 'nested', field.source, nested))
+            elif isinstance(field, ImageVariantsField):
+                self.columns += ['image', 'image_variants_ready']
+                self.steps.append((name, 'image_variants', None, None))
+            else:
+                self.columns.append(field.source)
+                self.steps.append(
+                    (name, 'scalar', field.source, scalar_converter(field))
+                )
+        if 'id' not in self.columns:
+            self.columns.insert(0, 'id')
+
+    def relations(self):
+        """ return (source, nested) of the relations the reader renders """
+        return [(source, kind == 'nested')
+                for name, kind, source, extra in self.steps
+                if kind in ('pks', 'nested')]
+
+    def values(self, queryset):
+        """ return the queryset as the rows this reader renders """
+        # the paginator reads the values the rows are ordered by
+        ordering = [name.lstrip('-') for name in queryset.query.order_by
+                    if name.lstrip('-') not in self.columns]
+        # relations are loaded by render, not by prefetching
+        return queryset.prefetch_related(None).values(
+            *self.columns, *ordering,
+        )
+
+    def _related(self, rows):
+        """ load the related ids and nested rows of the given rows """
+        ids = [row['id'] for row in rows]
+        related = {}
+        for name, kind, source, nested in self.steps:
+            if kind not in ('pks', 'nested'):
+                continue
+            through, column = through_table(source)
+            links = {}
+            for recipe_id, related_id in through.objects.filter(
+                recipe_id__in=ids,
+            ).order_by(column).values_list('recipe_id', column):
+                links.setdefault(recipe_id, []).append(related_id)
+
+            if kind == 'nested':
+                model = through._meta.get_field(column).related_model
+                related_ids = {pk for pks in links.values() for pk in pks}
+                nested_rows = nested.render(
+                    nested.values(model.objects.filter(id__in=related_ids))
+                )
+                by_id = {row['id']: row for row in nested_rows}
+                links = {
+                    recipe_id: [by_id[pk] for pk in pks]
+                    for recipe_id, pks in links.items()
+                }
+            related[name] = links
+        return related
+
+    def render(self, rows, request=None):
+        """ return the serialized form of a list of .values() rows """
+        rows = list(rows)
+        if not rows:
+            return []
+        related = self._related(rows)
+        steps = self.steps
+        data = []
+        for row in rows:
+            item = {}
+            for name, kind, source, extra in steps:
+                if kind == 'scalar':
+                    value = row[source]
+                    if extra is not None and value is not None:
+                        value = extra(value)
+                    item[name] = value
+                elif kind == 'image_variants':
+                    item[name] = variant_urls(row['image'], request) \
+                        if row['image'] and row['image_variants_ready'] \
+                        else None
+                else:
+                    item[name] = related[name].get(row['id'], [])
+            data.append(item)
+        return data
+
+
+_readers = {}
+
+
+def get_reader(serializer_class, fields=None):
+    """ return the cached reader of a serializer class and fieldset """
+    key = (serializer_class, fields)
+    reader = _readers.get(key)
+    if reader is None:
+        reader = _readers[key] = ValuesReader(serializer_class, fields)
+    return reader
+
+
+def view_reader(view):
+    """ return the reader of the serializer and fieldset of a view """
+    get_fields = getattr(view, 'get_serializer_fields', None)
+    return get_reader(view.get_serializer_class(),
+                      get_fields() if get_fields else None)
+
+
+def fast_reads():
+    """ return whether reads should bypass the DRF serializers """
+    return getattr(settings, 'RECIPE_API_FAST_READS', True)
+
+
+class FastListMixin:
+    """
+    Serves the list action through the ValuesReader of the serializer
+    class, unless settings.RECIPE_API_FAST_READS is False
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not fast_reads():
+            return super().list(request, *args, **kwargs)
+
+        reader = view_reader(self)
+        queryset = reader.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.render(page, request))
+        return Response(reader.render(queryset, request))
+
+
+class FastRetrieveMixin:
+    """
+    Serves the retrieve action through the ValuesReader of the serializer
+    class, unless settings.RECIPE_API_FAST_READS is False. Object level
+    permissions are not checked, the viewsets using this only rely on
+    IsAuthenticated and the user filter of get_queryset
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        if not fast_reads():
+            return super().retrieve(request, *args, **kwargs)
+
+        reader = view_reader(self)
+        # the same lookup get_object makes
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(**{
+                self.lookup_field: self.kwargs[lookup_url_kwarg],
+            })
+        except (TypeError, ValueError, ValidationError):
+            # a lookup value of the wrong type, as get_object_or_404 does
+            raise Http404
+        data = reader.render(reader.values(queryset), request)
+        if not data:
+            raise Http404
+        return Response(data[0])
@@ -0,0 +1,121 @@
+"""
+Full-text search over recipe titles, tag names and ingredient names.
+
+Recipe.search_vector stores the weighted tsvector of a recipe so searches
+are a GIN index lookup. recipe.signals refreshes it whenever a recipe, the
+name of one of its tags or ingredients, or its links change; writes that
+bypass signals call update_search_vectors themselves.
+
+Ranking reads the vector of every ranked row, so a search only ranks the
+newest MAX_CANDIDATES matches of settings.RECIPE_SEARCH, whatever the
+number of matches, and looks for common words in the RECENT_WINDOW newest
+recipes only. Results are ordered by rank, then id, and the cursor
+of recipe.pagination holds both, so equally ranked matches page through
+in id order.
+"""
+import heapq
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField, Subquery
+from django.db.models.functions import Cast, Coalesce
+
+from core.models import Name, Recipe
+from recipe.filters import through_table
+
+SEARCH_CONFIG = 'english'
+
+
+def _names_vector(relation, weight):
+    """ return the SQL of the weighted vector of a relation's names """
+    through, column = through_table(relation)
+    related = Recipe._meta.get_field(relation).related_model
+    # the canonical names, to_tsvector would lowercase the spellings anyway
+    return f"""setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+        SELECT string_agg(name.name, ' ')
+        FROM {related._meta.db_table} related
+        JOIN {through._meta.db_table} link ON link.{column} = related.id
+        JOIN {Name._meta.db_table} name ON name.id = related.canonical_id
+        WHERE link.recipe_id = recipe.id
+    ), '')), '{weight}')"""
+
+
+def update_search_vectors(recipes):
+    """ recompute the search vector of every recipe in the queryset """
+    ids_sql, params = recipes.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {Recipe._meta.db_table} recipe SET search_vector =
+                setweight(to_tsvector('{SEARCH_CONFIG}', recipe.title), 'A')
+                || {_names_vector('tags', 'B')}
+                || {_names_vector('ingredients', 'C')}
+            WHERE recipe.id IN ({ids_sql})
+        """, params)
+
+
+def update_search_vectors_of(model, ids):
+    """ refresh the given recipes, or the recipes using the given tags or
+    ingredients """
+    if model is Recipe:
+        update_search_vectors(Recipe.objects.filter(id__in=ids))
+        return
+    relation = next(field.name for field in Recipe._meta.many_to_many
+                    if field.related_model is model)
+    through, column = through_table(relation)
+    update_search_vectors(Recipe.objects.filter(id__in=through.objects.filter(
+        **{f'{column}__in': ids}
+    ).values('recipe_id')))
+
+
+def search_settings():
+    """ return settings.RECIPE_SEARCH completed with the defaults """
+    options = {
+        'MAX_CANDIDATES': 500,
+        'RECENT_WINDOW': 20000,
+    }
+    options.update(getattr(settings, 'RECIPE_SEARCH', {}))
+    return options
+
+
+def newest_matches(queryset, matches, limit, window):
+    """ return the ids of the newest limit matches among the newest window
+    rows of the queryset, or among all rows for words too rare to fill a
+    tenth of limit there """
+    # walking the (user, id) index newest first stops after limit matches
+    # of a common word, but the planner also walks it for rare words it
+    # takes for common ones, reading every row of the user. The walk is
+    # kept to the rows from the window-th newest one
+    boundary = Coalesce(Subquery(
+        queryset.order_by('-id').values('id')[window - 1:window],
+    ), 0)
+    ids = list(
+        matches.filter(id__gte=boundary).order_by('-id')
+        .values_list('id', flat=True)[:limit]
+    )
+    if len(ids) < limit // 10:
+        # a rare word, whose few matches come from the GIN index: without
+        # an ORDER BY and LIMIT the planner has no walk to prefer, nor an
+        # id range to intersect. Reading every match of commoner words
+        # would cost more than the window saved
+        ids = heapq.nlargest(limit, matches.order_by().values_list(
+            'id', flat=True,
+        ))
+    return ids
+
+
+def search_recipes(queryset, text):
+    """ filter the newest recipes matching the text, annotated with their
+    rank """
+    query = SearchQuery(text, config=SEARCH_CONFIG)
+    options = search_settings()
+    ids = newest_matches(
+        queryset,
+        queryset.filter(search_vector=query),
+        options['MAX_CANDIDATES'],
+        options['RECENT_WINDOW'],
+    )
+    # ts_rank returns a real, the cast keeps the rank exact in cursors
+    return queryset.filter(id__in=ids).annotate(
+        rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+    )
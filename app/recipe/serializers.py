@@ -1,9 +1,15 @@
 from rest_framework import serializers
 from core.models import Tag, Ingredient, Recipe
+from recipe.bulk import BulkListSerializer
+from recipe.fields import UserPrimaryKeyRelatedField
+from recipe.fieldsets import SparseFieldsMixin
+from recipe.images import variant_urls
 
 
 class TagSerializer(serializers.ModelSerializer):
     """ serializer for tag object """
+    # stored through the canonical names, not a column of the model
+    name = serializers.CharField(max_length=255)
 
     class Meta:
         model = Tag
@@ -13,6 +19,7 @@ class TagSerializer(serializers.ModelSerializer):
 
 class IngredientSerializer(serializers.ModelSerializer):
     """ Serializer for ingredient object """
+    name = serializers.CharField(max_length=255)
 
     class Meta:
         model = Ingredient
@@ -20,23 +27,57 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class TagCountSerializer(TagSerializer):
+    """ serializer for tag object with the number of recipes using it """
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count', 'last_used']
+        read_only_fields = fields
+
+
+class IngredientCountSerializer(IngredientSerializer):
+    """ Serializer for ingredient object with the number of recipes """
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + (
+            'recipe_count', 'last_used',
+        )
+        read_only_fields = fields
+
+
+class ImageVariantsField(serializers.Field):
+    """ urls of the resized copies of a recipe image, null until ready """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image or not recipe.image_variants_ready:
+            return None
+        return variant_urls(recipe.image.name, self.context.get('request'))
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """ serialize the recipe model """
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all(),
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
     # read the PrimaryKeyRelatedField docs included in 63th session
+    # the ids are looked up together and limited to the user's own objects
+    image_variants = ImageVariantsField()
 
 
     class Meta:
         model = Recipe
         fields = ('id', 'title', 'ingredients',
-                  'tags', 'time_minutes', 'price'
+                  'tags', 'time_minutes', 'price', 'image_variants'
                  )
         read_only_fields = ('id',)
         # prevent the user from updating the id
@@ -47,10 +88,78 @@ class RecipeDetailSerializer(RecipeSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
+# serializers of the relations ?expand= nests in recipe lists
+NESTED_SERIALIZERS = {
+    'tags': TagSerializer,
+    'ingredients': IngredientSerializer,
+}
+_expanded_serializers = {}
+
+
+def expanded_recipe_serializer(expand):
+    """ return the recipe serializer nesting the given relations """
+    expand = frozenset(expand)
+    if not expand:
+        return RecipeSerializer
+    if expand == set(NESTED_SERIALIZERS):
+        return RecipeDetailSerializer
+    # one class per combination, so readers are built once for each
+    serializer_class = _expanded_serializers.get(expand)
+    if serializer_class is None:
+        serializer_class = _expanded_serializers[expand] = type(
+            'RecipeExpandedSerializer', (RecipeSerializer,), {
+                name: NESTED_SERIALIZERS[name](many=True, read_only=True)
+                for name in expand
+            },
+        )
+    return serializer_class
+
+
+class BulkTagSerializer(TagSerializer):
+    """ serializer for tags written through the bulk endpoint """
+    id = serializers.IntegerField(required=False)
+
+    class Meta(TagSerializer.Meta):
+        list_serializer_class = BulkListSerializer
+
+
+class BulkIngredientSerializer(IngredientSerializer):
+    """ serializer for ingredients written through the bulk endpoint """
+    id = serializers.IntegerField(required=False)
+
+    class Meta(IngredientSerializer.Meta):
+        list_serializer_class = BulkListSerializer
+
+
+class BulkRecipeSerializer(RecipeSerializer):
+    """ serializer for recipes written through the bulk endpoint """
+    # related ids are checked for the whole list at once by
+    # BulkListSerializer instead of one query per id
+    id = serializers.IntegerField(required=False)
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+    )
+
+    class Meta(RecipeSerializer.Meta):
+        list_serializer_class = BulkListSerializer
+        bulk_relations = ('tags', 'ingredients')
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
     """ serializer for uploading images to recipies """
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id','image')
+        fields = ('id','image', 'image_variants')
         read_only_fields = ('id',)
+
+    def update(self, instance, validated_data):
+        """ store the new image, its variants are generated later """
+        validated_data['image_variants_ready'] = False
+        return super().update(instance, validated_data)
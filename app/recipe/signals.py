@@ -0,0 +1,140 @@
+from collections import Counter
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+                                     pre_delete
+from django.dispatch import receiver
+
+from core.models import Tag, Ingredient, Recipe
+from recipe.cache import invalidate
+from recipe.counters import change_recipe_counts, link_deltas, linked_ids
+from recipe.images import discard_variants
+from recipe.search import update_search_vectors
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_user_responses(sender, instance, **kwargs):
+    """ invalidate the cached responses of the owner of a changed object """
+    invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, update_fields, **kwargs):
+    """ refresh the search vector of a saved recipe """
+    if update_fields is None or 'title' in update_fields:
+        update_search_vectors(Recipe.objects.filter(id=instance.id))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def update_search_vectors_on_rename(sender, instance, created, **kwargs):
+    """ refresh the search vectors of the recipes using a saved name """
+    if not created:
+        update_search_vectors(instance.recipe_set.all())
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_linked_recipes(sender, instance, **kwargs):
+    # the links are gone by the time post_delete is sent
+    instance._linked_recipe_ids = list(
+        instance.recipe_set.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_search_vectors_on_delete(sender, instance, **kwargs):
+    """ drop a deleted name from the search vectors of its recipes """
+    recipe_ids = getattr(instance, '_linked_recipe_ids', None)
+    if recipe_ids:
+        update_search_vectors(Recipe.objects.filter(id__in=recipe_ids))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_recipes_on_links(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    """
+    Invalidate cached responses and refresh the search vector of recipes
+    whose tags or ingredients change
+    """
+    if action == 'pre_clear' and reverse:
+        # pk_set is None when clearing, remember who is cleared
+        instance._linked_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    if not action.startswith('post_'):
+        return
+    # instance is the recipe, or the tag/ingredient for reverse changes
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'post_clear':
+        recipe_ids = getattr(instance, '_linked_recipe_ids', None)
+    else:
+        recipe_ids = pk_set
+    if recipe_ids:
+        update_search_vectors(Recipe.objects.filter(id__in=recipe_ids))
+    invalidate(instance.user_id)
+
+
+RELATIONS = {
+    Recipe.tags.through: 'tags',
+    Recipe.ingredients.through: 'ingredients',
+}
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_recipe_counts(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    """ keep the recipe counters of linked tags and ingredients """
+    relation = RELATIONS[sender]
+    if action in ('pre_remove', 'pre_clear'):
+        # pk_set holds every id asked for, only existing links count
+        if action == 'pre_clear':
+            pk_set = None
+        if reverse:
+            removed = linked_ids(relation, pk_set, [instance.pk])
+        else:
+            removed = linked_ids(relation, [instance.pk], pk_set)
+        instance._removed_links = removed
+    elif action in ('post_remove', 'post_clear'):
+        removed = getattr(instance, '_removed_links', Counter())
+        change_recipe_counts(relation, link_deltas(removed, Counter()))
+    elif action == 'post_add' and pk_set:
+        # pk_set only holds the links that were really added
+        if reverse:
+            added = Counter({instance.pk: len(pk_set)})
+        else:
+            added = Counter(pk_set)
+        change_recipe_counts(
+            relation, link_deltas(Counter(), added), used=set(added),
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_recipe_links(sender, instance, **kwargs):
+    # the links are deleted with the recipe without m2m_changed signals
+    instance._deleted_links = {
+        relation: linked_ids(relation, [instance.pk])
+        for relation in RELATIONS.values()
+    }
+
+
+@receiver(post_delete, sender=Recipe)
+def update_recipe_counts_on_delete(sender, instance, **kwargs):
+    """ uncount a deleted recipe from its tags and ingredients """
+    for relation, removed in getattr(instance, '_deleted_links', {}).items():
+        change_recipe_counts(relation, link_deltas(removed, Counter()))
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_image_variants(sender, instance, **kwargs):
+    """ remove the resized copies of a deleted recipe's image """
+    if instance.image:
+        discard_variants(instance.image.name)
@@ -0,0 +1,94 @@
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework import renderers
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def encoder():
+    """ return an encoder producing the same bytes as the JSON renderer """
+    return JSONEncoder(
+        ensure_ascii=not api_settings.UNICODE_JSON,
+        separators=(',', ':') if api_settings.COMPACT_JSON else None,
+    )
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """ renders one JSON document per line (newline delimited JSON) """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        json_encoder = encoder()
+        return b''.join(
+            json_encoder.encode(item).encode('utf-8') + b'\n'
+            for item in items
+        )
+
+
+class StreamingListMixin:
+    """
+    Streams the list action when asked for with ?stream=1 or an
+    application/x-ndjson Accept header. Rows are read through a server
+    side cursor and serialized a chunk at a time, so memory does not grow
+    with the number of objects and the first bytes go out straight away
+    """
+    stream_chunk_size = 500
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [
+        NDJSONRenderer,
+    ]
+
+    def _wants_stream(self, request):
+        return request.accepted_renderer.format == 'ndjson' or \
+            request.query_params.get('stream') in ('1', 'true')
+
+    def _serialized_chunks(self, queryset):
+        """ yield lists of serialized objects of up to the chunk size """
+        # iterator() ignores prefetch_related, so the lookups are applied
+        # to every chunk instead
+        lookups = queryset._prefetch_related_lookups
+        chunk = []
+        for obj in queryset.iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(obj)
+            if len(chunk) == self.stream_chunk_size:
+                prefetch_related_objects(chunk, *lookups)
+                yield self.get_serializer(chunk, many=True).data
+                chunk = []
+        if chunk:
+            prefetch_related_objects(chunk, *lookups)
+            yield self.get_serializer(chunk, many=True).data
+
+    def _stream_json(self, queryset):
+        json_encoder = encoder()
+        separator = b''
+        yield b'['
+        for items in self._serialized_chunks(queryset):
+            for item in items:
+                yield separator + json_encoder.encode(item).encode('utf-8')
+                separator = b','
+        yield b']'
+
+    def _stream_ndjson(self, queryset):
+        json_encoder = encoder()
+        for items in self._serialized_chunks(queryset):
+            yield b''.join(
+                json_encoder.encode(item).encode('utf-8') + b'\n'
+                for item in items
+            )
+
+    def list(self, request, *args, **kwargs):
+        if not self._wants_stream(request):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if request.accepted_renderer.format == 'ndjson':
+            content = self._stream_ndjson(queryset)
+            content_type = NDJSONRenderer.media_type
+        else:
+            content = self._stream_json(queryset)
+            content_type = 'application/json'
+        return StreamingHttpResponse(content, content_type=content_type)
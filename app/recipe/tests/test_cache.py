@@ -0,0 +1,266 @@
+import time
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from django.utils.http import http_date
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+from recipe.cache import _version_key, get_cache, stats
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+BULK_TAGS_URL = reverse('recipe:tag-bulk')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ResponseCacheTests(TestCase):
+    """ Test the per user cache of the read responses """
+
+    def setUp(self):
+        # the local memory cache outlives the test transactions
+        get_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            'test@eniac.com',
+            'testpass',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=5.00,
+        )
+
+    def test_second_read_is_cached(self):
+        """ test a repeated read is served from the cache """
+        first = self.client.get(RECIPES_URL)
+        with self.assertNumQueries(0):
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(stats(), {'hits': 1, 'misses': 1})
+
+    def test_query_params_are_part_of_the_key(self):
+        """ test reads with different filters are cached separately """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL, {'tags': f'{tag.id}'})
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'], [])
+
+    def test_save_invalidates(self):
+        """ test changing a recipe invalidates the cached reads """
+        self.client.get(detail_url(self.recipe.id))
+        self.recipe.title = 'Changed'
+        self.recipe.save()
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['title'], 'Changed')
+
+    def test_delete_invalidates(self):
+        """ test deleting a tag invalidates the cached tag list """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+        tag.delete()
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'], [])
+
+    def test_m2m_change_invalidates(self):
+        """ test adding an ingredient to a recipe invalidates the reads """
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        self.client.get(RECIPES_URL)
+        self.recipe.ingredients.add(ingredient)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'][0]['ingredients'],
+                         [ingredient.id])
+
+    def test_bulk_write_invalidates(self):
+        """ test bulk created tags show up in the next read """
+        self.client.get(TAGS_URL)
+        self.client.post(BULK_TAGS_URL, [{'name': 'Vegan'}], format='json')
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_cache_is_per_user(self):
+        """ test a user never gets the cached reads of another user """
+        self.client.get(RECIPES_URL)
+        other = get_user_model().objects.create_user(
+            'other@eniac.com',
+            'testpass',
+        )
+        client = APIClient()
+        client.force_authenticate(other)
+
+        res = client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'], [])
+
+    def test_other_users_changes_keep_cache(self):
+        """ test changes by another user leave the cached reads valid """
+        self.client.get(TAGS_URL)
+        other = get_user_model().objects.create_user(
+            'other@eniac.com',
+            'testpass',
+        )
+        Tag.objects.create(user=other, name='Vegan')
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+
+    def test_stats_command(self):
+        """ test the counters are printed by the management command """
+        self.client.get(TAGS_URL)
+        self.client.get(TAGS_URL)
+        out = StringIO()
+
+        call_command('api_cache_stats', stdout=out)
+
+        self.assertIn('hits: 1 misses: 1', out.getvalue())
+
+    @override_settings(RECIPE_API_CACHE={'ENABLED': False})
+    def test_disabled(self):
+        """ test reads are neither cached nor tagged when the cache is off """
+        self.client.get(RECIPES_URL)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Cache', res)
+        self.assertNotIn('ETag', res)
+        self.assertEqual(stats(), {'hits': 0, 'misses': 0})
+
+
+class ConditionalReadTests(TestCase):
+    """ Test the ETag validators of the read responses """
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            'test@eniac.com',
+            'testpass',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=5.00,
+        )
+
+    def age_version(self, seconds):
+        """ move the user's last change the given seconds back, return
+        the time of it in seconds """
+        version = time.time_ns() - seconds * 10 ** 9
+        get_cache().set(_version_key(self.user.id), version, None)
+        return version // 10 ** 9
+
+    def test_validators_are_set(self):
+        """ test reads carry a strong ETag, and the time of the last change
+        once it is a second old """
+        res = self.client.get(RECIPES_URL)
+        self.assertTrue(res['ETag'].startswith('"'))
+        self.assertNotIn('Last-Modified', res)
+
+        changed = self.age_version(5)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res['Last-Modified'], http_date(changed))
+
+    def test_if_modified_since_not_modified(self):
+        """ test a date at or after the last change gets a 304 """
+        date = http_date(self.age_version(5))
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPES_URL, HTTP_IF_MODIFIED_SINCE=date)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['Last-Modified'], date)
+
+    def test_etag_decides_over_date(self):
+        """ test a stale ETag gets the data whatever the date says """
+        date = http_date(self.age_version(5))
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_MODIFIED_SINCE=date,
+                              HTTP_IF_NONE_MATCH='"stale"')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_matching_etag_not_modified(self):
+        """ test a matching If-None-Match gets a 304 without queries """
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(detail_url(self.recipe.id),
+                                  HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(res.content, b'')
+
+    def test_etag_depends_on_query_params(self):
+        """ test differently filtered lists get different ETags """
+        first = self.client.get(TAGS_URL)
+        second = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_change_moves_etag(self):
+        """ test a change answers the old ETag with the new data """
+        etag = self.client.get(RECIPES_URL)['ETag']
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['results'][0]['tags'], [tag.id])
+
+    def test_if_modified_since_ignored(self):
+        """ test a date alone never gets a 304, even right after a change """
+        date = http_date()
+        self.client.get(TAGS_URL)
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TAGS_URL, HTTP_IF_MODIFIED_SINCE=date)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['name'], 'Vegan')
+
+    def test_change_after_date_modified(self):
+        """ test a change after the date is not answered with a 304 """
+        date = http_date(self.age_version(5))
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TAGS_URL, HTTP_IF_MODIFIED_SINCE=date)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['name'], 'Vegan')
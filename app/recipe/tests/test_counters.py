@@ -0,0 +1,108 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+BULK_RECIPES_URL = reverse('recipe:recipe-bulk')
+
+
+class RecipeCounterTests(TestCase):
+    """ Test the recipe counters kept on tags and ingredients """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@eniac.com',
+            'testpass',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user,
+            name='Salt',
+        )
+        self.recipes = [
+            Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=10,
+                price=5.00,
+            )
+            for i in range(3)
+        ]
+
+    def assertCounts(self, tag_count, ingredient_count):
+        self.tag.refresh_from_db()
+        self.ingredient.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, tag_count)
+        self.assertEqual(self.ingredient.recipe_count, ingredient_count)
+
+    def test_add_and_remove(self):
+        """ test adding and removing links from the recipe side """
+        for recipe in self.recipes:
+            recipe.tags.add(self.tag)
+            recipe.ingredients.add(self.ingredient)
+        # adding an existing link again changes nothing
+        self.recipes[0].tags.add(self.tag)
+        self.assertCounts(3, 3)
+        self.assertIsNotNone(self.tag.last_used)
+
+        self.recipes[0].tags.remove(self.tag)
+        # removing a missing link changes nothing either
+        self.recipes[0].tags.remove(self.tag)
+        self.recipes[1].ingredients.clear()
+        self.assertCounts(2, 2)
+
+    def test_reverse_add_and_clear(self):
+        """ test adding and clearing links from the tag side """
+        self.tag.recipe_set.add(*self.recipes)
+        self.assertCounts(3, 0)
+
+        self.tag.recipe_set.remove(self.recipes[0])
+        self.assertCounts(2, 0)
+        self.tag.recipe_set.clear()
+        self.assertCounts(0, 0)
+
+    def test_recipe_delete(self):
+        """ test deleting recipes uncounts them """
+        for recipe in self.recipes:
+            recipe.tags.add(self.tag)
+        self.recipes[0].delete()
+        Recipe.objects.filter(id=self.recipes[1].id).delete()
+
+        self.assertCounts(1, 0)
+
+    def test_bulk_writes(self):
+        """ test recipes written in bulk are counted """
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.post(BULK_RECIPES_URL, [
+            {'title': 'Pancakes', 'time_minutes': 5, 'price': '3.00',
+             'tags': [self.tag.id], 'ingredients': [self.ingredient.id]},
+            {'title': 'Porridge', 'time_minutes': 3, 'price': '2.00',
+             'tags': [self.tag.id]},
+        ], format='json')
+        self.assertCounts(2, 1)
+
+        recipe = Recipe.objects.get(title='Porridge')
+        client.patch(BULK_RECIPES_URL, [
+            {'id': recipe.id, 'tags': [], 'ingredients': [self.ingredient.id]},
+        ], format='json')
+        self.assertCounts(1, 2)
+
+    def test_reconcile_command(self):
+        """ test the command recomputes counters that drifted """
+        for recipe in self.recipes[:2]:
+            recipe.tags.add(self.tag)
+        Tag.objects.update(recipe_count=10, last_used=None)
+
+        call_command('reconcile_recipe_counts', batch_size=1,
+                     stdout=StringIO())
+
+        self.assertCounts(2, 0)
+        self.assertIsNotNone(self.tag.last_used)
+        self.assertIsNone(self.ingredient.last_used)
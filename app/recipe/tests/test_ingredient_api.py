@@ -1,14 +1,22 @@
+import json
+from unittest.mock import MagicMock, patch
+
 from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection, transaction
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Ingredient, Recipe
 from recipe.serializers import IngredientSerializer
+from recipe import typeahead
+from recipe.typeahead import matching_names, similar_names, \
+                              trigram_available
 
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+TYPEAHEAD_URL = reverse('recipe:ingredient-typeahead')
 
 
 class PublicIngredientApiTest(TestCase):
@@ -45,7 +53,21 @@ class PrivateIngredientApiTest(TestCase):
         serializer = IngredientSerializer(ingredients, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_stream_ingredients_as_ndjson(self):
+        """ test an ndjson Accept header streams one ingredient per line """
+        Ingredient.objects.create(user=self.user, name='Kale')
+        Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.get(INGREDIENTS_URL,
+                              HTTP_ACCEPT='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines],
+                         ['Salt', 'Kale'])
 
     def test_ingredients_limited_to_user(self):
         """test that ingredients for the authenticated user are returned"""
@@ -65,8 +87,8 @@ class PrivateIngredientApiTest(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredients.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredients.name)
 
     def test_create_ingredient_successful(self):
         """ test create a new ingredient """
@@ -111,8 +133,8 @@ class PrivateIngredientApiTest(TestCase):
 
         serializer1 = IngredientSerializer(ingredient1)
         serializer2 = IngredientSerializer(ingredient2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_retrieve_ingredient_assinged_unique(self):
         """Test filtering ingredients by assigned returns unique items"""
@@ -138,4 +160,214 @@ class PrivateIngredientApiTest(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_retrieve_ingredients_with_counts(self):
+        """ Test listing ingredients with the number of recipes using them """
+        ingredient1 = Ingredient.objects.create(user=self.user, name='Eggs')
+        ingredient2 = Ingredient.objects.create(user=self.user, name='Bacon')
+        Ingredient.objects.create(user=self.user, name='Apples')
+        for title in ['Omelette', 'Carbonara']:
+            recipe = Recipe.objects.create(
+                title=title,
+                time_minutes=10,
+                price=5.00,
+                user=self.user,
+            )
+            recipe.ingredients.add(ingredient1)
+        recipe.ingredients.add(ingredient2)
+
+        res = self.client.get(
+            INGREDIENTS_URL, {'assigned_only': 1, 'with_counts': 1}
+        )
+
+        self.assertEqual(
+            [(item['id'], item['name'], item['recipe_count'])
+             for item in res.data['results']],
+            [(ingredient1.id, 'Eggs', 2), (ingredient2.id, 'Bacon', 1)],
+        )
+
+    def test_typeahead_prefix(self):
+        """ test the typeahead lists the user's names starting with q """
+        chili = Ingredient.objects.create(user=self.user, name='Chili')
+        chives = Ingredient.objects.create(user=self.user, name='chives')
+        Ingredient.objects.create(user=self.user, name='Salt')
+        user2 = get_user_model().objects.create_user(
+            'other@eniac.com',
+            'testpass',
+        )
+        Ingredient.objects.create(user=user2, name='Chicken')
+
+        res = self.client.get(TYPEAHEAD_URL, {'q': 'CHI'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': chili.id, 'name': 'Chili'},
+            {'id': chives.id, 'name': 'chives'},
+        ])
+
+    def test_typeahead_limit(self):
+        """ test the typeahead returns at most limit names """
+        for name in ['Chili', 'Chives', 'Chickpeas']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TYPEAHEAD_URL, {'q': 'chi', 'limit': 2})
+
+        self.assertEqual([item['name'] for item in res.data],
+                         ['Chickpeas', 'Chili'])
+
+    def test_typeahead_invalid(self):
+        """ test the typeahead needs a text and a bounded limit """
+        res = self.client.get(TYPEAHEAD_URL)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(TYPEAHEAD_URL, {'q': 'chi', 'limit': 1000})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_typeahead_cached_until_change(self):
+        """ test repeated typeaheads are answered from memory """
+        Ingredient.objects.create(user=self.user, name='Chili')
+        self.client.get(TYPEAHEAD_URL, {'q': 'chi'})
+
+        with self.assertNumQueries(0):
+            res = self.client.get(TYPEAHEAD_URL, {'q': 'Chi'})
         self.assertEqual(len(res.data), 1)
+
+        Ingredient.objects.create(user=self.user, name='Chives')
+        res = self.client.get(TYPEAHEAD_URL, {'q': 'chi'})
+        self.assertEqual(len(res.data), 2)
+
+    @override_settings(RECIPE_API_CACHE={'ENABLED': False})
+    def test_typeahead_not_cached_without_versions(self):
+        """ test answers aren't kept when the change versions are off """
+        Ingredient.objects.create(user=self.user, name='Chili')
+        self.client.get(TYPEAHEAD_URL, {'q': 'chi'})
+        # as another process would, change it without bumping the version
+        Ingredient.objects.bulk_create(
+            [Ingredient(user=self.user, name='Chives')],
+        )
+
+        res = self.client.get(TYPEAHEAD_URL, {'q': 'chi'})
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_typeahead_similar_names(self):
+        """ test names similar to q follow the names starting with it """
+        if not trigram_available():
+            self.skipTest('the pg_trgm extension is not installed')
+        tomato = Ingredient.objects.create(user=self.user, name='Tomato')
+        cherry = Ingredient.objects.create(user=self.user,
+                                           name='Cherry tomatoes')
+        Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.get(TYPEAHEAD_URL, {'q': 'tomat'})
+
+        self.assertEqual([item['id'] for item in res.data],
+                         [tomato.id, cherry.id])
+
+    def test_similar_names_on_read_database(self):
+        """ test the trigram lookup is timed out where the queryset reads """
+        queryset = MagicMock(db='replica_1')
+        with patch('recipe.typeahead.connections') as connections, \
+                patch('recipe.typeahead.transaction.atomic') as atomic:
+            similar_names(queryset, 'tomat', 5)
+
+        atomic.assert_called_once_with(using='replica_1')
+        connections.__getitem__.assert_called_once_with('replica_1')
+        cursor = connections['replica_1'].cursor.return_value.__enter__()
+        cursor.execute.assert_called_once_with(
+            'SET LOCAL statement_timeout = %s', [50],
+        )
+
+    def test_prefix_names_on_read_database(self):
+        """ test the prefix lookup is timed out where the queryset reads """
+        queryset = MagicMock(db='replica_1')
+        with patch('recipe.typeahead.connections') as connections, \
+                patch('recipe.typeahead.transaction.atomic') as atomic, \
+                patch('recipe.typeahead.trigram_available',
+                      return_value=False):
+            matching_names(queryset, 'Tomat', 5)
+
+        queryset.filter.assert_called_once_with(
+            canonical__name__startswith='tomat',
+        )
+        atomic.assert_called_once_with(using='replica_1')
+        cursor = connections['replica_1'].cursor.return_value.__enter__()
+        cursor.execute.assert_called_once_with(
+            'SET LOCAL statement_timeout = %s', [50],
+        )
+
+    def test_prefix_names_timed_out(self):
+        """ test a prefix lookup running past the timeout matches nothing """
+        Ingredient.objects.create(user=self.user, name='Tomato')
+        with patch('recipe.typeahead.timed_rows',
+                   side_effect=OperationalError('canceling statement')), \
+                self.assertLogs('recipe.typeahead', 'WARNING'):
+            res = self.client.get(TYPEAHEAD_URL, {'q': 'tomat'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+
+    def test_prefix_names_plan_uses_pattern_index(self):
+        """ test prefix lookups range scan an index of the canonical
+        names """
+        Ingredient.objects.bulk_create(
+            Ingredient(user=self.user, name=f'Tomato {i}')
+            for i in range(2000)
+        )
+        queryset = Ingredient.objects.filter(
+            user=self.user, canonical__name__startswith='tomato 12',
+        )
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE core_name')
+                cursor.execute('ANALYZE core_ingredient')
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+
+        # through the unique index under the C collation, else through
+        # the varchar_pattern_ops one Django adds
+        index_cond = next(line for line in plan.splitlines()
+                          if 'Index Cond' in line and 'tomato 12' in line)
+        self.assertIn(">= 'tomato 12'", index_cond)
+
+    def test_trigram_available_by_database(self):
+        """ test the extension is looked up in each database on its own """
+        with patch.dict(typeahead._trigram_available, clear=True), \
+                patch('recipe.typeahead.connections') as connections:
+            cursor = connections['replica_1'].cursor.return_value.__enter__()
+            cursor.fetchone.return_value = None
+            connections.reset_mock()
+
+            self.assertFalse(trigram_available('replica_1'))
+            self.assertFalse(trigram_available('replica_1'))
+
+            connections.__getitem__.assert_called_once_with('replica_1')
+            self.assertEqual(typeahead._trigram_available,
+                             {'replica_1': False})
+
+    def test_similar_names_plan_uses_trigram_index(self):
+        """ test trigram lookups find the canonical names through their
+        index, then the user's rows of them """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_indexes "
+                "WHERE indexname = 'core_name_name_trgm'"
+            )
+            if cursor.fetchone() is None:
+                self.skipTest('pg_trgm is not installed')
+        other = get_user_model().objects.create_user('other@eniac.com', 'pw')
+        Ingredient.objects.bulk_create(
+            Ingredient(user=user, name=f'Tomato {i}')
+            for user in (self.user, other) for i in range(500)
+        )
+        queryset = Ingredient.objects.filter(
+            user=self.user, canonical__name__trigram_similar='tomat',
+        )
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE core_name')
+                cursor.execute('ANALYZE core_ingredient')
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+
+        self.assertIn('core_name_name_trgm', plan)
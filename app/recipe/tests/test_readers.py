@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Tag, Ingredient, Recipe
+from recipe import serializers
+from recipe.readers import get_reader
+
+
+def ordered_recipes():
+    """ return recipes with relations ordered like the reader orders them """
+    return Recipe.objects.prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.order_by('id')),
+        Prefetch('ingredients', queryset=Ingredient.objects.order_by('id')),
+    )
+
+
+class ValuesReaderTests(TestCase):
+    """ Test the values based read path matches the serializers """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@eniac.com',
+            'testpass',
+        )
+        tags = [Tag.objects.create(user=self.user, name=f'tag {i}')
+                for i in range(3)]
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=f'ingredient {i}')
+            for i in range(3)
+        ]
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'recipe {i}',
+                time_minutes=i,
+                price='4.50',
+                image='uploads/recipe/image.jpg' if i else None,
+                image_variants_ready=bool(i % 2),
+            )
+            recipe.tags.add(*tags[:i])
+            recipe.ingredients.add(*ingredients[i:])
+
+    def assertRendersLikeSerializer(self, serializer_class, queryset):
+        """ assert the reader renders the same bytes as the serializer """
+        expected = serializer_class(queryset, many=True).data
+        reader = get_reader(serializer_class)
+        actual = reader.render(reader.values(queryset))
+
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(actual), renderer.render(expected))
+
+    def test_recipe_list(self):
+        """ test the recipe list output is byte identical """
+        self.assertRendersLikeSerializer(
+            serializers.RecipeSerializer, ordered_recipes().order_by('-id'),
+        )
+
+    def test_recipe_detail(self):
+        """ test the nested recipe detail output is byte identical """
+        self.assertRendersLikeSerializer(
+            serializers.RecipeDetailSerializer,
+            ordered_recipes().order_by('id'),
+        )
+
+    def test_tags_and_ingredients(self):
+        """ test the tag and ingredient output is byte identical """
+        self.assertRendersLikeSerializer(
+            serializers.TagSerializer, Tag.objects.order_by('-name'),
+        )
+        self.assertRendersLikeSerializer(
+            serializers.IngredientSerializer,
+            Ingredient.objects.order_by('-name'),
+        )
+
+    def test_reader_queries(self):
+        """ test a recipe list costs one query plus one per relation """
+        reader = get_reader(serializers.RecipeSerializer)
+
+        with self.assertNumQueries(3):
+            reader.render(reader.values(Recipe.objects.all()))
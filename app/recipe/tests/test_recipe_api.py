@@ -1,10 +1,15 @@
 # Testing Upload image feature
 import tempfile
 import os
+import json
+from base64 import b64encode
 from PIL import Image
 # ----------------
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework import test
@@ -13,10 +18,15 @@ from rest_framework.test import APIClient
 
 
 from core.models import Recipe, Tag, Ingredient
+from recipe.cache import get_cache
+from recipe.filters import filter_recipes_by_range, recipe_ordering
+from recipe.images import delete_variants, variant_path
+from recipe.search import update_search_vectors
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 
 RECIPES_URL = reverse('recipe:recipe-list')  # generated by viewsets
+BULK_RECIPES_URL = reverse('recipe:recipe-bulk')
 
 # /api/recipe/recipes
 # /api/recipe/recipes/1/
@@ -46,6 +56,20 @@ def sample_recipe(user, **params):
     defaults.update(params)  # default built-in function of python for dics
     return Recipe.objects.create(user=user, **defaults)
 
+def sample_recipes_with_relations(user, count):
+    """ create recipes that each have a tag and an ingredient """
+    for i in range(count):
+        recipe = sample_recipe(user=user, title=f'recipe {i}')
+        recipe.tags.add(sample_tag(user=user, name=f'tag {i}'))
+        recipe.ingredients.add(sample_ingredient(user=user, name=f'ing {i}'))
+
+def count_queries(client, url):
+    """ return the number of queries issued while requesting the url """
+    with CaptureQueriesContext(connection) as ctx:
+        res = client.get(url)
+    assert res.status_code == status.HTTP_200_OK
+    return len(ctx.captured_queries)
+
 def image_upload_url(recipe_id):
     """ Return Url for recipe image upload """
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
@@ -85,7 +109,7 @@ class PrivateRecipeApiTest(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         """ test retrieving recipes for user """
@@ -104,8 +128,8 @@ class PrivateRecipeApiTest(TestCase):
         serializer = RecipeSerializer(recipes, many=True)  # because its a list
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_view_recipe_detail(self):
         """ tests viewing a recipe detail """
@@ -119,6 +143,486 @@ class PrivateRecipeApiTest(TestCase):
         serializer = RecipeDetailSerializer(recipe) # it is a single object
         self.assertEqual(res.data, serializer.data)
 
+    def test_detail_not_found(self):
+        """ test a missing or non integer recipe id is a 404 """
+        res = self.client.get(detail_url('abc'))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        res = self.client.get(detail_url(sample_recipe(self.user).id + 1))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_query_count_is_constant(self):
+        """ test listing recipes does not issue a query per recipe """
+        sample_recipes_with_relations(self.user, 2)
+        few = count_queries(self.client, RECIPES_URL)
+
+        sample_recipes_with_relations(self.user, 10)
+        many = count_queries(self.client, RECIPES_URL)
+
+        self.assertEqual(few, many)
+
+    def test_detail_query_count_is_constant(self):
+        """ test viewing a recipe does not query per related object """
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+        recipe.ingredients.add(sample_ingredient(user=self.user))
+        few = count_queries(self.client, detail_url(recipe.id))
+
+        for i in range(10):
+            recipe.tags.add(sample_tag(user=self.user, name=f'tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'ing {i}')
+            )
+        many = count_queries(self.client, detail_url(recipe.id))
+
+        self.assertEqual(few, many)
+
+    def test_stream_recipes_as_json(self):
+        """ test ?stream=1 streams the whole unpaginated list """
+        sample_recipes_with_relations(self.user, 3)
+
+        res = self.client.get(RECIPES_URL, {'stream': 1, 'page_size': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+        serializer = RecipeSerializer(recipes, many=True)
+        body = b''.join(res.streaming_content)
+        self.assertEqual(json.loads(body.decode()), serializer.data)
+
+    def test_stream_recipes_as_ndjson(self):
+        """ test an ndjson Accept header streams one recipe per line """
+        sample_recipes_with_relations(self.user, 2)
+
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT='application/x-ndjson')
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual([json.loads(line) for line in lines], serializer.data)
+
+    def test_list_sparse_fields(self):
+        """ test ?fields= limits the listed fields and what is loaded """
+        sample_recipes_with_relations(self.user, 2)
+
+        for fast in (True, False):
+            with self.settings(RECIPE_API_FAST_READS=fast):
+                res = self.client.get(RECIPES_URL, {'fields': 'title,id'})
+                # count the queries of uncached responses
+                get_cache().clear()
+                queries = count_queries(
+                    self.client, RECIPES_URL + '?fields=id,title',
+                )
+                full = count_queries(self.client, RECIPES_URL)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res.data['results'], [
+                {'id': recipe.id, 'title': recipe.title}
+                for recipe in Recipe.objects.order_by('-id')
+            ])
+            # neither relation is loaded
+            self.assertEqual(queries, full - 2)
+
+    def test_detail_sparse_fields(self):
+        """ test ?fields= on a recipe detail """
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+
+        for fast in (True, False):
+            with self.settings(RECIPE_API_FAST_READS=fast):
+                res = self.client.get(
+                    detail_url(recipe.id), {'fields': 'tags,price'},
+                )
+
+            self.assertEqual(res.data, {
+                'tags': RecipeDetailSerializer(recipe).data['tags'],
+                'price': '5.00',
+            })
+
+    def test_stream_sparse_fields(self):
+        """ test streamed lists honour ?fields= """
+        sample_recipes_with_relations(self.user, 2)
+
+        res = self.client.get(RECIPES_URL, {'stream': 1, 'fields': 'id'})
+
+        body = json.loads(b''.join(res.streaming_content).decode())
+        self.assertEqual(body, [
+            {'id': recipe.id} for recipe in Recipe.objects.order_by('-id')
+        ])
+
+    def test_list_expand_relations(self):
+        """ test ?expand= nests the chosen relations in the list """
+        sample_recipes_with_relations(self.user, 2)
+        recipes = Recipe.objects.order_by('-id')
+
+        for fast in (True, False):
+            with self.settings(RECIPE_API_FAST_READS=fast):
+                tags = self.client.get(RECIPES_URL, {'expand': 'tags'})
+                both = self.client.get(
+                    RECIPES_URL, {'expand': 'ingredients,tags'},
+                )
+
+            detail = RecipeDetailSerializer(recipes, many=True).data
+            ids = RecipeSerializer(recipes, many=True).data
+            self.assertEqual(
+                [item['tags'] for item in tags.data['results']],
+                [item['tags'] for item in detail],
+            )
+            self.assertEqual(
+                [item['ingredients'] for item in tags.data['results']],
+                [item['ingredients'] for item in ids],
+            )
+            self.assertEqual(both.data['results'], detail)
+
+    def test_sparse_fields_invalid(self):
+        """ test unknown fields and expansions are rejected """
+        for params in ({'fields': 'id,owner'}, {'fields': ','},
+                       {'expand': 'user'}):
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(list(params)[0], res.data)
+
+    def test_recipes_paginated_by_cursor(self):
+        """ test walking the recipe list page by page with the cursor """
+        recipes = [sample_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        ids = [item['id'] for item in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [item['id'] for item in res.data['results']]
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(ids, sorted([r.id for r in recipes], reverse=True))
+
+    def test_ordering_paginates_past_ties(self):
+        """ test walking more tied prices than DRF's offset cutoff returns
+        every recipe once and ends """
+        Recipe.objects.bulk_create(
+            Recipe(user=self.user, title=f'Recipe {i}', time_minutes=10,
+                   price=5.00)
+            for i in range(1150)
+        )
+
+        res = self.client.get(RECIPES_URL, {'ordering': 'price',
+                                            'page_size': 100})
+        ids, pages = [item['id'] for item in res.data['results']], 1
+        while res.data['next'] and pages < 20:
+            res = self.client.get(res.data['next'])
+            ids += [item['id'] for item in res.data['results']]
+            pages += 1
+
+        self.assertEqual(pages, 12)
+        self.assertIsNone(res.data['next'])
+        self.assertEqual(ids, sorted(
+            Recipe.objects.filter(user=self.user).values_list('id', flat=True)
+        ))
+
+    def test_previous_page_of_ties(self):
+        """ test the previous link returns the page before among ties """
+        for _ in range(5):
+            sample_recipe(user=self.user, price=5.00)
+        pages = [self.client.get(RECIPES_URL, {'ordering': '-price',
+                                               'page_size': 2})]
+        for _ in range(2):
+            pages.append(self.client.get(pages[-1].data['next']))
+
+        res = self.client.get(pages[2].data['previous'])
+
+        self.assertEqual(res.data['results'], pages[1].data['results'])
+        self.assertIsNotNone(res.data['next'])
+        first = self.client.get(res.data['previous'])
+        self.assertEqual(first.data['results'], pages[0].data['results'])
+        self.assertIsNone(first.data['previous'])
+
+    def test_invalid_cursor(self):
+        """ test a cursor that doesn't fit the ordering is a 404 """
+        sample_recipe(user=self.user)
+        sample_recipe(user=self.user)
+        next_url = self.client.get(
+            RECIPES_URL, {'ordering': 'price', 'page_size': 1},
+        ).data['next']
+
+        res = self.client.get(next_url.replace('ordering=price',
+                                               'ordering=-id'))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor(self):
+        """ test cursor values of the wrong type are a 404 """
+        sample_recipe(user=self.user)
+        for ordering, position in ((None, 'p=abc'),
+                                   ('price', 'p=cheap&p=1'),
+                                   ('price', 'p=1.00&p=1.5')):
+            params = {'cursor': b64encode(position.encode()).decode()}
+            if ordering:
+                params['ordering'] = ordering
+
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        res = self.client.get(RECIPES_URL, {
+            'search': 'recipe', 'cursor': b64encode(b'p=best&p=1').decode(),
+        })
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        res = self.client.get(RECIPES_URL, {'cursor': 'bm9wZQ=='})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_filter_recipes_returns_each_recipe_once(self):
+        """ test a recipe matching several filter ids is listed once """
+        recipe = sample_recipe(user=self.user)
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        ingredient1 = sample_ingredient(user=self.user, name='Salt')
+        ingredient2 = sample_ingredient(user=self.user, name='Sugar')
+        recipe.tags.add(tag1, tag2)
+        recipe.ingredients.add(ingredient1, ingredient2)
+
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{tag1.id},{tag2.id}',
+            'ingredients': f'{ingredient1.id},{ingredient2.id}',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [recipe.id]
+        )
+
+    def test_filter_recipes_by_all_tags(self):
+        """ test tags_mode=all only returns recipes with every tag """
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        recipe1 = sample_recipe(user=self.user, title='Vegan brownies')
+        recipe1.tags.add(tag1, tag2)
+        recipe2 = sample_recipe(user=self.user, title='Lentil soup')
+        recipe2.tags.add(tag1)
+
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{tag1.id},{tag2.id}',
+            'tags_mode': 'all',
+        })
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [recipe1.id]
+        )
+
+    def test_filter_recipes_invalid_mode(self):
+        """ test an unknown filter mode is rejected """
+        tag = sample_tag(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{tag.id}',
+            'tags_mode': 'some',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_recipes_by_price_and_time(self):
+        """ test the price and time range filters """
+        cheap = sample_recipe(user=self.user, price='2.50', time_minutes=5)
+        sample_recipe(user=self.user, price='8.00', time_minutes=5)
+        sample_recipe(user=self.user, price='4.00', time_minutes=60)
+        middle = sample_recipe(user=self.user, price='4.00', time_minutes=30)
+
+        res = self.client.get(RECIPES_URL, {
+            'price_min': '2.5',
+            'price_max': '4',
+            'time_max': 30,
+        })
+
+        self.assertEqual([item['id'] for item in res.data['results']],
+                         [middle.id, cheap.id])
+
+    def test_filter_recipes_invalid_range(self):
+        """ test malformed range values are rejected """
+        res = self.client.get(RECIPES_URL, {'price_min': 'cheap'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('price_min', res.data)
+        res = self.client.get(RECIPES_URL, {'time_max': -1})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_order_recipes_by_price_and_time(self):
+        """ test ordering by price and time pages through every recipe """
+        recipes = [
+            sample_recipe(user=self.user, price=price, time_minutes=time)
+            for price, time in [('3.00', 20), ('1.00', 40), ('3.00', 10),
+                                ('2.00', 30)]
+        ]
+
+        for ordering, key in [('price', lambda r: (r.price, r.id)),
+                              ('-time_minutes', lambda r: -r.time_minutes)]:
+            ids = []
+            res = self.client.get(RECIPES_URL, {'ordering': ordering,
+                                                'page_size': 3})
+            ids += [item['id'] for item in res.data['results']]
+            res = self.client.get(res.data['next'])
+            ids += [item['id'] for item in res.data['results']]
+
+            recipes = [Recipe.objects.get(id=r.id) for r in recipes]
+            self.assertEqual(ids, [r.id for r in sorted(recipes, key=key)])
+
+    def test_order_recipes_invalid(self):
+        """ test an unknown ordering is rejected """
+        res = self.client.get(RECIPES_URL, {'ordering': 'title'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def assertPlanUsesIndex(self, query_string, fields):
+        """ assert the recipe list query of the params can use the index """
+        params = QueryDict(query_string)
+        queryset = filter_recipes_by_range(
+            Recipe.objects.filter(user=self.user), params,
+        ).order_by(*recipe_ordering(params))
+        index = next(index for index in Recipe._meta.indexes
+                     if index.fields == fields)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # make the planner show whether the index can serve the
+                # query at all, with statistics of this test's rows only
+                cursor.execute('ANALYZE core_recipe')
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        self.assertIn(index.name, plan)
+
+    def test_range_query_plans(self):
+        """ test the range filters and orderings are served by indexes """
+        # enough spread for the ranges to be selective
+        Recipe.objects.bulk_create(
+            Recipe(user=self.user, title=f'recipe {i}',
+                   price=i % 100, time_minutes=i % 120)
+            for i in range(1000)
+        )
+
+        self.assertPlanUsesIndex('price_min=2&price_max=5&ordering=price',
+                                 ['user', 'price'])
+        self.assertPlanUsesIndex('time_max=30&ordering=-time_minutes',
+                                 ['user', 'time_minutes'])
+
+    def test_search_recipes(self):
+        """ test searching titles, tag and ingredient names by rank """
+        by_ingredient = sample_recipe(user=self.user, title='Green salad')
+        by_ingredient.ingredients.add(
+            sample_ingredient(user=self.user, name='Tomatoes'),
+        )
+        by_tag = sample_recipe(user=self.user, title='Pasta')
+        by_tag.tags.add(sample_tag(user=self.user, name='Tomato'))
+        by_title = sample_recipe(user=self.user, title='Tomato soup')
+        sample_recipe(user=self.user, title='Lentil soup')
+
+        res = self.client.get(RECIPES_URL, {'search': 'tomato'})
+
+        # titles weigh more than tag names, which weigh more than
+        # ingredient names
+        self.assertEqual(
+            [item['id'] for item in res.data['results']],
+            [by_title.id, by_tag.id, by_ingredient.id],
+        )
+
+    def test_search_follows_renames(self):
+        """ test renaming a tag updates the recipes found by its name """
+        tag = sample_tag(user=self.user, name='Vegan')
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag)
+        tag.name = 'Keto'
+        tag.save()
+
+        res = self.client.get(RECIPES_URL, {'search': 'keto'})
+        self.assertEqual([item['id'] for item in res.data['results']],
+                         [recipe.id])
+        res = self.client.get(RECIPES_URL, {'search': 'vegan'})
+        self.assertEqual(res.data['results'], [])
+
+    def test_search_paginated_by_rank(self):
+        """ test every match is listed once across search pages """
+        recipes = [
+            sample_recipe(user=self.user, title='Bean stew'),
+            sample_recipe(user=self.user, title='Bean bean stew'),
+            sample_recipe(user=self.user, title='Bean chili'),
+            sample_recipe(user=self.user, title='Bean salad'),
+            sample_recipe(user=self.user, title='Bean bean bean soup'),
+        ]
+
+        ids = []
+        res = self.client.get(RECIPES_URL, {'search': 'bean', 'page_size': 2})
+        while True:
+            ids += [item['id'] for item in res.data['results']]
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(sorted(ids), sorted(r.id for r in recipes))
+        self.assertEqual(ids[0], recipes[4].id)
+
+    @override_settings(RECIPE_SEARCH={'MAX_CANDIDATES': 2000})
+    def test_search_paginated_past_rank_ties(self):
+        """ test walking more equally ranked matches than DRF's offset
+        cutoff returns every match once and ends """
+        Recipe.objects.bulk_create(
+            Recipe(user=self.user, title='Bean stew', time_minutes=10,
+                   price=5.00)
+            for _ in range(1150)
+        )
+        update_search_vectors(Recipe.objects.filter(user=self.user))
+
+        res = self.client.get(RECIPES_URL, {'search': 'bean',
+                                            'page_size': 100})
+        ids, pages = [item['id'] for item in res.data['results']], 1
+        while res.data['next'] and pages < 20:
+            res = self.client.get(res.data['next'])
+            ids += [item['id'] for item in res.data['results']]
+            pages += 1
+
+        self.assertEqual(pages, 12)
+        self.assertIsNone(res.data['next'])
+        self.assertEqual(ids, sorted(
+            Recipe.objects.filter(user=self.user).values_list('id', flat=True),
+            reverse=True,
+        ))
+
+    @override_settings(RECIPE_SEARCH={'MAX_CANDIDATES': 3,
+                                      'RECENT_WINDOW': 100})
+    def test_search_ranks_newest_matches(self):
+        """ test only the newest MAX_CANDIDATES matches are ranked """
+        sample_recipe(user=self.user, title='Bean bean bean soup')
+        newest = [
+            sample_recipe(user=self.user, title=title)
+            for title in ('Bean stew', 'Bean bean chili', 'Bean salad')
+        ]
+
+        res = self.client.get(RECIPES_URL, {'search': 'bean'})
+
+        self.assertEqual([item['id'] for item in res.data['results']],
+                         [newest[1].id, newest[2].id, newest[0].id])
+
+    @override_settings(RECIPE_SEARCH={'MAX_CANDIDATES': 20,
+                                      'RECENT_WINDOW': 3})
+    def test_search_window_of_common_words(self):
+        """ test common words are only searched in the newest recipes """
+        sample_recipe(user=self.user, title='Bean soup')
+        newest = [sample_recipe(user=self.user, title='Bean stew')
+                  for _ in range(3)]
+
+        res = self.client.get(RECIPES_URL, {'search': 'bean'})
+
+        self.assertEqual(sorted(item['id'] for item in res.data['results']),
+                         sorted(recipe.id for recipe in newest))
+
+    @override_settings(RECIPE_SEARCH={'MAX_CANDIDATES': 20,
+                                      'RECENT_WINDOW': 3})
+    def test_search_finds_rare_old_matches(self):
+        """ test rare words are found past the newest recipes """
+        old = sample_recipe(user=self.user, title='Saffron rice')
+        for _ in range(5):
+            sample_recipe(user=self.user, title='Bean stew')
+
+        res = self.client.get(RECIPES_URL, {'search': 'saffron'})
+
+        self.assertEqual([item['id'] for item in res.data['results']],
+                         [old.id])
+
     def test_create_basic_recipe(self):
         """ test creating recipe"""
         payload = {
@@ -176,6 +680,192 @@ class PrivateRecipeApiTest(TestCase):
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2, ingredients)
 
+    def test_create_recipe_ingredients_validated_in_one_query(self):
+        """ test related ids cost the same number of queries however many """
+        ingredients = [
+            sample_ingredient(user=self.user, name=f'ing {i}')
+            for i in range(40)
+        ]
+
+        def create(count):
+            payload = {
+                'title': 'stew',
+                'ingredients': [i.id for i in ingredients[:count]],
+                'tags': [],
+                'time_minutes': 20,
+                'price': 7.00,
+            }
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post(RECIPES_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(create(1), create(40))
+
+    def test_create_recipe_reports_all_missing_ids(self):
+        """ test other users' and unknown ids are rejected together """
+        user2 = get_user_model().objects.create_user(
+            'test2@eniac.com',
+            'testpass2',
+        )
+        own = sample_tag(user=self.user)
+        other = sample_tag(user=user2)
+        payload = {
+            'title': 'stew',
+            'tags': [own.id, other.id, 999999],
+            'ingredients': [],
+            'time_minutes': 20,
+            'price': 7.00,
+        }
+
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data['tags']), 2)
+        self.assertIn(str(other.id), res.data['tags'][0])
+        self.assertFalse(Recipe.objects.exists())
+
+
+class BulkRecipeApiTests(TestCase):
+    """ Tests writing many recipes in one request """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@eniac.com',
+            'testpass',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create_recipes(self):
+        """ test creating recipes with their tags and ingredients """
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        payload = [
+            {'title': 'Pancakes', 'time_minutes': 5, 'price': '3.00',
+             'tags': [tag.id], 'ingredients': [ingredient.id]},
+            {'title': 'Porridge', 'time_minutes': 3, 'price': '2.00'},
+        ]
+
+        res = self.client.post(BULK_RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+        self.assertEqual(res.data, RecipeSerializer(recipes, many=True).data)
+        pancakes = recipes.get(title='Pancakes')
+        self.assertEqual(list(pancakes.tags.all()), [tag])
+        self.assertEqual(list(pancakes.ingredients.all()), [ingredient])
+
+    def test_bulk_created_recipes_searchable(self):
+        """ test recipes written in bulk are found by their tag names """
+        tag = sample_tag(user=self.user, name='Breakfast')
+        payload = [
+            {'title': 'Pancakes', 'time_minutes': 5, 'price': '3.00',
+             'tags': [tag.id]},
+        ]
+        self.client.post(BULK_RECIPES_URL, payload, format='json')
+
+        res = self.client.get(RECIPES_URL, {'search': 'breakfast'})
+
+        self.assertEqual([item['title'] for item in res.data['results']],
+                         ['Pancakes'])
+
+    def test_bulk_create_query_count_is_constant(self):
+        """ test related ids are resolved in one query per relation """
+        tags = [sample_tag(user=self.user, name=f'tag {i}') for i in range(10)]
+
+        def payload(count):
+            return [{'title': f'recipe {i}', 'time_minutes': 5,
+                     'price': '3.00', 'tags': [tag.id for tag in tags]}
+                    for i in range(count)]
+
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(BULK_RECIPES_URL, payload(2), format='json')
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(BULK_RECIPES_URL, payload(20), format='json')
+
+        self.assertEqual(len(few), len(many))
+
+    def test_bulk_create_other_users_tag_rejected(self):
+        """ test the whole request fails if a tag is not the user's """
+        user2 = get_user_model().objects.create_user(
+            'test2@eniac.com',
+            'testpass2',
+        )
+        tag = sample_tag(user=user2)
+        payload = [
+            {'title': 'Pancakes', 'time_minutes': 5, 'price': '3.00'},
+            {'title': 'Porridge', 'time_minutes': 3, 'price': '2.00',
+             'tags': [tag.id]},
+        ]
+
+        res = self.client.post(BULK_RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update_recipes(self):
+        """ test updating fields and tags of many recipes """
+        recipe1 = sample_recipe(user=self.user, title='Pancakes')
+        recipe2 = sample_recipe(user=self.user, title='Porridge')
+        recipe2.tags.add(sample_tag(user=self.user, name='Breakfast'))
+        tag = sample_tag(user=self.user, name='Lunch')
+        payload = [
+            {'id': recipe1.id, 'price': '7.50'},
+            {'id': recipe2.id, 'title': 'Oats', 'tags': [tag.id]},
+        ]
+
+        res = self.client.patch(BULK_RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(str(recipe1.price), '7.50')
+        self.assertEqual(recipe1.title, 'Pancakes')
+        self.assertEqual(recipe2.title, 'Oats')
+        self.assertEqual(list(recipe2.tags.all()), [tag])
+
+    def test_bulk_update_other_users_recipe_rejected(self):
+        """ test recipes of other users can not be updated """
+        user2 = get_user_model().objects.create_user(
+            'test2@eniac.com',
+            'testpass2',
+        )
+        recipe = sample_recipe(user=user2)
+
+        res = self.client.patch(
+            BULK_RECIPES_URL,
+            [{'id': recipe.id, 'title': 'Mine'}],
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'sample recipe')
+
+    def test_bulk_delete_recipes(self):
+        """ test deleting many recipes of the user only """
+        user2 = get_user_model().objects.create_user(
+            'test2@eniac.com',
+            'testpass2',
+        )
+        recipe1 = sample_recipe(user=self.user)
+        recipe2 = sample_recipe(user=self.user)
+        kept = sample_recipe(user=self.user)
+        other = sample_recipe(user=user2)
+
+        res = self.client.delete(
+            BULK_RECIPES_URL,
+            [recipe1.id, recipe2.id, other.id],
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            set(Recipe.objects.values_list('id', flat=True)),
+            {kept.id, other.id},
+        )
+
 
 class RecipeImageUploadTests(TestCase):
 
@@ -189,6 +879,8 @@ class RecipeImageUploadTests(TestCase):
         self.recipe = sample_recipe(user=self.user)
 
     def tearDown(self):  # trigerred after test completes
+        if self.recipe.image:
+            delete_variants(self.recipe.image.name)
         self.recipe.image.delete()
 
     def test_upload_image_to_recipe(self):
@@ -206,6 +898,75 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    @override_settings(RECIPE_IMAGE_VARIANTS={'thumbnail': (150, 150)},
+                       RECIPE_IMAGE_ASYNC=False)
+    def test_upload_image_variants_generated(self):
+        """ test resized variants are written and exposed once ready """
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.new('RGB', (800, 400))
+            img.save(ntf, format='JPEG')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image_variants_ready)
+        thumbnail = variant_path(self.recipe.image.name, 'thumbnail')
+        with Image.open(self.recipe.image.storage.path(thumbnail)) as image:
+            self.assertEqual(image.size, (150, 75))
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertTrue(res.data['image_variants']['thumbnail'].endswith(
+            os.path.basename(thumbnail)
+        ))
+
+    def upload_image(self):
+        """ upload a new image to the recipe and return its name """
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (800, 400)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            self.client.post(image_upload_url(self.recipe.id),
+                             {'image': ntf}, format='multipart')
+        self.recipe.refresh_from_db()
+        return self.recipe.image.name
+
+    @override_settings(RECIPE_IMAGE_VARIANTS={'thumbnail': (150, 150)},
+                       RECIPE_IMAGE_ASYNC=False)
+    def test_replaced_image_variants_deleted(self):
+        """ test the variants of a replaced image are removed """
+        storage = self.recipe.image.storage
+        old = self.upload_image()
+        self.addCleanup(storage.delete, old)
+
+        new = self.upload_image()
+
+        self.assertFalse(storage.exists(variant_path(old, 'thumbnail')))
+        self.assertTrue(storage.exists(variant_path(new, 'thumbnail')))
+
+    @override_settings(RECIPE_IMAGE_VARIANTS={'thumbnail': (150, 150)},
+                       RECIPE_IMAGE_ASYNC=False)
+    def test_deleted_recipe_variants_deleted(self):
+        """ test the variants of a deleted recipe's image are removed """
+        storage = self.recipe.image.storage
+        name = self.upload_image()
+        self.assertTrue(storage.exists(variant_path(name, 'thumbnail')))
+
+        res = self.client.delete(detail_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(storage.exists(variant_path(name, 'thumbnail')))
+        # the recipe is gone, only its original is left to clean up
+        storage.delete(name)
+        self.recipe.image = None
+
+    def test_variants_hidden_until_ready(self):
+        """ test recipes without generated variants expose none """
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertIsNone(res.data['image_variants'])
+
     def test_upload_image_bad_request(self):
         """ test uploading an invalid image """
         url = image_upload_url(self.recipe.id)
@@ -231,9 +992,9 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     def test_filter_recipes_by_ingredients(self):
         """ Tests returning recipes with specific ingredients """
@@ -254,6 +1015,6 @@ class RecipeImageUploadTests(TestCase):
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
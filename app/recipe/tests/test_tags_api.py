@@ -1,3 +1,5 @@
+import json
+
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import TestCase
@@ -10,6 +12,8 @@ from core.models import Tag, Recipe
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')  # because of the usage of viewsets
+BULK_TAGS_URL = reverse('recipe:tag-bulk')
+TYPEAHEAD_URL = reverse('recipe:tag-typeahead')
 
 
 class PublicTagsApiTest(TestCase):
@@ -46,7 +50,47 @@ class PrivateTagsApiTests(TestCase):
         serializer = TagSerializer(tags, many=True)  # Many must be included
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_tags_paginated_by_cursor(self):
+        """ test walking tags with duplicate names returns each once """
+        for name in ['Vegan', 'Vegan', 'Lunch', 'Dessert', 'Vegan']:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+        names = [item['name'] for item in res.data['results']]
+        ids = [item['id'] for item in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            names += [item['name'] for item in res.data['results']]
+            ids += [item['id'] for item in res.data['results']]
+
+        self.assertEqual(names, ['Vegan'] * 3 + ['Lunch', 'Dessert'])
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_stream_tags(self):
+        """ test streaming tags returns the same items as the list """
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.client.get(TAGS_URL, {'stream': 1})
+
+        serializer = TagSerializer(Tag.objects.order_by('-name'), many=True)
+        body = b''.join(res.streaming_content).decode()
+        self.assertEqual(json.loads(body), serializer.data)
+
+    def test_stream_tags_as_ndjson(self):
+        """ test an ndjson Accept header streams one tag per line """
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.client.get(TAGS_URL, HTTP_ACCEPT='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines],
+                         ['Vegan', 'Dessert'])
 
     def test_tags_limited_to_user(self):
         """ Tests that tags returned are for authenticated user """
@@ -60,8 +104,8 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
 
     def test_create_tag_successful(self):
         """ test creating a new tag """
@@ -102,8 +146,8 @@ class PrivateTagsApiTests(TestCase):
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_retrieve_tags_assigned_unique(self):
         """Tests filtering tags by assigned returns unique items"""
@@ -126,4 +170,121 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_retrieve_tags_with_counts(self):
+        """ Test listing tags with the number of recipes using them """
+        tag1 = Tag.objects.create(user=self.user, name='Lunch')
+        tag2 = Tag.objects.create(user=self.user, name='BreakFast')
+        recipe = Recipe.objects.create(
+            title='Pancakes',
+            time_minutes=5,
+            price=3.00,
+            user=self.user,
+        )
+        recipe.tags.add(tag1)
+
+        res = self.client.get(TAGS_URL, {'with_counts': 1})
+
+        results = res.data['results']
+        self.assertEqual([(item['id'], item['recipe_count'])
+                          for item in results], [(tag1.id, 1), (tag2.id, 0)])
+        self.assertIsNotNone(results[0]['last_used'])
+        self.assertIsNone(results[1]['last_used'])
+
+    def test_tags_ordered_by_recipe_count(self):
+        """ test ?ordering=-recipe_count pages tags by kept counters """
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ['Lunch', 'Dinner', 'Vegan']]
+        for count in range(3):
+            recipe = Recipe.objects.create(
+                title='Sample',
+                time_minutes=5,
+                price=3.00,
+                user=self.user,
+            )
+            # Vegan is used by 3 recipes, Dinner by 2 and Lunch by 1
+            recipe.tags.add(*tags[count:])
+
+        res = self.client.get(TAGS_URL, {'ordering': '-recipe_count',
+                                         'page_size': 2})
+        next_page = self.client.get(res.data['next'])
+
+        self.assertEqual(
+            [item['name'] for item in res.data['results']
+             + next_page.data['results']],
+            ['Vegan', 'Dinner', 'Lunch'],
+        )
+
+    def test_unused_tags_paginated_past_ties(self):
+        """ test more unused tags than DRF's offset cutoff are each listed
+        once and the walk ends """
+        Tag.objects.bulk_create(
+            Tag(user=self.user, name=f'Tag {i}') for i in range(1100)
+        )
+        used = Tag.objects.create(user=self.user, name='Used')
+        Recipe.objects.create(
+            user=self.user, title='Sample', time_minutes=5, price=3.00,
+        ).tags.add(used)
+
+        res = self.client.get(TAGS_URL, {'ordering': '-recipe_count',
+                                         'page_size': 100})
+        ids, pages = [item['id'] for item in res.data['results']], 1
+        while res.data['next'] and pages < 20:
+            res = self.client.get(res.data['next'])
+            ids += [item['id'] for item in res.data['results']]
+            pages += 1
+
+        self.assertEqual(pages, 12)
+        self.assertIsNone(res.data['next'])
+        unused = Tag.objects.exclude(id=used.id).order_by('-id')
+        self.assertEqual(ids, [used.id, *unused.values_list('id', flat=True)])
+
+    def test_tags_invalid_ordering(self):
+        """ test an unknown ordering is rejected """
+        res = self.client.get(TAGS_URL, {'ordering': 'user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_and_update_tags(self):
+        """ test creating and renaming many tags in one request each """
+        res = self.client.post(
+            BULK_TAGS_URL,
+            [{'name': 'Vegan'}, {'name': 'Lunch'}],
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([tag['name'] for tag in res.data], ['Vegan', 'Lunch'])
+
+        tag = Tag.objects.get(user=self.user, name='Lunch')
+        res = self.client.patch(
+            BULK_TAGS_URL,
+            [{'id': tag.id, 'name': 'Dinner'}],
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Dinner')
+        self.assertEqual(tag.canonical.name, 'dinner')
+
+    def test_bulk_create_tags_invalid(self):
+        """ test no tag is created if one item is invalid """
+        res = self.client.post(
+            BULK_TAGS_URL,
+            [{'name': 'Vegan'}, {'name': ''}],
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Tag.objects.exists())
+
+    def test_typeahead_tags(self):
+        """ test the typeahead lists tags starting with q """
+        tag = Tag.objects.create(user=self.user, name='Dessert')
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TYPEAHEAD_URL, {'q': 'des'})
+
+        self.assertEqual(res.data, [{'id': tag.id, 'name': 'Dessert'}])
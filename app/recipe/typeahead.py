@@ -0,0 +1,190 @@
+"""
+Typeahead of tag and ingredient names.
+
+The typed text is normalized like core.models.Name, and the user's names
+whose canonical name starts with it come first, followed, when the pg_trgm
+extension is installed, by names similar to it found through the trigram
+index on the canonical names. Both lookups are cancelled after the
+TIMEOUT_MS of settings.RECIPE_TYPEAHEAD. Answers are kept in a per process
+LRU under the user's change version from recipe.cache, so the users typing
+the most are served from memory until one of their objects changes.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import OperationalError, connections, transaction
+from django.utils.translation import gettext as _
+from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from core.models import normalize_name
+from recipe import cache
+
+logger = logging.getLogger(__name__)
+
+# longer texts only make the trigram comparisons slower
+MAX_TEXT_LENGTH = 100
+DEFAULT_LIMIT = 10
+
+# database alias -> whether pg_trgm is installed there
+_trigram_available = {}
+
+
+def typeahead_settings():
+    """ return settings.RECIPE_TYPEAHEAD completed with the defaults """
+    options = {
+        'MAX_RESULTS': 20,
+        'TIMEOUT_MS': 50,
+        'CACHE_SIZE': 10000,
+        'CACHE_TIMEOUT': 60,
+    }
+    options.update(getattr(settings, 'RECIPE_TYPEAHEAD', {}))
+    return options
+
+
+def trigram_available(using='default'):
+    """ return whether the pg_trgm extension is installed in a database """
+    if using not in _trigram_available:
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )
+            _trigram_available[using] = cursor.fetchone() is not None
+    return _trigram_available[using]
+
+
+class PrefixCache:
+    """ thread safe LRU of typeahead answers for a user version, with a TTL """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, entry_version, value = entry
+            if entry_version != version or expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (
+                time.monotonic() + self.timeout, version, value,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+prefix_cache = PrefixCache(
+    typeahead_settings()['CACHE_SIZE'],
+    typeahead_settings()['CACHE_TIMEOUT'],
+)
+
+
+def timed_rows(queryset, using):
+    """ return the rows of a queryset, raising OperationalError once it runs
+    longer than the typeahead timeout """
+    timeout_ms = int(typeahead_settings()['TIMEOUT_MS'])
+    # the timeout must be set on the connection the query runs on, which
+    # is a replica's when the request reads from one
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            # only lasts until the end of this transaction
+            cursor.execute('SET LOCAL statement_timeout = %s', [timeout_ms])
+        return list(queryset)
+
+
+def similar_names(queryset, text, limit):
+    """ return the names most similar to the text, or none after timeout """
+    try:
+        return timed_rows(
+            queryset.filter(canonical__name__trigram_similar=text)
+            .annotate(similarity=TrigramSimilarity('canonical__name', text))
+            .order_by('-similarity', 'canonical__name', 'id')
+            .values('id', 'name')[:limit],
+            queryset.db,
+        )
+    except OperationalError:
+        # the prefix matches are still worth returning
+        logger.warning('Typeahead of %r timed out', text)
+        return []
+
+
+def matching_names(queryset, text, limit):
+    """ return names starting with the text, then names similar to it """
+    # canonical names are case folded, like the text once normalized
+    text = normalize_name(text)
+    try:
+        # the LIKE prefix is a range of the varchar_pattern_ops index Django
+        # creates for the unique core_name.name, or of the unique index
+        # itself under the C collation
+        matches = timed_rows(
+            queryset.filter(canonical__name__startswith=text)
+            .order_by('canonical__name', 'id')
+            .values('id', 'name')[:limit],
+            queryset.db,
+        )
+    except OperationalError:
+        # the trigram lookup would take longer still
+        logger.warning('Typeahead prefix of %r timed out', text)
+        return []
+    if len(matches) < limit and trigram_available(queryset.db):
+        matches += similar_names(
+            queryset.exclude(id__in=[match['id'] for match in matches]),
+            text,
+            limit - len(matches),
+        )
+    return matches
+
+
+class TypeaheadMixin:
+    """
+    Adds a typeahead action returning up to ?limit= of the user's objects
+    whose name starts with or resembles ?q=
+    """
+
+    @action(methods=['GET'], detail=False)
+    def typeahead(self, request):
+        """ return the names matching the text typed so far """
+        params = request.query_params
+        text = params.get('q', '').strip()[:MAX_TEXT_LENGTH]
+        if not text:
+            raise serializers.ValidationError(
+                {'q': [_('This field is required.')]}
+            )
+        max_results = typeahead_settings()['MAX_RESULTS']
+        limit = serializers.IntegerField(
+            min_value=1, max_value=max_results,
+        ).run_validation(params.get('limit', min(DEFAULT_LIMIT, max_results)))
+
+        queryset = self.get_queryset()
+        if not cache.enabled():
+            # the version couldn't tell when another process made changes
+            return Response(matching_names(queryset, text, limit))
+        # matching is case insensitive, so is the cache
+        key = (queryset.model._meta.label, request.user.id,
+               normalize_name(text), limit)
+        version = cache.get_version(request.user.id)
+        matches = prefix_cache.get(key, version)
+        if matches is None:
+            matches = matching_names(queryset, text, limit)
+            prefix_cache.set(key, version, matches)
+        return Response(matches)
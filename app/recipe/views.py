@@ -1,38 +1,67 @@
+from django.db.models import Prefetch
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from core.models import Tag, Ingredient, Recipe
+from core.replicas import ReplicaReadsMixin
 from recipe import serializers
-
-
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+from recipe.images import discard_variants, schedule_variants
+from recipe.bulk import BulkModelMixin
+from recipe.cache import CachedListMixin, CachedRetrieveMixin
+from recipe.fieldsets import SparseFieldsetMixin
+from recipe.filters import assigned_to_recipes, attr_ordering, \
+                           filter_mode, filter_recipes_by_range, \
+                           filter_recipes_by_related, recipe_ordering
+from recipe.pagination import RecipeAttrCursorPagination, \
+                              RecipeCursorPagination
+from recipe.readers import FastListMixin, FastRetrieveMixin, get_reader
+from recipe.search import search_recipes
+from recipe.streaming import StreamingListMixin
+from recipe.typeahead import TypeaheadMixin
+from user.authentication import CachedTokenAuthentication
+
+
+class BaseRecipeAttrViewSet(ReplicaReadsMixin,
+                            StreamingListMixin,
+                            CachedListMixin,
+                            FastListMixin,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin,
+                            BulkModelMixin,
+                            TypeaheadMixin,
+                            viewsets.GenericViewSet,
                             ):
       """Base Viewset for user owned recipe attributes"""
-      authentication_classes = [TokenAuthentication]
+      authentication_classes = [CachedTokenAuthentication]
       permission_classes = [IsAuthenticated]
+      pagination_class = RecipeAttrCursorPagination
+
+      def _query_flag(self, name):
+          """ return a 0/1 query param as a boolean """
+          # supported_values are 0 and 1 only
+          # if no value is retrieved, None is returned by get function
+          # to resolve this, we will set default get value to 0, (below here)
+          return bool(int(self.request.query_params.get(name, 0)))
 
       def get_queryset(self):  # this will be displayed on the api
           """ return objects for the current authenticated user only """
-          # supported_values for assigned only are 0 and 1 only
-          # if no assigned value is retrieved, None is returned by get function
-          # to resolve this, we will set default get value to 0, (below here)
-          assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
-          )
-          queryset = self.queryset
-          if assigned_only:
-              queryset = queryset.filter(recipe__isnull=False)
-
-          return queryset.filter(
-                user=self.request.user
-          ).order_by('-name').distinct()
-          # we set distinct to return unique tags
+          queryset = self.queryset.filter(user=self.request.user)
+          if self._query_flag('assigned_only'):
+              # a semi-join returns each attr once, so no distinct is needed
+              queryset = assigned_to_recipes(queryset, self.recipe_relation)
+
+          return queryset.order_by(*attr_ordering(self.request.query_params))
           # http://127.0.0.1:8000/api/recipe/tags/?assigned_only=1
 
+      def get_serializer_class(self):
+          """ return the serializer including recipe counts if requested """
+          if self.action == 'list' and self._query_flag('with_counts'):
+              return self.count_serializer_class
+          elif self.action == 'bulk':
+              return self.bulk_serializer_class
+          return self.serializer_class
+
       def perform_create(self, serializer):  # perform any modification to create
           """ create a new attr """
           serializer.save(user=self.request.user)
@@ -41,25 +70,42 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
 class TagViewSet(BaseRecipeAttrViewSet):
     # link is available in the resources for the docs
     """ Manage Tag in the Database """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     # list model requires queryset
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    count_serializer_class = serializers.TagCountSerializer
+    bulk_serializer_class = serializers.BulkTagSerializer
+    recipe_relation = 'tags'
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
       """ Manage ingredients in the database """
       queryset = Ingredient.objects.all()
       serializer_class = serializers.IngredientSerializer
-
-
-class RecipeViewSet(viewsets.ModelViewSet):
+      count_serializer_class = serializers.IngredientCountSerializer
+      bulk_serializer_class = serializers.BulkIngredientSerializer
+      recipe_relation = 'ingredients'
+
+
+class RecipeViewSet(ReplicaReadsMixin,
+                    SparseFieldsetMixin,
+                    StreamingListMixin,
+                    CachedListMixin,
+                    CachedRetrieveMixin,
+                    FastListMixin,
+                    FastRetrieveMixin,
+                    viewsets.ModelViewSet,
+                    BulkModelMixin,
+                    ):
     """ manage recipes in the database """
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeCursorPagination
+    expandable = ('tags', 'ingredients')
 
     # defining a common private functions
 
@@ -68,22 +114,79 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return [int(str_id) for str_id in qs.split(',')]
 
     # http://127.0.0.1:8000/api/recipe/recipes/?ingredients=3&tags=1
+    # add tags_mode=all or ingredients_mode=all to require every id
+    # price_min, price_max and time_max narrow the range, ordering=price,
+    # -price, time_minutes or -time_minutes sorts on them
+    # fields=id,title limits the output, expand=tags,ingredients nests the
+    # related objects in lists
     def get_queryset(self):
         """ retrieve the recipes for the authenticated user """
-        tags = self.request.query_params.get('tags')
+        params = self.request.query_params
+        tags = params.get('tags')
         # if no tags provided get function returns None
-        ingredients = self.request.query_params.get('ingredients')
+        ingredients = params.get('ingredients')
         queryset = self.queryset
 
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-            # this is the django syntax for filtering on foreignkey objects
+            queryset = filter_recipes_by_related(
+                queryset, 'tags', tag_ids, filter_mode(params, 'tags_mode'),
+            )
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            queryset = filter_recipes_by_related(
+                queryset,
+                'ingredients',
+                ingredient_ids,
+                filter_mode(params, 'ingredients_mode'),
+            )
+
+        queryset = filter_recipes_by_range(
+            queryset.filter(user=self.request.user), params,
+        )
+        queryset = self._shape_queryset(queryset)
+        # ?search= matches titles, tag and ingredient names, best first
+        search = params.get('search')
+        if search:
+            queryset = search_recipes(queryset, search)
+        return queryset.order_by(
+            *recipe_ordering(params, ranked=bool(search)),
+        )
 
-        return queryset.filter(user=self.request.user)
+    def _shape_queryset(self, queryset):
+        """ load the relations each action serializes in a fixed number
+        of queries instead of one query per recipe """
+        # related objects are ordered by id, as recipe.readers renders them
+        related = {
+            'tags': Tag.objects.order_by('id'),
+            'ingredients': Ingredient.objects.order_by('id'),
+        }
+        if self.action == 'upload_image':
+            # only the image is written, the relations are never rendered
+            return queryset.only(
+                'id', 'user', 'image', 'image_variants_ready',
+            )
+        if self.action not in self.sparse_actions:
+            return queryset.prefetch_related(*(
+                Prefetch(name, queryset=objects)
+                for name, objects in related.items()
+            ))
+
+        # load only what the serializer renders: ids of the relations
+        # listed by id, and only the columns of the requested fields
+        fields = self.get_serializer_fields()
+        reader = get_reader(self.get_serializer_class(), fields)
+        queryset = queryset.prefetch_related(*(
+            Prefetch(name, queryset=related[name] if nested
+                     else related[name].only('id'))
+            for name, nested in reader.relations()
+        ))
+        if fields is None:
+            return queryset
+        # the paginator reads the values the rows are ordered by
+        ordering = [name.lstrip('-')
+                    for name in recipe_ordering(self.request.query_params)]
+        return queryset.only(*reader.columns, *ordering)
 
     def get_serializer_class(self):
         """ return appoperiate serializer class """
@@ -91,6 +194,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeDetailSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'bulk':
+            return serializers.BulkRecipeSerializer
+        elif self.action == 'list':
+            return serializers.expanded_recipe_serializer(
+                self.get_expansions(),
+            )
         return self.serializer_class
 
     def perform_create(self, serializer):
@@ -103,12 +212,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """ upload an image to a recipe """
         # the object that is accessed based on the id
         recipe = self.get_object()
+        replaced = recipe.image.name
         serializer = self.get_serializer(
             recipe,
             data=request.data
         )
         if serializer.is_valid():
             serializer.save()
+            if replaced:
+                discard_variants(replaced)
+            # resizing runs in the background, the variants show up in the
+            # recipe serializers once recipe.image_variants_ready is set
+            schedule_variants(recipe)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK,
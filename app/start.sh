@@ -0,0 +1,13 @@
+#!/bin/sh
+# production start of the container: wait for the database and migrate
+# once, then hand the process over to gunicorn (gunicorn.conf.py), whose
+# workers start without touching either. Set RUN_MIGRATIONS=0 where
+# migrations run elsewhere, e.g. when starting several containers.
+set -e
+
+python manage.py wait_for_db
+if [ "${RUN_MIGRATIONS:-1}" = "1" ]; then
+    python manage.py migrate --noinput
+fi
+
+exec gunicorn app.asgi:application
@@ -37,6 +37,10 @@ class AuthTokenSerializer(serializers.Serializer):
         style={'input_type': 'password'},
         trim_whitespace=False, # django authomatically trims white space b/a
     )
+    default_error_messages = {
+        'authentication':
+            _('Unable to authenticated with provided credentials'),
+    }
 
     def validate(self, attrs):
         """ validate and authenticate the user """
@@ -49,8 +53,7 @@ class AuthTokenSerializer(serializers.Serializer):
             password=password,
         )
         if not user:
-            msg = _('Unable to authenticated with provided credentials')
-            raise serializers.ValidationError(msg, code='authentication')
+            self.fail('authentication')
             # DRF handles this error with 400 status code
 
         attrs['user'] = user
@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from user.authentication import token_cache
+from user.throttling import unknown_emails
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    """ stop authenticating with a token once it is deleted """
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_updated_user_tokens(sender, instance, created, **kwargs):
+    """ drop cached copies of a user that was updated or deactivated """
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+        'key', flat=True,
+    ):
+        token_cache.delete(key)
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_unknown_email(sender, instance, **kwargs):
+    """ let a new or renamed account log in at once """
+    unknown_emails.discard(instance.email)
@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import LocalTokenCache, token_cache
+
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """ Test authenticating requests with a cached token """
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@eniac.com',
+            password='testpass',
+            name='name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_cached(self):
+        """ test the token is only looked up on the first request """
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_deleted_token_rejected(self):
+        """ test a deleted token stops authenticating straight away """
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """ test a deactivated user stops authenticating straight away """
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_updated_user_not_stale(self):
+        """ test updating the user through the api refreshes the cache """
+        self.client.get(ME_URL)
+        self.client.patch(ME_URL, {'name': 'new name'})
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'new name')
+
+
+class LocalTokenCacheTests(TestCase):
+    """ Test the in process token cache """
+
+    def test_least_recently_used_evicted(self):
+        """ test the least recently used entry is evicted when full """
+        cache = LocalTokenCache(max_size=2, timeout=60)
+        cache.set('a', ('user a', 'a'))
+        cache.set('b', ('user b', 'b'))
+        cache.get('a')
+        cache.set('c', ('user c', 'c'))
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), ('user a', 'a'))
+
+    def test_expired_entry_dropped(self):
+        """ test entries are not returned after the timeout """
+        cache = LocalTokenCache(max_size=2, timeout=-1)
+        cache.set('a', ('user a', 'a'))
+
+        self.assertIsNone(cache.get('a'))
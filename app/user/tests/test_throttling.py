@@ -0,0 +1,142 @@
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from user.throttling import LocalBuckets, LocalNames, buckets, \
+                            unknown_emails
+
+
+TOKEN_URL = reverse('user:token')
+CREATE_USER_URL = reverse('user:create')
+
+THROTTLE = {'IP_RATE': (5, 60), 'EMAIL_RATE': (2, 60)}
+
+
+@override_settings(LOGIN_THROTTLE=THROTTLE)
+class LoginThrottleTests(TestCase):
+    """ Test throttling token logins """
+
+    def setUp(self):
+        buckets.clear()
+        unknown_emails.clear()
+        self.client = APIClient()
+        get_user_model().objects.create_user('test@eniac.com', 'testpass')
+
+    def tearDown(self):
+        buckets.clear()
+        unknown_emails.clear()
+
+    def login(self, email='test@eniac.com', password='testpass', ip=None,
+              forwarded_for=None):
+        extra = {'REMOTE_ADDR': ip} if ip else {}
+        if forwarded_for:
+            extra['HTTP_X_FORWARDED_FOR'] = forwarded_for
+        return self.client.post(
+            TOKEN_URL, {'email': email, 'password': password}, **extra
+        )
+
+    def test_email_throttled(self):
+        """ test logins for one email are throttled in any case """
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.login(email='TEST@eniac.com', ip='10.0.0.2')
+
+        res = self.login(password='wrong', ip='10.0.0.3')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '30')
+
+    def test_address_throttled(self):
+        """ test logins from one address are throttled over all emails """
+        for i in range(5):
+            self.login(email=f'user{i}@eniac.com')
+
+        res = self.login()
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.login(ip='10.0.0.2').status_code,
+                         status.HTTP_200_OK)
+
+    def test_forwarded_for_not_trusted(self):
+        """ test spoofed X-Forwarded-For headers share the peer's bucket """
+        for i in range(5):
+            self.login(email=f'user{i}@eniac.com',
+                       forwarded_for=f'203.0.113.{i}')
+
+        res = self.login(forwarded_for='203.0.113.99')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forwarded_for_behind_proxy(self):
+        """ test the address the trusted proxy saw is the one throttled """
+        behind_proxy = {**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}
+        with self.settings(REST_FRAMEWORK=behind_proxy):
+            # the client made up the first address, the proxy added the last
+            for i in range(5):
+                self.login(email=f'user{i}@eniac.com', ip='10.0.0.1',
+                           forwarded_for=f'198.51.100.{i}, 203.0.113.7')
+
+            res = self.login(ip='10.0.0.1',
+                             forwarded_for='198.51.100.99, 203.0.113.7')
+            other = self.login(ip='10.0.0.1',
+                               forwarded_for='198.51.100.99, 203.0.113.8')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(other.status_code, status.HTTP_200_OK)
+
+    def test_unknown_email_not_looked_up(self):
+        """ test an email with no account is rejected without a lookup """
+        first = self.login(email='nobody@eniac.com')
+
+        with patch('user.serializers.authenticate') as authenticate:
+            with self.assertNumQueries(0):
+                again = self.login(email='nobody@eniac.com')
+
+        authenticate.assert_not_called()
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(again.data, first.data)
+
+    def test_wrong_password_not_cached(self):
+        """ test a wrong password doesn't block the account """
+        self.login(password='wrong')
+
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+
+    def test_signup_forgets_unknown_email(self):
+        """ test an account can log in right after signing up """
+        self.login(email='new@eniac.com')
+        self.client.post(CREATE_USER_URL, {
+            'email': 'new@eniac.com',
+            'password': 'newpass',
+            'name': 'New',
+        })
+
+        res = self.login(email='new@eniac.com', password='newpass')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class LocalStoreTests(TestCase):
+
+    def test_bucket_refills(self):
+        """ test a bucket refills evenly over its period """
+        store = LocalBuckets(max_size=10)
+        with patch('user.throttling.time.monotonic', return_value=100):
+            self.assertEqual(store.take('key', (2, 60)), 0)
+            self.assertEqual(store.take('key', (2, 60)), 0)
+            self.assertEqual(store.take('key', (2, 60)), 30)
+        with patch('user.throttling.time.monotonic', return_value=130):
+            self.assertEqual(store.take('key', (2, 60)), 0)
+
+    def test_names_expire(self):
+        """ test names are forgotten after the timeout """
+        names = LocalNames(max_size=10, timeout=30)
+        with patch('user.throttling.time.monotonic', return_value=100):
+            names.add('nobody@eniac.com')
+            self.assertIn('nobody@eniac.com', names)
+        with patch('user.throttling.time.monotonic', return_value=131):
+            self.assertNotIn('nobody@eniac.com', names)
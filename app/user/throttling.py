@@ -0,0 +1,203 @@
+"""
+Login throttling.
+
+Token logins take a token from two buckets, one for the client address
+and one for the email logged in with, and are turned away with a 429 once
+either is empty. Emails that turned out to have no account are remembered
+for a short while, so repeated attempts with them are answered without
+looking them up or hashing anything.
+
+Both are kept in process memory, or in one of the django caches when
+settings.LOGIN_THROTTLE['CACHE_ALIAS'] is set, to share them between
+processes.
+
+The client address is the one DRF derives with REST_FRAMEWORK's
+NUM_PROXIES, X-Forwarded-For is only read past the trusted proxies.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+
+def throttle_settings():
+    options = getattr(settings, 'LOGIN_THROTTLE', {})
+    return {
+        'IP_RATE': options.get('IP_RATE', (20, 60)),
+        'EMAIL_RATE': options.get('EMAIL_RATE', (5, 60)),
+        'UNKNOWN_EMAIL_TIMEOUT': options.get('UNKNOWN_EMAIL_TIMEOUT', 30),
+        'MAX_SIZE': options.get('MAX_SIZE', 100000),
+        'CACHE_ALIAS': options.get('CACHE_ALIAS'),
+    }
+
+
+def _refill(state, rate, now):
+    """ return the tokens of a bucket state, topped up to now """
+    capacity, period = rate
+    if state is None:
+        return capacity
+    tokens, updated = state
+    return min(capacity, tokens + (now - updated) * capacity / period)
+
+
+def _take(state, rate, now):
+    """ return the new state of a bucket and the seconds to wait before
+    taking from it, 0 when a token was taken """
+    capacity, period = rate
+    tokens = _refill(state, rate, now)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) * period / capacity
+
+
+class LocalBuckets:
+    """ thread safe token buckets, dropping the least recently used """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate):
+        """ take a token from the bucket of key, return the seconds to
+        wait for one, 0 when one was taken """
+        now = time.monotonic()
+        with self._lock:
+            state, wait = _take(self._states.get(key), rate, now)
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+
+class SharedBuckets:
+    """ token buckets stored in one of the configured django caches """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, rate):
+        # concurrent logins may both take the last token, a bucket only
+        # has to slow bursts down, not count them exactly
+        now = time.time()
+        key = 'login-bucket:' + hashlib.sha256(key.encode()).hexdigest()
+        state, wait = _take(self.cache.get(key), rate, now)
+        self.cache.set(key, state, rate[1])
+        return wait
+
+    def clear(self):
+        self.cache.clear()
+
+
+class LocalNames:
+    """ thread safe set of names that are forgotten after a timeout """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._expiries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        with self._lock:
+            expires = self._expiries.get(name)
+            if expires is not None and expires < time.monotonic():
+                del self._expiries[name]
+                expires = None
+        return expires is not None
+
+    def add(self, name):
+        with self._lock:
+            self._expiries[name] = time.monotonic() + self.timeout
+            self._expiries.move_to_end(name)
+            while len(self._expiries) > self.max_size:
+                self._expiries.popitem(last=False)
+
+    def discard(self, name):
+        with self._lock:
+            self._expiries.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._expiries.clear()
+
+
+class SharedNames:
+    """ set of names kept in one of the configured django caches """
+
+    def __init__(self, alias, timeout):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def _key(self, name):
+        # emails aren't valid memcached keys, and shouldn't be readable
+        return 'unknown-email:' + hashlib.sha256(name.encode()).hexdigest()
+
+    def __contains__(self, name):
+        return self.cache.get(self._key(name), False)
+
+    def add(self, name):
+        self.cache.set(self._key(name), True, self.timeout)
+
+    def discard(self, name):
+        self.cache.delete(self._key(name))
+
+    def clear(self):
+        self.cache.clear()
+
+
+def build_buckets():
+    """ create the bucket store configured in settings.LOGIN_THROTTLE """
+    options = throttle_settings()
+    if options['CACHE_ALIAS']:
+        return SharedBuckets(options['CACHE_ALIAS'])
+    return LocalBuckets(options['MAX_SIZE'])
+
+
+def build_unknown_emails():
+    """ create the set of unknown emails configured in LOGIN_THROTTLE """
+    options = throttle_settings()
+    if options['CACHE_ALIAS']:
+        return SharedNames(
+            options['CACHE_ALIAS'], options['UNKNOWN_EMAIL_TIMEOUT'],
+        )
+    return LocalNames(options['MAX_SIZE'], options['UNKNOWN_EMAIL_TIMEOUT'])
+
+
+buckets = build_buckets()
+unknown_emails = build_unknown_emails()
+
+
+def login_email(request):
+    """ return the email a login request is for, if any """
+    get = getattr(request.data, 'get', None)
+    email = get('email') if get else None
+    return email if isinstance(email, str) and email else None
+
+
+class LoginRateThrottle(BaseThrottle):
+    """ throttle logins by client address and by email """
+
+    def allow_request(self, request, view):
+        options = throttle_settings()
+        waits = [buckets.take('ip:' + self.get_ident(request),
+                              options['IP_RATE'])]
+        email = login_email(request)
+        if email:
+            # the case of an email can't get around its bucket
+            waits.append(buckets.take('email:' + email.casefold(),
+                                      options['EMAIL_RATE']))
+        self._wait = max(waits)
+        return not self._wait
+
+    def wait(self):
+        return self._wait
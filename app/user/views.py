@@ -1,7 +1,12 @@
+from django.contrib.auth import get_user_model
 from .serializers import UserSerializer, AuthTokenSerializer
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import ValidationError
 from rest_framework.settings import api_settings
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
+from .authentication import CachedTokenAuthentication
+from .throttling import LoginRateThrottle, login_email, unknown_emails
+from core.replicas import ReplicaReadsMixin
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -14,12 +19,32 @@ class CreateTokenView(ObtainAuthToken):
     """ Create a new auth token for user """
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    throttle_classes = (LoginRateThrottle,)
 
+    def post(self, request, *args, **kwargs):
+        # emails found to have no account fail the same way as a wrong
+        # password would, without the lookup and the hashing
+        email = login_email(request)
+        if email and email in unknown_emails:
+            msg = AuthTokenSerializer.default_error_messages['authentication']
+            raise ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [msg]},
+                code='authentication',
+            )
+        try:
+            return super().post(request, *args, **kwargs)
+        except ValidationError:
+            if email and not get_user_model().objects.filter(
+                email=email,
+            ).exists():
+                unknown_emails.add(email)
+            raise
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+
+class ManageUserView(ReplicaReadsMixin, generics.RetrieveUpdateAPIView):
     """ Manage the authenticated user """
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self): # override the get object function